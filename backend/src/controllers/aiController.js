@@ -2,16 +2,21 @@ const axios = require('axios');
 const Policy = require('../models/policyModel');
 const logger = require('../utils/logger');
 
+// Python model server (ml-models/deployment/model_server.py); docker-compose points this at its service
+const ML_SERVER_URL = process.env.ML_SERVER_URL || 'http://127.0.0.1:5000';
+
 exports.sendToAIDecisionEngine = async metrics => {
   try {
-    const response = await axios.post('http://127.0.0.1:5000/predict', metrics);
+    const response = await axios.post(`${ML_SERVER_URL}/predict`, metrics);
     const data = response.data;
 
     await Policy.create({
       timestamp: new Date(),
       ...metrics,
       predictedScale: data.scale_factor,
-      predictedRateLimit: data.rate_limit
+      predictedRateLimit: data.rate_limit,
+      // Absolute fleet size from the capacity planner (--capacity); scale_factor is relative and one-shot
+      predictedReplicas: data.replicas
     });
 
     logger.info(`🧠 AI Policy Received: ${JSON.stringify(data)}`);
@@ -20,3 +25,76 @@ exports.sendToAIDecisionEngine = async metrics => {
     logger.error(`AI Engine Error: ${err.message}`);
   }
 };
+
+// Packed float32 batch format shared with ml-models/deployment/columnar.py (little-endian)
+const REQUEST_MAGIC = 'LBF1';
+const RESPONSE_MAGIC = 'LBR1';
+
+const encodeRoutingBatch = (rows, columns) => {
+  const header = Buffer.from(JSON.stringify(columns), 'utf8');
+  const headerBytes = (header.length + 3) & ~3;
+  const buffer = Buffer.alloc(16 + headerBytes + rows.length * columns.length * 4, 0x20);
+
+  buffer.write(REQUEST_MAGIC, 0, 'ascii');
+  buffer.writeUInt32LE(rows.length, 4);
+  buffer.writeUInt32LE(columns.length, 8);
+  buffer.writeUInt32LE(header.length, 12);
+  header.copy(buffer, 16);
+
+  let offset = 16 + headerBytes;
+  rows.forEach(row => {
+    columns.forEach(column => {
+      buffer.writeFloatLE(Number(row[column]) || 0, offset);
+      offset += 4;
+    });
+  });
+  return buffer;
+};
+
+const decodeRoutingBatch = data => {
+  const buffer = Buffer.from(data);
+  if (buffer.toString('ascii', 0, 4) !== RESPONSE_MAGIC) {
+    throw new Error('Unexpected routing batch response');
+  }
+  const rowCount = buffer.readUInt32LE(4);
+  const classCount = buffer.readUInt32LE(8);
+
+  // Class labels come first; probabilities follow the same order
+  let offset = 12 + classCount * 4;
+  const serverIds = [];
+  for (let i = 0; i < rowCount; i += 1, offset += 4) {
+    serverIds.push(buffer.readInt32LE(offset));
+  }
+  return serverIds.map(serverId => {
+    const probabilities = [];
+    for (let i = 0; i < classCount; i += 1, offset += 4) {
+      probabilities.push(buffer.readFloatLE(offset));
+    }
+    return {
+      server_id: serverId,
+      server: `server_${serverId}`,
+      confidence: Math.max(...probabilities),
+      probabilities
+    };
+  });
+};
+
+exports.encodeRoutingBatch = encodeRoutingBatch;
+exports.decodeRoutingBatch = decodeRoutingBatch;
+
+// Routes many feature rows in one request without JSON encoding on either side
+exports.sendRoutingBatch = async (rows, columns, model = 'random-forest') => {
+  try {
+    const response = await axios.post(
+      `${ML_SERVER_URL}/batch-predict/columnar?model=${encodeURIComponent(model)}`,
+      encodeRoutingBatch(rows, columns),
+      {
+        headers: { 'Content-Type': 'application/x-float32-matrix' },
+        responseType: 'arraybuffer'
+      }
+    );
+    return decodeRoutingBatch(response.data);
+  } catch (err) {
+    logger.error(`AI Routing Batch Error: ${err.message}`);
+  }
+};
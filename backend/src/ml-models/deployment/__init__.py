@@ -0,0 +1,3 @@
+"""
+Model serving components (model server, batching)
+"""
@@ -0,0 +1,209 @@
+"""
+Micro-Batching for Model Serving
+Gathers concurrent prediction requests into small batches for one vectorized model call
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+class QueueFullError(Exception):
+    """Raised when a batcher's request queue is at capacity"""
+
+class LatencyTracker:
+    """Rolling latency samples with percentile summaries"""
+
+    def __init__(self, window: int = 2048):
+        """
+        Initialize tracker
+
+        Args:
+            window: Number of most recent samples kept for percentiles
+        """
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Record one latency sample (seconds)"""
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self) -> Dict:
+        """Get count, mean and p50/p95/p99/max in milliseconds"""
+        with self._lock:
+            samples = sorted(self.samples)
+            count, total = self.count, self.total
+
+        if not samples:
+            return {'count': count}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+
+        return {
+            'count': count,
+            'mean_ms': total / count * 1000,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': samples[-1] * 1000
+        }
+
+class MicroBatcher:
+    """
+    Collects requests from many threads and runs them through one batch function
+
+    A worker thread takes the first queued request, then keeps gathering until the
+    batch is full or max_wait_ms has passed, and calls batch_fn once for the group.
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 64, max_wait_ms: float = 2.0, max_queue_size: int = 1024,
+                 observer: Callable[[int, List[float], float, bool], None] = None):
+        """
+        Initialize batcher
+
+        Args:
+            name: Batcher name (for stats)
+            batch_fn: Function mapping a list of payloads to a list of results (same order)
+            max_batch_size: Maximum requests per batch
+            max_wait_ms: Time budget for filling a batch after the first request arrives
+            max_queue_size: Pending requests allowed before submit() rejects
+            observer: Called after each batch with (size, queue waits, inference seconds, failed),
+                e.g. ServingMetrics.batch_observer
+        """
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.observer = observer
+
+        self.queue_wait = LatencyTracker()
+        self.inference_time = LatencyTracker()
+        self.batch_sizes = deque(maxlen=2048)
+        self.total_batches = 0
+        self.rejected = 0
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 1.0):
+        """Stop the worker thread"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, payload: Any) -> Future:
+        """
+        Queue one request
+
+        Returns:
+            Future resolved with this payload's result
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        future = Future()
+        try:
+            self.queue.put_nowait((payload, future, time.perf_counter()))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name} queue is full ({self.queue.maxsize} pending)")
+        return future
+
+    def predict(self, payload: Any, timeout: float = None) -> Any:
+        """Submit one request and wait for its result"""
+        return self.submit(payload).result(timeout)
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more within the time budget"""
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Budget spent: still take whatever is already waiting
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        """Worker loop"""
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            waits = [start - enqueued for _, _, enqueued in batch]
+            for wait in waits:
+                self.queue_wait.record(wait)
+
+            payloads = [payload for payload, _, _ in batch]
+            failed = True
+            try:
+                results = self.batch_fn(payloads)
+                failed = False
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                self.inference_time.record(elapsed)
+                self.batch_sizes.append(len(batch))
+                self.total_batches += 1
+                if self.observer is not None:
+                    self.observer(len(batch), waits, elapsed, failed)
+
+            if len(results) != len(batch):
+                error = RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} requests")
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        """Get batcher metrics"""
+        sizes = list(self.batch_sizes)
+        return {
+            'name': self.name,
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'rejected': self.rejected,
+            'total_batches': self.total_batches,
+            'avg_batch_size': sum(sizes) / len(sizes) if sizes else 0,
+            'max_batch_size': max(sizes) if sizes else 0,
+            'queue_wait': self.queue_wait.summary(),
+            'inference': self.inference_time.summary()
+        }
@@ -0,0 +1,474 @@
+"""
+Capacity Planner
+Turns load forecasts, measured per-replica capacity and a target utilization into replica counts and rate limits
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+# Policy defaults (matches the Express limiter in app.js: 1000 requests per window)
+DEFAULT_RATE_LIMIT = 1000
+TARGET_UTILIZATION = 0.7
+MIN_SCALE_FACTOR = 0.5
+MAX_SCALE_FACTOR = 4.0
+
+CAPACITY_FILE = os.path.join(ML_ROOT, 'data', 'capacity.json')
+RESULTS_DIR = os.path.join(ML_ROOT, 'evaluation', 'results')
+
+def simulate_latencies(service_times: np.ndarray, rate: float, seed: int = 42) -> np.ndarray:
+    """
+    Latency of each request on one FIFO replica under Poisson arrivals
+
+    Departures follow D_n = max(D_{n-1}, A_n) + S_n, which unrolls to
+    C_n + max_{k<=n}(A_k - C_{k-1}) with C the cumulative service time, so the
+    whole queue is simulated with two cumulative scans instead of a Python loop.
+
+    Args:
+        service_times: Service time per request (ms), in arrival order
+        rate: Arrivals per ms
+        seed: Random seed for arrival times
+
+    Returns:
+        Time in system per request (ms)
+    """
+    arrivals = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, len(service_times)))
+    completed = np.cumsum(service_times)
+    departures = completed + np.maximum.accumulate(arrivals - (completed - service_times))
+    return departures - arrivals
+
+def measure_capacity(service_times: Sequence[float], latency_slo_ms: float, percentile: float = 95,
+                     seed: int = 42) -> Dict:
+    """
+    Highest request rate one replica sustains within a latency objective
+
+    Replays the observed service times through a single-replica queue at
+    increasing utilization (bisection) and keeps the highest rate whose latency
+    percentile still meets the objective.
+
+    Args:
+        service_times: Observed service times (ms)
+        latency_slo_ms: Latency objective for the percentile
+        percentile: Latency percentile the objective applies to
+        seed: Random seed for arrival times
+
+    Returns:
+        Dict with capacity_per_replica (requests per minute) and the measurement details
+    """
+    service_times = np.asarray(service_times, dtype=np.float64)
+    service_times = service_times[np.isfinite(service_times) & (service_times >= 0)]
+    if len(service_times) == 0:
+        raise ValueError("No service times to measure capacity from")
+    mean_service = float(service_times.mean())
+
+    def latency_at(utilization):
+        return float(np.percentile(simulate_latencies(service_times, utilization / mean_service, seed), percentile))
+
+    low, high = 0.0, 0.999
+    if latency_at(0.01) > latency_slo_ms:
+        raise ValueError(f"p{percentile:g} latency exceeds {latency_slo_ms} ms even on an idle replica")
+    for _ in range(30):
+        mid = (low + high) / 2
+        if latency_at(mid) <= latency_slo_ms:
+            low = mid
+        else:
+            high = mid
+
+    return {
+        'capacity_per_replica': low / mean_service * 60_000,
+        'utilization': low,
+        'latency_slo_ms': latency_slo_ms,
+        'percentile': percentile,
+        'latency_at_capacity_ms': latency_at(low),
+        'mean_service_ms': mean_service,
+        'requests': int(len(service_times))
+    }
+
+def current_demand(metrics: Dict, sequence_features: Sequence[str] = ('request_count',)) -> Optional[float]:
+    """
+    Requests in the newest window of a /predict payload
+
+    Uses metrics['request_count'] if given, else the last step of metrics['sequence']
+    (a plain count, or a row in sequence_features order).
+    """
+    if metrics.get('request_count') is not None:
+        return float(metrics['request_count'])
+    sequence = metrics.get('sequence')
+    if not sequence:
+        return None
+    step = sequence[-1]
+    if isinstance(step, (list, tuple)):
+        column = list(sequence_features).index('request_count') if 'request_count' in sequence_features else 0
+        return float(step[column])
+    return float(step)
+
+class CapacityPlanner:
+    """
+    Replica count and rate limit from a demand forecast, with hysteresis and cooldowns
+
+    Capacity is planned for the higher of current demand and the forecast peak.
+    Scaling up takes the smallest fleet that keeps utilization at or below
+    target_utilization. Scaling down needs the smaller fleet to stay at or below
+    target_utilization - hysteresis, so load hovering near a boundary doesn't
+    flip the fleet back and forth. Scale-ups wait scale_up_cooldown_s after the
+    last change and scale-downs the longer scale_down_cooldown_s. One decision
+    changes the fleet by at most MIN_SCALE_FACTOR-MAX_SCALE_FACTOR times;
+    larger changes take several decisions.
+
+    The rate limit stays at base_rate_limit while the planned fleet can serve
+    the load, shrinks in proportion when demand exceeds what max_replicas can
+    serve, and is cut by anomaly_rate_factor during anomalies. Tightening is
+    immediate; relaxing waits scale_down_cooldown_s after the last tightening.
+
+    Decisions are assumed to be applied: the planner's replicas become the
+    current fleet for the next call.
+    """
+
+    def __init__(self, capacity_per_replica: float, target_utilization: float = TARGET_UTILIZATION,
+                 min_replicas: int = 1, max_replicas: int = 10, replicas: Optional[int] = None,
+                 hysteresis: float = 0.1, scale_up_cooldown_s: float = 60.0, scale_down_cooldown_s: float = 300.0,
+                 base_rate_limit: int = DEFAULT_RATE_LIMIT, anomaly_rate_factor: float = 0.5,
+                 min_rate_limit: int = 10):
+        """
+        Initialize planner
+
+        Args:
+            capacity_per_replica: Requests per minute one replica serves (measure_capacity)
+            target_utilization: Planned load / capacity
+            min_replicas: Smallest fleet
+            max_replicas: Largest fleet
+            replicas: Current fleet (default: min_replicas)
+            hysteresis: Utilization margin below the target required to scale down
+            scale_up_cooldown_s: Seconds after a change before scaling up again
+            scale_down_cooldown_s: Seconds after a change before scaling down (and before relaxing the rate limit)
+            base_rate_limit: Rate limit when capacity is sufficient (requests per limiter window)
+            anomaly_rate_factor: Multiplier applied to the rate limit during anomalies
+            min_rate_limit: Lowest rate limit recommended
+        """
+        if capacity_per_replica <= 0:
+            raise ValueError("capacity_per_replica must be positive")
+        if not 0 <= hysteresis < target_utilization <= 1:
+            raise ValueError("Expected 0 <= hysteresis < target_utilization <= 1")
+        if not 1 <= min_replicas <= max_replicas:
+            raise ValueError("Expected 1 <= min_replicas <= max_replicas")
+        self.capacity_per_replica = capacity_per_replica
+        self.target_utilization = target_utilization
+        self.min_replicas = min_replicas
+        self.max_replicas = max_replicas
+        self.hysteresis = hysteresis
+        self.scale_up_cooldown_s = scale_up_cooldown_s
+        self.scale_down_cooldown_s = scale_down_cooldown_s
+        self.base_rate_limit = base_rate_limit
+        self.anomaly_rate_factor = anomaly_rate_factor
+        self.min_rate_limit = min_rate_limit
+
+        self.replicas = self._clip(replicas if replicas is not None else min_replicas)
+        self.rate_limit = base_rate_limit
+        self.last_scaled_at = None
+        self.last_tightened_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str = CAPACITY_FILE, **overrides) -> 'CapacityPlanner':
+        """Planner for the capacity measured by `capacity_planner.py measure` (overrides: __init__ arguments)"""
+        with open(path, 'r') as f:
+            measured = json.load(f)
+        return cls(overrides.pop('capacity_per_replica', None) or measured['capacity_per_replica'], **overrides)
+
+    def _clip(self, replicas: int) -> int:
+        return min(self.max_replicas, max(self.min_replicas, int(replicas)))
+
+    @staticmethod
+    def _step(target: int, previous: int) -> int:
+        """Move toward target by at most the stateless policy's factor range per decision"""
+        return min(math.floor(previous * MAX_SCALE_FACTOR), max(math.ceil(previous * MIN_SCALE_FACTOR), target))
+
+    def _fleet_for(self, load: float, utilization: float) -> int:
+        """Smallest fleet serving load at or below the given utilization"""
+        return self._clip(math.ceil(load / (self.capacity_per_replica * utilization)))
+
+    def _elapsed(self, since: Optional[float], now: float) -> float:
+        return math.inf if since is None else now - since
+
+    def plan(self, demand: float, forecast_peak: Optional[float] = None, anomaly: bool = False,
+             now: Optional[float] = None) -> Dict:
+        """
+        Decide the fleet size and rate limit for the next interval
+
+        Args:
+            demand: Requests per minute now
+            forecast_peak: Highest requests per minute expected within the forecast horizon
+            anomaly: Whether the current window is anomalous
+            now: Decision time in seconds (default: time.time(); replays pass trace time)
+
+        Returns:
+            Dict with scale_factor (new / previous replicas for this decision only;
+            1.0 once applied), rate_limit, replicas (the absolute target to act on),
+            utilization (planned load / new capacity) and reason (scale_up, scale_down,
+            cooldown or hold). One decision changes the fleet by at most
+            [MIN_SCALE_FACTOR, MAX_SCALE_FACTOR], so replicas always equals the previous
+            fleet times scale_factor (up to rounding) and a consumer following
+            scale_factor stays in step with the planner; larger changes take several
+            decisions, each behind the cooldown.
+        """
+        now = time.time() if now is None else now
+        load = max(float(demand), float(forecast_peak or 0.0), 0.0)
+
+        with self._lock:
+            previous = self.replicas
+            up = self._fleet_for(load, self.target_utilization)
+            down = self._fleet_for(load, self.target_utilization - self.hysteresis)
+            since_change = self._elapsed(self.last_scaled_at, now)
+
+            reason = 'hold'
+            if up > previous:
+                if since_change >= self.scale_up_cooldown_s:
+                    self.replicas, reason = self._step(up, previous), 'scale_up'
+                else:
+                    reason = 'cooldown'
+            elif down < previous:
+                if since_change >= self.scale_down_cooldown_s:
+                    self.replicas, reason = self._step(down, previous), 'scale_down'
+                else:
+                    reason = 'cooldown'
+            if self.replicas != previous:
+                self.last_scaled_at = now
+
+            capacity = self.replicas * self.capacity_per_replica
+            rate_limit = self.base_rate_limit * min(1.0, capacity / load) if load > 0 else self.base_rate_limit
+            if anomaly:
+                rate_limit *= self.anomaly_rate_factor
+            rate_limit = max(self.min_rate_limit, int(rate_limit))
+            if rate_limit < self.rate_limit:
+                self.rate_limit, self.last_tightened_at = rate_limit, now
+            elif rate_limit > self.rate_limit and \
+                    self._elapsed(self.last_tightened_at, now) >= self.scale_down_cooldown_s:
+                self.rate_limit = rate_limit
+
+            return {
+                # _step keeps this within the stateless policy's range
+                'scale_factor': round(self.replicas / previous, 2),
+                'rate_limit': self.rate_limit,
+                'replicas': self.replicas,
+                'utilization': round(load / capacity, 4),
+                'reason': reason
+            }
+
+    def recommend(self, metrics: Dict, forecast: Optional[Dict] = None, anomaly: Optional[Dict] = None,
+                  sequence_features: Sequence[str] = ('request_count',), now: Optional[float] = None) -> Dict:
+        """
+        plan() for a /predict payload and its model outputs
+
+        Args:
+            metrics: Dict sent by the backend (request_count or sequence)
+            forecast: Forecast result for metrics['sequence'] (optional)
+            anomaly: Anomaly result for the current window (optional)
+            sequence_features: LSTM input columns, to find request_count in sequence rows
+            now: See plan()
+        """
+        demand = current_demand(metrics, sequence_features)
+        if demand is None:
+            raise ValueError("Capacity planning needs 'request_count' or a 'sequence' of recent windows")
+        peak = None
+        if forecast is not None:
+            peak = forecast.get('peak_request_count', forecast['predicted_request_count'])
+        return self.plan(demand, peak, anomaly=anomaly is not None and anomaly['is_anomaly'], now=now)
+
+    def state(self) -> Dict:
+        """Current fleet, rate limit and settings"""
+        with self._lock:
+            return {
+                'replicas': self.replicas,
+                'rate_limit': self.rate_limit,
+                'last_scaled_at': self.last_scaled_at,
+                'capacity_per_replica': self.capacity_per_replica,
+                'target_utilization': self.target_utilization,
+                'hysteresis': self.hysteresis,
+                'min_replicas': self.min_replicas,
+                'max_replicas': self.max_replicas
+            }
+
+def replay(planner: CapacityPlanner, demand: Sequence[float], forecast_peaks: Optional[Sequence[float]] = None,
+           anomalies: Optional[Sequence[bool]] = None, interval_s: float = 60.0) -> Dict:
+    """
+    Run a planner over a recorded trace, one decision per window
+
+    The fleet chosen at window t serves the demand of window t+1, so
+    under-provisioning counts windows whose actual demand exceeded the capacity
+    decided a window earlier.
+
+    Args:
+        planner: Planner in its starting state (it is advanced by the replay)
+        demand: Requests per window, oldest first
+        forecast_peaks: Forecast peak per window (None = plan on current demand only)
+        anomalies: Anomaly flag per window
+        interval_s: Window length
+
+    Returns:
+        Dict of summary statistics and the per-window replicas and rate limits
+    """
+    demand = np.asarray(demand, dtype=np.float64)
+    n = len(demand)
+    replicas = np.empty(n, dtype=np.int64)
+    rate_limits = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        decision = planner.plan(
+            demand[i],
+            None if forecast_peaks is None else forecast_peaks[i],
+            anomaly=bool(anomalies[i]) if anomalies is not None else False,
+            now=i * interval_s
+        )
+        replicas[i], rate_limits[i] = decision['replicas'], decision['rate_limit']
+
+    changes = np.sign(np.diff(replicas))
+    directions = changes[changes != 0]
+    served = replicas[:-1] * planner.capacity_per_replica
+    utilization = demand[1:] / served
+    return {
+        'windows': n,
+        'scaling_actions': int(len(directions)),
+        # A scale-up right after a scale-down (or the reverse)
+        'reversals': int(np.count_nonzero(directions[1:] != directions[:-1])),
+        'underprovisioned_windows': int(np.count_nonzero(utilization > 1.0)),
+        'over_target_windows': int(np.count_nonzero(utilization > planner.target_utilization)),
+        'throttled_windows': int(np.count_nonzero(rate_limits < planner.base_rate_limit)),
+        'mean_replicas': float(replicas.mean()),
+        'max_replicas': int(replicas.max()),
+        'mean_utilization': float(utilization.mean()) if len(utilization) else 0.0,
+        'replicas': replicas.tolist(),
+        'rate_limits': rate_limits.tolist()
+    }
+
+def forecast_peaks(df, method: str = 'naive', horizon: int = 10) -> np.ndarray:
+    """
+    Forecast peak per window of a feature frame
+
+    Args:
+        df: Feature frame in time order (request_count, plus the LSTM's sequence features)
+        method: 'naive' (peak of the last horizon windows), 'lstm' (the trained
+            LSTM's forecast, NaN until seq_length windows were seen) or 'oracle'
+            (the actual peak of the next horizon windows; an upper bound)
+        horizon: Windows covered by the naive and oracle peaks
+
+    Returns:
+        Float array aligned with df
+    """
+    import pandas as pd
+
+    counts = df['request_count'].astype(float)
+    if method == 'naive':
+        return counts.rolling(horizon, min_periods=1).max().to_numpy()
+    if method == 'oracle':
+        return counts[::-1].rolling(horizon, min_periods=1).max()[::-1].shift(-1).fillna(counts).to_numpy()
+
+    from utils.module_loader import load_module
+    lstm_predict = load_module('models/5_lstm/predict.py')
+    model_dir = os.path.join(ML_ROOT, 'models', '5_lstm')
+    model, scaler, seq_length = lstm_predict.load_model(model_dir)
+    columns = lstm_predict.load_sequence_features(model_dir)
+    values = df[columns].astype(float).to_numpy()
+    windows = [values[i - seq_length + 1:i + 1] for i in range(seq_length - 1, len(values))]
+    peaks = np.full(len(values), np.nan)
+    if windows:
+        peaks[seq_length - 1:] = lstm_predict.predict_batch(model, scaler, windows, seq_length).max(axis=1)
+    return pd.Series(peaks).fillna(counts).to_numpy()
+
+def main():
+    """Measure per-replica capacity or replay a trace through the planner"""
+    parser = argparse.ArgumentParser(description='Plan replicas and rate limits from load forecasts')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    measure = commands.add_parser('measure', help='Measure one replica\'s capacity from observed service times')
+    measure.add_argument('--source', choices=['logs', 'db'], default='logs',
+                         help="parsed_logs.csv (bytes / 1000 as service time) or the backend's api_requests table")
+    measure.add_argument('--input', help='Input file (default: parsed_logs.csv or backend/data/monitoring.db)')
+    measure.add_argument('--slo-ms', type=float, default=200.0, help='Latency objective')
+    measure.add_argument('--percentile', type=float, default=95.0, help='Latency percentile the objective applies to')
+    measure.add_argument('--output', default=CAPACITY_FILE)
+
+    trace = commands.add_parser('replay', help='Replay recorded load through the planner')
+    trace.add_argument('--features', default=os.path.join(ML_ROOT, 'data', 'features', 'features.parquet'))
+    trace.add_argument('--forecast', choices=['naive', 'lstm', 'oracle'], default='naive')
+    trace.add_argument('--horizon', type=int, default=10, help='Windows covered by naive and oracle peaks')
+    trace.add_argument('--capacity', default=CAPACITY_FILE, help='Measured capacity (see measure)')
+    trace.add_argument('--capacity-per-replica', type=float, help='Requests per minute per replica (overrides --capacity)')
+    trace.add_argument('--target-utilization', type=float, default=TARGET_UTILIZATION)
+    trace.add_argument('--hysteresis', type=float, default=0.1)
+    trace.add_argument('--scale-up-cooldown', type=float, default=60.0, help='Seconds')
+    trace.add_argument('--scale-down-cooldown', type=float, default=300.0, help='Seconds')
+    trace.add_argument('--min-replicas', type=int, default=1)
+    trace.add_argument('--max-replicas', type=int, default=10)
+    trace.add_argument('--output', default=os.path.join(RESULTS_DIR, 'capacity_replay.json'))
+    args = parser.parse_args()
+
+    if args.command == 'measure':
+        from utils.module_loader import load_module
+        endpoint_cost = load_module('models/8_endpoint_cost/train.py')
+        path = args.input or (endpoint_cost.DB_FILE if args.source == 'db' else
+                              os.path.join(ML_ROOT, 'data', 'processed', 'parsed_logs.csv'))
+        print("📏 Measuring per-replica capacity\n")
+        requests = endpoint_cost.load_requests(args.source, path)
+        measured = measure_capacity(requests['cost'].to_numpy(), args.slo_ms, args.percentile)
+        measured['source'] = args.source
+        print(f"   Mean service time: {measured['mean_service_ms']:.2f} ms")
+        print(f"   Capacity: {measured['capacity_per_replica']:.0f} requests/min per replica "
+              f"at {measured['utilization']:.0%} utilization "
+              f"(p{args.percentile:g} {measured['latency_at_capacity_ms']:.1f} ms <= {args.slo_ms:g} ms)")
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(measured, f, indent=2)
+        print(f"\n💾 Saved capacity to: {args.output}")
+        return
+
+    from utils.dataset import read_features
+
+    df = read_features(args.features)
+    if 'timestamp' in df.columns:
+        df = df.sort_values('timestamp')
+    peaks = forecast_peaks(df, args.forecast, args.horizon)
+    anomalies = df['is_anomaly'].to_numpy(dtype=bool) if 'is_anomaly' in df.columns else None
+    capacity = args.capacity_per_replica
+    if capacity is None:
+        with open(args.capacity, 'r') as f:
+            capacity = json.load(f)['capacity_per_replica']
+
+    settings = {
+        'capacity_per_replica': capacity,
+        'target_utilization': args.target_utilization,
+        'min_replicas': args.min_replicas,
+        'max_replicas': args.max_replicas
+    }
+    planners = {
+        'planner': CapacityPlanner(hysteresis=args.hysteresis, scale_up_cooldown_s=args.scale_up_cooldown,
+                                   scale_down_cooldown_s=args.scale_down_cooldown, **settings),
+        # Same sizing rule without hysteresis or cooldowns
+        'stateless': CapacityPlanner(hysteresis=0.0, scale_up_cooldown_s=0, scale_down_cooldown_s=0, **settings)
+    }
+
+    print(f"🔁 Replaying {len(df)} windows ({args.forecast} forecast, {capacity:.1f} requests/min per replica)\n")
+    results = {}
+    for name, planner in planners.items():
+        result = replay(planner, df['request_count'].to_numpy(), peaks, anomalies)
+        results[name] = result
+        print(f"   {name:<10} actions {result['scaling_actions']:>4}  reversals {result['reversals']:>4}  "
+              f"under-provisioned {result['underprovisioned_windows']:>4}  "
+              f"mean replicas {result['mean_replicas']:.2f}  mean utilization {result['mean_utilization']:.2f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'forecast': args.forecast, 'settings': settings, 'results': results}, f, indent=2)
+    print(f"\n💾 Saved replay to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Columnar Batch Encoding
+Packed float32 matrices (and Arrow IPC streams) for routing many rows per request without JSON
+"""
+
+import json
+import struct
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+PACKED_CONTENT_TYPE = 'application/x-float32-matrix'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Request:  'LBF1', n_rows, n_cols, header_bytes (uint32 LE), JSON column names padded to 4 bytes,
+#           then float32 LE values row by row
+# Response: 'LBR1', n_rows, n_classes (uint32 LE), int32 classes, int32 server ids (one per row),
+#           then float32 LE probabilities row by row
+REQUEST_MAGIC = b'LBF1'
+RESPONSE_MAGIC = b'LBR1'
+_REQUEST_HEADER = struct.Struct('<4sIII')
+_RESPONSE_HEADER = struct.Struct('<4sII')
+
+class ColumnarError(ValueError):
+    """Raised for a malformed columnar payload"""
+
+def _padded(length):
+    return (length + 3) & ~3
+
+def encode_matrix(X, columns: Sequence[str]) -> bytes:
+    """
+    Pack a feature matrix with its column names
+
+    Args:
+        X: 2-D array, one row per routing decision
+        columns: Column name per matrix column
+
+    Returns:
+        Request body for PACKED_CONTENT_TYPE
+    """
+    X = np.ascontiguousarray(X, dtype='<f4')
+    if X.ndim != 2 or X.shape[1] != len(columns):
+        raise ColumnarError(f"Expected a 2-D matrix with {len(columns)} columns, got shape {X.shape}")
+    header = json.dumps(list(columns)).encode('utf-8')
+    return b''.join([
+        _REQUEST_HEADER.pack(REQUEST_MAGIC, X.shape[0], X.shape[1], len(header)),
+        header.ljust(_padded(len(header)), b' '),
+        X.tobytes()
+    ])
+
+def decode_matrix(body: bytes) -> Tuple[np.ndarray, List[str]]:
+    """
+    Read a packed request without copying the values
+
+    Returns:
+        (float32 matrix view over body, column names)
+    """
+    if len(body) < _REQUEST_HEADER.size:
+        raise ColumnarError("Payload is shorter than the packed header")
+    magic, n_rows, n_cols, header_bytes = _REQUEST_HEADER.unpack_from(body)
+    if magic != REQUEST_MAGIC:
+        raise ColumnarError(f"Unknown payload magic {magic!r} (expected {REQUEST_MAGIC!r})")
+
+    offset = _REQUEST_HEADER.size + _padded(header_bytes)
+    if len(body) != offset + n_rows * n_cols * 4:
+        raise ColumnarError(f"Payload is {len(body)} bytes, header declares {offset + n_rows * n_cols * 4}")
+    try:
+        columns = json.loads(body[_REQUEST_HEADER.size:_REQUEST_HEADER.size + header_bytes])
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ColumnarError(f"Column header is not a JSON list: {e}") from None
+    if not isinstance(columns, list) or len(columns) != n_cols:
+        raise ColumnarError(f"Column header must list {n_cols} names")
+
+    X = np.frombuffer(body, dtype='<f4', count=n_rows * n_cols, offset=offset).reshape(n_rows, n_cols)
+    return X, columns
+
+def decode_arrow(body: bytes) -> Tuple[np.ndarray, List[str]]:
+    """
+    Read an Arrow IPC stream of numeric columns
+
+    Returns:
+        (float64 matrix, column names)
+    """
+    import pyarrow as pa
+
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except pa.ArrowInvalid as e:
+        raise ColumnarError(f"Invalid Arrow stream: {e}") from None
+    X = np.empty((table.num_rows, table.num_columns), dtype=np.float64)
+    for i, column in enumerate(table.columns):
+        try:
+            X[:, i] = column.to_numpy(zero_copy_only=False)
+        except (TypeError, ValueError, pa.ArrowInvalid) as e:
+            raise ColumnarError(f"Column '{table.column_names[i]}' is not numeric: {e}") from None
+    return X, table.column_names
+
+@lru_cache(maxsize=64)
+def _column_positions(columns: Tuple[str, ...], feature_cols: Tuple[str, ...]):
+    """Source column per feature (-1 = missing); cached because a client sends the same header every time"""
+    index = {name: i for i, name in enumerate(columns)}
+    return np.array([index.get(col, -1) for col in feature_cols], dtype=np.intp)
+
+def to_feature_matrix(X, columns: Sequence[str], feature_cols: Sequence[str]) -> np.ndarray:
+    """
+    Reorder decoded columns into feature_cols order
+
+    Extra columns are ignored and missing features are 0, like build_feature_matrix
+    for dict rows.
+
+    Returns:
+        float64 array of shape (n_rows, len(feature_cols))
+    """
+    if list(columns) == list(feature_cols):
+        return np.asarray(X, dtype=np.float64)
+    positions = _column_positions(tuple(columns), tuple(feature_cols))
+    out = np.zeros((X.shape[0], len(feature_cols)), dtype=np.float64)
+    present = positions >= 0
+    out[:, present] = X[:, positions[present]]
+    return out
+
+def encode_routes(classes, server_ids, probabilities) -> bytes:
+    """Pack routing results (response body for PACKED_CONTENT_TYPE)"""
+    classes = np.ascontiguousarray(classes, dtype='<i4')
+    probabilities = np.ascontiguousarray(probabilities, dtype='<f4')
+    return b''.join([
+        _RESPONSE_HEADER.pack(RESPONSE_MAGIC, probabilities.shape[0], len(classes)),
+        classes.tobytes(),
+        np.ascontiguousarray(server_ids, dtype='<i4').tobytes(),
+        probabilities.tobytes()
+    ])
+
+def decode_routes(body: bytes):
+    """
+    Read a packed routing response
+
+    Returns:
+        (classes, server_ids, probabilities of shape (n_rows, n_classes))
+    """
+    magic, n_rows, n_classes = _RESPONSE_HEADER.unpack_from(body)
+    if magic != RESPONSE_MAGIC:
+        raise ColumnarError(f"Unknown response magic {magic!r} (expected {RESPONSE_MAGIC!r})")
+    offset = _RESPONSE_HEADER.size
+    classes = np.frombuffer(body, dtype='<i4', count=n_classes, offset=offset)
+    server_ids = np.frombuffer(body, dtype='<i4', count=n_rows, offset=offset + 4 * n_classes)
+    probabilities = np.frombuffer(body, dtype='<f4', count=n_rows * n_classes,
+                                  offset=offset + 4 * (n_classes + n_rows)).reshape(n_rows, n_classes)
+    return classes, server_ids, probabilities
+
+def encode_arrow_routes(classes, server_ids, probabilities) -> bytes:
+    """Routing results as an Arrow IPC stream: server_id, confidence and p_<class> columns"""
+    import pyarrow as pa
+
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    columns = {
+        'server_id': pa.array(np.asarray(server_ids, dtype=np.int32)),
+        'confidence': pa.array(probabilities.max(axis=1))
+    }
+    for i, label in enumerate(classes):
+        columns[f"p_{label}"] = pa.array(probabilities[:, i])
+    table = pa.table(columns)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
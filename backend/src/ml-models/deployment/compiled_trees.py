@@ -0,0 +1,683 @@
+"""
+Compiled Tree Ensembles for Low-Latency Routing
+Exports trained Random Forest / XGBoost models to flat NumPy node arrays with a vectorized evaluator
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots', 'bias', 'classes')
+
+_SIGN_BIT = np.int64(-0x8000000000000000)
+_MAX_KEY = np.float64(np.finfo(np.float64).max).view(np.int64)
+
+def _to_key(x):
+    """Map float64 values to int64 keys with the same ordering"""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, _SIGN_BIT - bits, bits)
+
+def _from_key(key):
+    """Inverse of _to_key"""
+    key = np.asarray(key, dtype=np.int64)
+    return np.where(key < 0, _SIGN_BIT - key, key).view(np.float64)
+
+def fold_thresholds(thresholds, mean, scale, strict=False):
+    """
+    Move split thresholds from scaled feature space back to raw feature space
+
+    Both libraries compare float32 features: sklearn tests float32(x_scaled) <= t and
+    XGBoost tests float32(x_scaled) < t. That predicate is monotone in the raw value, so
+    each split has a largest raw float64 T that still goes left; it is found by bisecting
+    the float64 bit patterns. The evaluator can then test raw x <= T with no scaler and
+    get exactly the branch the original model takes.
+
+    Args:
+        thresholds: Split thresholds in scaled space
+        mean: Per-split feature offset (scaler.mean_[feature], 0 without a scaler)
+        scale: Per-split feature scale (scaler.scale_[feature], 1 without a scaler)
+        strict: True for XGBoost's '<' comparison, False for sklearn's '<='
+
+    Returns:
+        float64 thresholds for 'raw x <= T'
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    if strict:
+        limit = thresholds.astype(np.float32)
+
+        def goes_left(raw):
+            return ((raw - mean) / scale).astype(np.float32) < limit
+    else:
+        def goes_left(raw):
+            return ((raw - mean) / scale).astype(np.float32) <= thresholds
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        guess = _to_key(thresholds * scale + mean)
+
+        # Bracket: lo goes left, hi goes right (widen by doubling steps in key space)
+        lo, hi = guess.copy(), guess.copy()
+        step = np.ones_like(guess)
+        for _ in range(64):
+            pending = ~goes_left(_from_key(lo)) & (lo > -_MAX_KEY)
+            if not pending.any():
+                break
+            lo = np.where(pending, np.maximum(lo - step, -_MAX_KEY), lo)
+            step = np.where(pending, step * 2, step)
+
+        step = np.ones_like(guess)
+        for _ in range(64):
+            pending = goes_left(_from_key(hi)) & (hi < _MAX_KEY)
+            if not pending.any():
+                break
+            hi = np.where(pending, np.minimum(hi + step, _MAX_KEY), hi)
+            step = np.where(pending, step * 2, step)
+
+        always_left = goes_left(_from_key(hi))
+        never_left = ~goes_left(_from_key(lo))
+
+        # Bisect to the last key that still goes left
+        for _ in range(66):
+            open_range = hi - lo > 1
+            if not open_range.any():
+                break
+            mid = lo + (hi - lo) // 2
+            left = goes_left(_from_key(mid))
+            lo = np.where(open_range & left, mid, lo)
+            hi = np.where(open_range & ~left, mid, hi)
+
+    folded = _from_key(lo)
+    folded[always_left] = np.inf
+    folded[never_left] = -np.inf
+    return folded
+
+def _scaler_arrays(scaler, n_features):
+    """Per-feature mean and scale (identity without a scaler)"""
+    if scaler is None:
+        return np.zeros(n_features), np.ones(n_features)
+
+    if type(scaler).__name__ != 'StandardScaler' or not hasattr(scaler, 'n_features_in_'):
+        raise ValueError(f"Only a fitted StandardScaler can be folded into thresholds, got {type(scaler).__name__}")
+
+    # with_mean=False / with_std=False leave mean_ / scale_ unset (an identity scaler,
+    # as saved by the external-memory XGBoost training)
+    mean = scaler.mean_ if scaler.with_mean else None
+    scale = scaler.scale_ if scaler.with_std else None
+    mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+    scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+    return mean, scale
+
+class CompiledEnsemble:
+    """
+    Tree ensemble stored as flat node arrays
+
+    Every tree's nodes are concatenated into one set of arrays. Leaves point to
+    themselves (threshold +inf), so evaluation is max_depth rounds of vectorized
+    gathers over all trees at once, with no per-node Python code.
+    """
+
+    def __init__(self, arrays, meta):
+        """
+        Initialize from exported arrays
+
+        Args:
+            arrays: Dict of NumPy arrays (see ARRAY_NAMES)
+            meta: Dict with 'kind' ('mean' or 'softmax' or 'sigmoid'), 'max_depth', 'n_features', ...
+        """
+        # Plain ndarray views: np.memmap's subclass hooks slow every take() in the hot loop
+        arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        self.arrays = arrays
+        self.meta = meta
+
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.default_left = arrays['default_left']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.bias = arrays['bias']
+        self.classes_ = arrays['classes']
+
+        # Children interleaved as [left, right] so a branch is children[2 * node + went_right]
+        self.children = np.empty(2 * len(self.left), dtype=np.int32)
+        self.children[0::2] = self.left
+        self.children[1::2] = self.right
+
+        self.kind = meta['kind']
+        self.max_depth = int(meta['max_depth'])
+        self.n_features = int(meta['n_features'])
+        self.n_trees = len(self.roots)
+
+    def apply(self, X):
+        """
+        Find the leaf reached in every tree
+
+        Args:
+            X: Raw (unscaled) features, shape (n_rows, n_features)
+
+        Returns:
+            Leaf node indices, shape (n_rows, n_trees)
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected shape (n_rows, {self.n_features}), got {X.shape}")
+
+        if np.isnan(X).any():
+            return self._apply_missing(X)
+
+        feature, threshold, children = self.feature, self.threshold, self.children
+        # Row offsets into the flattened X, so one take() gathers every tree's split value
+        offsets = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        flat = X.ravel()
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+
+        for _ in range(self.max_depth):
+            went_right = flat.take(offsets + feature.take(node)) > threshold.take(node)
+            node = children.take(2 * node + went_right)
+
+        return node
+
+    def _apply_missing(self, X):
+        """apply() for rows containing NaN (follows each split's default direction)"""
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], self.n_trees))
+
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.default_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return node
+
+    def _apply_one(self, x):
+        """Leaf indices for a single 1-D row"""
+        if np.isnan(x).any():
+            return self._apply_missing(x.reshape(1, -1))[0]
+
+        feature, threshold, children = self.feature, self.threshold, self.children
+        node = self.roots
+
+        for _ in range(self.max_depth):
+            went_right = x.take(feature.take(node)) > threshold.take(node)
+            node = children.take(2 * node + went_right)
+
+        return node
+
+    def _link(self, summed):
+        """Convert summed leaf values to class probabilities"""
+        if self.kind == 'isolation':
+            raise ValueError("Isolation forests have no class probabilities; use score_samples()")
+        if self.kind == 'mean':
+            return summed / self.n_trees
+
+        margin = summed + self.bias
+        if self.kind == 'sigmoid':
+            p = (1 / (1 + np.exp(-margin[..., 0]))).astype(np.float32)
+            return np.stack([1 - p, p], axis=-1)
+
+        margin = margin - margin.max(axis=-1, keepdims=True)
+        exp = np.exp(margin)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, X):
+        """Class probabilities for raw features, shape (n_rows, n_classes)"""
+        leaves = self.apply(X)
+        return self._link(self.value[leaves].sum(axis=1))
+
+    def score_samples(self, X):
+        """IsolationForest.score_samples for raw features (lower = more abnormal)"""
+        depths = self.value[self.apply(X)].sum(axis=1)[:, 0]
+        return -(2 ** (-depths / self.meta['denominator']))
+
+    def decision_function(self, X):
+        """IsolationForest.decision_function for raw features (negative = anomaly)"""
+        return self.score_samples(X) - self.meta['offset']
+
+    def predict(self, X):
+        """Predicted class labels for raw features"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def predict_one(self, x):
+        """
+        Route a single row
+
+        Args:
+            x: Raw features in feature order (1-D)
+
+        Returns:
+            (class label, probabilities)
+        """
+        x = np.asarray(x, dtype=np.float64)
+        probabilities = self._link(self.value[self._apply_one(x)].sum(axis=0))
+        return self.classes_[probabilities.argmax()], probabilities
+
+    def save(self, output_dir):
+        """Save as one .npy file per array plus meta.json (loadable memory-mapped)"""
+        os.makedirs(output_dir, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(output_dir, f"{name}.npy"), self.arrays[name])
+        with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        return output_dir
+
+    @classmethod
+    def load(cls, model_dir, mmap=True):
+        """
+        Load a saved ensemble
+
+        Args:
+            model_dir: Directory written by save()
+            mmap: Memory-map the node arrays instead of reading them into memory
+        """
+        with open(os.path.join(model_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode='r' if mmap else None)
+            for name in ARRAY_NAMES
+        }
+        return cls(arrays, meta)
+
+def _finish_arrays(nodes, n_features):
+    """Concatenate per-tree node lists into flat arrays with self-looping leaves"""
+    feature = np.concatenate([n['feature'] for n in nodes]).astype(np.int32)
+    threshold = np.concatenate([n['threshold'] for n in nodes]).astype(np.float64)
+    left = np.concatenate([n['left'] for n in nodes]).astype(np.int32)
+    right = np.concatenate([n['right'] for n in nodes]).astype(np.int32)
+    default_left = np.concatenate([n['default_left'] for n in nodes]).astype(bool)
+
+    leaf = left < 0
+    own_index = np.arange(len(feature), dtype=np.int32)
+    feature[leaf] = 0
+    threshold[leaf] = np.inf
+    left[leaf] = own_index[leaf]
+    right[leaf] = own_index[leaf]
+
+    if len(feature) and feature.max() >= n_features:
+        raise ValueError("Split feature index out of range")
+
+    return feature, threshold, left, right, default_left
+
+def _tree_depth(left, right):
+    """Maximum depth of one tree given local child arrays (-1 = leaf)"""
+    depth, stack = 0, [(0, 0)]
+    while stack:
+        node, d = stack.pop()
+        if left[node] < 0:
+            depth = max(depth, d)
+        else:
+            stack.append((left[node], d + 1))
+            stack.append((right[node], d + 1))
+    return depth
+
+def _compile_sklearn_trees(estimators, n_features, mean, scale, leaf_values):
+    """
+    Flatten fitted sklearn trees into node lists
+
+    Args:
+        estimators: Fitted DecisionTree* estimators
+        mean, scale: Per-feature scaler arrays folded into the thresholds
+        leaf_values: Function mapping a tree_ to its (node_count, n_outputs) node values
+
+    Returns:
+        nodes, roots, values, max_depth
+    """
+    nodes, roots, values, max_depth, offset = [], [], [], 0, 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        left, right = tree.children_left, tree.children_right
+        is_split = left >= 0
+        split_feature = np.where(is_split, tree.feature, 0)
+
+        threshold = np.full(tree.node_count, np.inf)
+        threshold[is_split] = fold_thresholds(
+            tree.threshold[is_split], mean[split_feature[is_split]], scale[split_feature[is_split]]
+        )
+        values.append(leaf_values(tree))
+
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+        nodes.append({
+            'feature': split_feature,
+            'threshold': threshold,
+            'left': np.where(is_split, left + offset, -1),
+            'right': np.where(is_split, right + offset, -1),
+            'default_left': np.asarray(missing_left, dtype=bool)
+        })
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    return nodes, roots, values, max_depth
+
+def _mean_ensemble(nodes, roots, values, max_depth, n_features, classes, meta):
+    """CompiledEnsemble averaging per-tree leaf values (RandomForest-style)"""
+    feature, threshold, left, right, default_left = _finish_arrays(nodes, n_features)
+    arrays = {
+        'feature': feature, 'threshold': threshold, 'left': left, 'right': right,
+        'default_left': default_left,
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'bias': np.zeros(len(classes)),
+        'classes': np.asarray(classes)
+    }
+    return CompiledEnsemble(arrays, {'kind': 'mean', 'max_depth': int(max_depth), 'n_features': int(n_features),
+                                     **meta})
+
+def _classifier_leaf_values(tree):
+    # sklearn >= 1.4 stores leaf fractions; older versions store counts and
+    # normalize in predict_proba. Only rows that aren't fractions are divided,
+    # so the result is bit-identical either way.
+    value = tree.value[:, 0, :].astype(np.float64)
+    normalizer = value.sum(axis=1, keepdims=True)
+    counts = ~np.isclose(normalizer[:, 0], 1.0) & (normalizer[:, 0] > 0)
+    value[counts] /= normalizer[counts]
+    return value
+
+def compile_random_forest(model, scaler=None, feature_cols=None):
+    """
+    Export a fitted sklearn RandomForestClassifier
+
+    Args:
+        model: Fitted RandomForestClassifier (trained on scaled features if scaler is given)
+        scaler: StandardScaler to fold into the thresholds (optional)
+        feature_cols: Feature names, stored in the metadata (optional)
+
+    Returns:
+        CompiledEnsemble whose predict_proba(raw X) equals model.predict_proba(scaler.transform(X))
+    """
+    n_features = model.n_features_in_
+    mean, scale = _scaler_arrays(scaler, n_features)
+    nodes, roots, values, max_depth = _compile_sklearn_trees(
+        model.estimators_, n_features, mean, scale, _classifier_leaf_values
+    )
+    return _mean_ensemble(nodes, roots, values, max_depth, n_features, model.classes_, {
+        'source': 'RandomForestClassifier',
+        'feature_cols': list(feature_cols) if feature_cols is not None else None,
+        'scaler_folded': scaler is not None
+    })
+
+def compile_soft_trees(estimators, classes, scaler=None, feature_cols=None, source='DecisionTreeRegressor'):
+    """
+    Export multi-output regression trees fitted to class probabilities
+
+    Used for distilled students: each tree predicts a probability vector
+    (leaf = mean of the teacher's probabilities), and the ensemble averages them.
+
+    Args:
+        estimators: Fitted DecisionTreeRegressor(s) with one output per class
+        classes: Class labels in output order
+        scaler: StandardScaler to fold into the thresholds (optional)
+        feature_cols: Feature names, stored in the metadata (optional)
+        source: Model type recorded in the metadata
+
+    Returns:
+        CompiledEnsemble whose predict_proba(raw X) equals the averaged tree predictions
+    """
+    n_features = estimators[0].n_features_in_
+    mean, scale = _scaler_arrays(scaler, n_features)
+    nodes, roots, values, max_depth = _compile_sklearn_trees(
+        estimators, n_features, mean, scale, lambda tree: tree.value[:, :, 0].astype(np.float64)
+    )
+    return _mean_ensemble(nodes, roots, values, max_depth, n_features, classes, {
+        'source': source,
+        'feature_cols': list(feature_cols) if feature_cols is not None else None,
+        'scaler_folded': scaler is not None
+    })
+
+def compile_xgboost(model, scaler=None, feature_cols=None):
+    """
+    Export a fitted XGBClassifier (numeric splits only)
+
+    Args:
+        model: Fitted xgboost.XGBClassifier (trained on scaled features if scaler is given)
+        scaler: StandardScaler to fold into the thresholds (optional)
+        feature_cols: Feature names, stored in the metadata (optional)
+
+    Returns:
+        CompiledEnsemble matching model.predict_proba(scaler.transform(X)) up to float32 rounding
+    """
+    import xgboost as xgb
+
+    booster = model.get_booster()
+    dump = json.loads(booster.save_raw('json'))
+    trees_json = dump['learner']['gradient_booster']['model']['trees']
+    tree_info = dump['learner']['gradient_booster']['model']['tree_info']
+    n_features = int(dump['learner']['learner_model_param']['num_feature'])
+    n_classes = len(model.classes_)
+    n_outputs = 1 if n_classes == 2 else n_classes
+
+    # Trees used by predict_proba (early stopping keeps only the best iteration)
+    n_trees = len(trees_json)
+    best_iteration = getattr(model, 'best_iteration', None)
+    if best_iteration is not None:
+        indptr = dump['learner']['gradient_booster']['model'].get('iteration_indptr')
+        n_trees = indptr[best_iteration + 1] if indptr else (best_iteration + 1) * n_outputs
+
+    mean, scale = _scaler_arrays(scaler, n_features)
+
+    nodes, roots, values, max_depth, offset = [], [], [], 0, 0
+    for tree_json, output in zip(trees_json[:n_trees], tree_info[:n_trees]):
+        if any(tree_json['split_type']):
+            raise ValueError("Categorical splits are not supported")
+
+        left = np.asarray(tree_json['left_children'], dtype=np.int64)
+        right = np.asarray(tree_json['right_children'], dtype=np.int64)
+        conditions = np.asarray(tree_json['split_conditions'], dtype=np.float32)
+        split_feature = np.asarray(tree_json['split_indices'], dtype=np.int64)
+        is_split = left >= 0
+
+        threshold = np.full(len(left), np.inf)
+        threshold[is_split] = fold_thresholds(
+            conditions[is_split], mean[split_feature[is_split]], scale[split_feature[is_split]], strict=True
+        )
+
+        # Leaf weight goes to this tree's output column
+        value = np.zeros((len(left), n_outputs), dtype=np.float32)
+        value[~is_split, output] = conditions[~is_split]
+        values.append(value)
+
+        nodes.append({
+            'feature': np.where(is_split, split_feature, 0),
+            'threshold': threshold,
+            'left': np.where(is_split, left + offset, -1),
+            'right': np.where(is_split, right + offset, -1),
+            'default_left': np.asarray(tree_json['default_left'], dtype=bool)
+        })
+        roots.append(offset)
+        max_depth = max(max_depth, _tree_depth(left, right))
+        offset += len(left)
+
+    feature, threshold, left, right, default_left = _finish_arrays(nodes, n_features)
+    value = np.concatenate(values)
+    roots = np.asarray(roots, dtype=np.int32)
+
+    # Base margin: XGBoost's margin minus the summed leaf weights (measured, not parsed)
+    probe = np.zeros((1, n_features), dtype=np.float32)
+    margin = booster.predict(xgb.DMatrix(probe), output_margin=True,
+                             iteration_range=(0, (best_iteration + 1) if best_iteration is not None else 0))
+    meta = {'kind': 'sigmoid' if n_outputs == 1 else 'softmax', 'max_depth': int(max_depth),
+            'n_features': int(n_features)}
+    partial = CompiledEnsemble({
+        'feature': feature, 'threshold': threshold, 'left': left, 'right': right,
+        'default_left': default_left, 'value': value, 'roots': roots,
+        'bias': np.zeros(n_outputs, dtype=np.float32), 'classes': np.asarray(model.classes_)
+    }, meta)
+    # The probe is 0 in scaled space, which is exactly 'mean' in raw space
+    raw_probe = mean.reshape(1, -1)
+    leaf_sum = value[partial.apply(raw_probe)].sum(axis=1)
+    bias = (np.asarray(margin, dtype=np.float32).reshape(1, -1) - leaf_sum)[0].astype(np.float32)
+
+    arrays = dict(partial.arrays)
+    arrays['bias'] = bias
+    meta.update({
+        'source': 'XGBClassifier',
+        'feature_cols': list(feature_cols) if feature_cols is not None else None,
+        'scaler_folded': scaler is not None
+    })
+    return CompiledEnsemble(arrays, meta)
+
+def compile_isolation_forest(model, scaler=None, feature_cols=None):
+    """
+    Export a fitted sklearn IsolationForest
+
+    Each leaf stores its path length (depth + average path length of the samples
+    left unsplit), so the summed leaf values are sklearn's total depth per row.
+
+    Args:
+        model: Fitted IsolationForest (trained on scaled features if scaler is given)
+        scaler: StandardScaler to fold into the thresholds (optional)
+        feature_cols: Feature names, stored in the metadata (optional)
+
+    Returns:
+        CompiledEnsemble whose score_samples(raw X) equals model.score_samples(scaler.transform(X))
+    """
+    n_features = model.n_features_in_
+    mean, scale = _scaler_arrays(scaler, n_features)
+
+    nodes, roots, values, max_depth, offset = [], [], [], 0, 0
+    for index, (estimator, features) in enumerate(zip(model.estimators_, model.estimators_features_)):
+        tree = estimator.tree_
+        left, right = tree.children_left, tree.children_right
+        is_split = left >= 0
+        # Trees see a feature subset; map their local indices back to model columns
+        split_feature = np.where(is_split, np.asarray(features)[np.where(is_split, tree.feature, 0)], 0)
+
+        threshold = np.full(tree.node_count, np.inf)
+        threshold[is_split] = fold_thresholds(
+            tree.threshold[is_split], mean[split_feature[is_split]], scale[split_feature[is_split]]
+        )
+
+        path_length = model._decision_path_lengths[index] + model._average_path_length_per_tree[index] - 1.0
+        values.append(np.asarray(path_length, dtype=np.float64).reshape(-1, 1))
+
+        nodes.append({
+            'feature': split_feature,
+            'threshold': threshold,
+            'left': np.where(is_split, left + offset, -1),
+            'right': np.where(is_split, right + offset, -1),
+            'default_left': np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)), dtype=bool)
+        })
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    from sklearn.ensemble._iforest import _average_path_length
+
+    feature, threshold, left, right, default_left = _finish_arrays(nodes, n_features)
+    arrays = {
+        'feature': feature, 'threshold': threshold, 'left': left, 'right': right,
+        'default_left': default_left,
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'bias': np.zeros(1),
+        'classes': np.asarray([-1, 1])
+    }
+    meta = {
+        'source': 'IsolationForest',
+        'kind': 'isolation',
+        'max_depth': int(max_depth),
+        'n_features': int(n_features),
+        'denominator': float(len(model.estimators_) * _average_path_length([model.max_samples_])[0]),
+        'offset': float(model.offset_),
+        'feature_cols': list(feature_cols) if feature_cols is not None else None,
+        'scaler_folded': scaler is not None
+    }
+    return CompiledEnsemble(arrays, meta)
+
+def compile_model(model, scaler=None, feature_cols=None):
+    """Export a RandomForestClassifier, XGBClassifier or IsolationForest"""
+    name = type(model).__name__
+    if name == 'RandomForestClassifier':
+        return compile_random_forest(model, scaler, feature_cols)
+    if name == 'XGBClassifier':
+        return compile_xgboost(model, scaler, feature_cols)
+    if name == 'IsolationForest':
+        return compile_isolation_forest(model, scaler, feature_cols)
+    raise ValueError(f"Unsupported model type: {name}")
+
+def verify(compiled, model, scaler, X):
+    """
+    Compare compiled and original predictions on raw features X
+
+    Returns:
+        Dict with max absolute probability (or anomaly score) difference and label agreement
+    """
+    X = np.asarray(X, dtype=np.float64)
+    with warnings.catch_warnings():
+        # Scalers fitted on DataFrames warn about the plain array
+        warnings.simplefilter('ignore', UserWarning)
+        X_scaled = scaler.transform(X) if scaler is not None else X
+
+    if compiled.kind == 'isolation':
+        expected = model.decision_function(X_scaled)
+        actual = compiled.decision_function(X)
+        return {
+            'rows': int(len(X)),
+            'max_abs_diff': float(np.abs(expected - actual).max()),
+            'identical': bool(np.array_equal(expected, actual)),
+            'label_agreement': float(((expected < 0) == (actual < 0)).mean())
+        }
+
+    expected = model.predict_proba(X_scaled)
+    actual = compiled.predict_proba(X)
+
+    return {
+        'rows': int(len(X)),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+        'identical': bool(np.array_equal(expected, actual)),
+        'label_agreement': float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    }
+
+def main():
+    """Export a trained model directory to compiled node arrays"""
+    import joblib
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Compile a trained tree ensemble to flat NumPy arrays')
+    parser.add_argument('model_dir', help='Directory with model.pkl, scaler.pkl and feature_cols.json')
+    parser.add_argument('--output', help='Output directory (default: <model_dir>/compiled)')
+    parser.add_argument('--features', default=os.path.join(ML_ROOT, 'data', 'features', 'features.parquet'),
+                        help='Feature file used to verify the export')
+    args = parser.parse_args()
+
+    print(f"📖 Loading model from: {args.model_dir}")
+    model = joblib.load(os.path.join(args.model_dir, 'model.pkl'))
+    if getattr(model, 'verbose', 0):
+        model.set_params(verbose=0)
+    scaler = joblib.load(os.path.join(args.model_dir, 'scaler.pkl'))
+    with open(os.path.join(args.model_dir, 'feature_cols.json'), 'r') as f:
+        feature_cols = json.load(f)
+
+    print(f"🔧 Compiling {type(model).__name__} (scaler folded into thresholds)...")
+    compiled = compile_model(model, scaler, feature_cols)
+    output_dir = compiled.save(args.output or os.path.join(args.model_dir, 'compiled'))
+    print(f"   Trees: {compiled.n_trees}, nodes: {len(compiled.feature)}, max depth: {compiled.max_depth}")
+    print(f"💾 Saved compiled model to: {output_dir}")
+
+    if os.path.exists(args.features):
+        df = pd.read_parquet(args.features) if args.features.endswith('.parquet') else pd.read_csv(args.features)
+        X = df.reindex(columns=feature_cols, fill_value=0).to_numpy(dtype=np.float64)
+        report = verify(compiled, model, scaler, X)
+        print(f"\n✅ Verified on {report['rows']} rows: max |Δp| = {report['max_abs_diff']:.2e}, "
+              f"label agreement = {report['label_agreement']:.2%}")
+
+        row, calls = X[0], 1000
+        if compiled.kind == 'isolation':
+            score_one = lambda: compiled.decision_function(row.reshape(1, -1))
+        else:
+            score_one = lambda: compiled.predict_one(row)
+        start = time.perf_counter()
+        for _ in range(calls):
+            score_one()
+        print(f"⚡ Single-row latency: {(time.perf_counter() - start) / calls * 1e6:.1f} µs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Distillation of the Routing Models
+Fits tiny students (shallow tree, small tree set, linear) to a RF/XGBoost teacher and exports them for the hot path
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import warnings
+
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from deployment.compiled_trees import CompiledEnsemble, compile_model, compile_soft_trees
+from utils.resources import get_n_jobs
+
+# Students are saved as <model_dir>/students/<name>/
+STUDENTS_DIR = 'students'
+
+DEFAULT_STUDENTS = ['tree-3', 'tree-5', 'tree-8', 'forest-4x6', 'forest-16x8', 'linear']
+
+class LinearStudent:
+    """
+    Multinomial linear router: softmax(x @ weights + bias) on raw features
+
+    The training scaler is folded into weights and bias, so a row costs one
+    small matrix-vector product.
+    """
+
+    def __init__(self, arrays, meta):
+        """
+        Initialize from exported arrays
+
+        Args:
+            arrays: Dict with 'weights' (n_features, n_classes), 'bias' (n_classes,) and 'classes'
+            meta: Dict with 'kind' ('linear'), 'n_features', ...
+        """
+        self.arrays = arrays
+        self.meta = meta
+        self.weights = np.ascontiguousarray(arrays['weights'], dtype=np.float64)
+        self.bias = np.asarray(arrays['bias'], dtype=np.float64)
+        self.classes_ = np.asarray(arrays['classes'])
+        self.kind = meta['kind']
+        self.n_features = int(meta['n_features'])
+
+    @staticmethod
+    def _softmax(margin):
+        margin = margin - margin.max(axis=-1, keepdims=True)
+        exp = np.exp(margin)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, X):
+        """Class probabilities for raw features, shape (n_rows, n_classes)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected shape (n_rows, {self.n_features}), got {X.shape}")
+        return self._softmax(np.nan_to_num(X) @ self.weights + self.bias)
+
+    def predict(self, X):
+        """Predicted class labels for raw features"""
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def predict_one(self, x):
+        """(class label, probabilities) for one raw 1-D row"""
+        probabilities = self._softmax(np.nan_to_num(np.asarray(x, dtype=np.float64)) @ self.weights + self.bias)
+        return self.classes_[probabilities.argmax()], probabilities
+
+    def save(self, output_dir):
+        """Save as .npy arrays plus meta.json"""
+        os.makedirs(output_dir, exist_ok=True)
+        for name in ('weights', 'bias', 'classes'):
+            np.save(os.path.join(output_dir, f"{name}.npy"), self.arrays[name])
+        with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        return output_dir
+
+    @classmethod
+    def load(cls, model_dir):
+        with open(os.path.join(model_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(model_dir, f"{name}.npy")) for name in ('weights', 'bias', 'classes')}
+        return cls(arrays, meta)
+
+def load_student(student_dir, mmap=True):
+    """Load an exported student (CompiledEnsemble for tree students, LinearStudent for linear)"""
+    with open(os.path.join(student_dir, 'meta.json'), 'r') as f:
+        kind = json.load(f)['kind']
+    if kind == 'linear':
+        return LinearStudent.load(student_dir)
+    return CompiledEnsemble.load(student_dir, mmap=mmap)
+
+def parse_student(spec):
+    """
+    Student spec to (kind, params)
+
+    'tree-D': one regression tree of depth D; 'forest-NxD': N trees of depth D;
+    'linear': multinomial logistic regression.
+    """
+    if spec == 'linear':
+        return 'linear', {}
+    match = re.fullmatch(r'tree-(\d+)', spec)
+    if match:
+        return 'tree', {'max_depth': int(match.group(1))}
+    match = re.fullmatch(r'forest-(\d+)x(\d+)', spec)
+    if match:
+        return 'forest', {'n_estimators': int(match.group(1)), 'max_depth': int(match.group(2))}
+    raise ValueError(f"Unknown student '{spec}' (use tree-D, forest-NxD or linear)")
+
+def augment_rows(X, copies=0, noise=0.05, seed=42):
+    """
+    Real rows plus jittered copies for the teacher to label
+
+    Students only see what the teacher is asked about; jittering each feature by
+    noise * its std fills in the regions between real windows near the decision
+    boundaries. Counts stay non-negative.
+    """
+    if copies <= 0:
+        return X
+    rng = np.random.default_rng(seed)
+    std = np.nanstd(X, axis=0)
+    jittered = np.repeat(X, copies, axis=0)
+    jittered = jittered + rng.normal(size=jittered.shape) * std * noise
+    jittered[:, X.min(axis=0) >= 0] = np.maximum(jittered[:, X.min(axis=0) >= 0], 0)
+    return np.vstack([X, jittered])
+
+def fit_student(spec, X, teacher_proba, classes, feature_cols):
+    """
+    Fit one student on teacher outputs over raw feature rows
+
+    Tree students regress the teacher's probability vectors (soft targets keep
+    its confidence, not just its argmax); the linear student fits the teacher's
+    labels on standardized features, then folds the scaling into its weights.
+
+    Returns:
+        Exported student (CompiledEnsemble or LinearStudent)
+    """
+    kind, params = parse_student(spec)
+    meta = {'student': spec, 'feature_cols': list(feature_cols)}
+
+    if kind == 'tree':
+        from sklearn.tree import DecisionTreeRegressor
+        tree = DecisionTreeRegressor(random_state=42, min_samples_leaf=5, **params).fit(X, teacher_proba)
+        student = compile_soft_trees([tree], classes, feature_cols=feature_cols, source='DecisionTreeRegressor')
+    elif kind == 'forest':
+        from sklearn.ensemble import RandomForestRegressor
+        forest = RandomForestRegressor(random_state=42, min_samples_leaf=5, n_jobs=get_n_jobs(), **params)
+        forest.fit(X, teacher_proba)
+        student = compile_soft_trees(forest.estimators_, classes, feature_cols=feature_cols,
+                                     source='RandomForestRegressor')
+    else:
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler().fit(X)
+        labels = classes[teacher_proba.argmax(axis=1)]
+        linear = LogisticRegression(max_iter=2000).fit(scaler.transform(X), labels)
+        coef, intercept = linear.coef_, linear.intercept_
+        if coef.shape[0] == 1:
+            # Binary: sklearn keeps one row; softmax over [0, z] gives the same probabilities
+            coef, intercept = np.vstack([np.zeros_like(coef), coef]), np.array([0.0, intercept[0]])
+        # Expand to every teacher class (classes the teacher never predicted get -inf margin)
+        weights = np.zeros((X.shape[1], len(classes)))
+        bias = np.full(len(classes), -np.inf)
+        for row, label in enumerate(linear.classes_):
+            column = int(np.flatnonzero(classes == label)[0])
+            weights[:, column] = coef[row] / scaler.scale_
+            bias[column] = intercept[row] - coef[row] @ (scaler.mean_ / scaler.scale_)
+        student = LinearStudent({'weights': weights, 'bias': bias, 'classes': np.asarray(classes)},
+                                {'kind': 'linear', 'n_features': int(X.shape[1]), 'source': 'LogisticRegression'})
+
+    student.meta.update(meta)
+    return student
+
+def row_latency_us(predict_one, X, calls=2000):
+    """Median single-row latency in microseconds"""
+    rows = [np.ascontiguousarray(row) for row in X[:64]]
+    for row in rows[:8]:
+        predict_one(row)
+    timings = []
+    for i in range(calls):
+        row = rows[i % len(rows)]
+        start = time.perf_counter()
+        predict_one(row)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1e6
+
+def directory_bytes(path):
+    """Total size of the files in a directory (or of one file)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def evaluate(student, X_holdout, teacher_labels, y_true=None):
+    """Agreement with the teacher (and accuracy vs the load-level labels) on held-out rows"""
+    predicted = student.predict(X_holdout)
+    report = {'agreement': float((predicted == teacher_labels).mean())}
+    if y_true is not None:
+        report['accuracy'] = float((predicted == y_true).mean())
+    return report
+
+def distill(model_dir, features_file, students=DEFAULT_STUDENTS, augment=4, holdout=0.2, output_dir=None):
+    """
+    Distill a trained RF/XGBoost model directory into students
+
+    Args:
+        model_dir: Directory with model.pkl, scaler.pkl and feature_cols.json (the teacher)
+        features_file: Feature store rows the teacher labels
+        students: Student specs (parse_student)
+        augment: Jittered copies per training row (augment_rows)
+        holdout: Share of real rows held out for the agreement check
+        output_dir: Where students are saved (default: <model_dir>/students)
+
+    Returns:
+        List of report rows (teacher first)
+    """
+    import joblib
+    from utils import incremental
+    from utils.dataset import read_features
+
+    teacher = joblib.load(os.path.join(model_dir, 'model.pkl'))
+    if getattr(teacher, 'verbose', 0):
+        teacher.set_params(verbose=0)
+    if 'n_jobs' in teacher.get_params():
+        teacher.set_params(n_jobs=1)
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+    with open(os.path.join(model_dir, 'feature_cols.json'), 'r') as f:
+        feature_cols = json.load(f)
+    output_dir = output_dir or os.path.join(model_dir, STUDENTS_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = read_features(features_file)
+    X = df.reindex(columns=feature_cols, fill_value=0).to_numpy(dtype=np.float64)
+    state = incremental.load_state(model_dir)
+    y_true = None
+    if state is not None:
+        edges = np.asarray(state['load_level_bins'][1:-1], dtype=np.float64)
+        y_true = np.searchsorted(edges, df['request_count'].to_numpy(dtype=np.float64), side='left')
+
+    # Teacher outputs through its compiled export: identical to predict_proba, much faster on many rows
+    compiled_teacher = compile_model(teacher, scaler, feature_cols)
+    classes = np.asarray(compiled_teacher.classes_)
+
+    order = np.random.default_rng(42).permutation(len(X))
+    n_holdout = int(round(len(X) * holdout))
+    holdout_rows, train_rows = order[:n_holdout], order[n_holdout:]
+    X_train = augment_rows(X[train_rows], augment)
+    X_holdout = X[holdout_rows]
+    teacher_labels = compiled_teacher.predict(X_holdout)
+    y_holdout = y_true[holdout_rows] if y_true is not None else None
+
+    print(f"🎓 Teacher: {type(teacher).__name__} ({compiled_teacher.n_trees} trees), "
+          f"{len(train_rows)} rows + {len(X_train) - len(train_rows)} jittered, {len(X_holdout)} held out")
+    start = time.perf_counter()
+    teacher_proba = compiled_teacher.predict_proba(X_train)
+    print(f"   Labelled {len(X_train)} rows in {time.perf_counter() - start:.2f}s")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        teacher_latency = row_latency_us(lambda x: teacher.predict_proba(scaler.transform(x.reshape(1, -1))), X_holdout,
+                                         calls=200)
+    rows = [{
+        'name': 'teacher',
+        'type': type(teacher).__name__,
+        **evaluate(compiled_teacher, X_holdout, teacher_labels, y_holdout),
+        'bytes': directory_bytes(os.path.join(model_dir, 'model.pkl')),
+        'latency_us': teacher_latency
+    }]
+    compiled_dir = os.path.join(model_dir, 'compiled')
+    rows.append({
+        'name': 'teacher (compiled)',
+        'type': 'CompiledEnsemble',
+        **evaluate(compiled_teacher, X_holdout, teacher_labels, y_holdout),
+        'bytes': directory_bytes(compiled_dir) if os.path.isdir(compiled_dir) else None,
+        'latency_us': row_latency_us(compiled_teacher.predict_one, X_holdout)
+    })
+
+    for spec in students:
+        start = time.perf_counter()
+        student = fit_student(spec, X_train, teacher_proba, classes, feature_cols)
+        fit_s = time.perf_counter() - start
+        path = student.save(os.path.join(output_dir, spec))
+        rows.append({
+            'name': spec,
+            'type': student.meta['source'],
+            **evaluate(student, X_holdout, teacher_labels, y_holdout),
+            'bytes': directory_bytes(path),
+            'latency_us': row_latency_us(student.predict_one, X_holdout),
+            'fit_s': fit_s,
+            'path': path
+        })
+
+    with open(os.path.join(output_dir, 'report.json'), 'w') as f:
+        json.dump({'teacher': model_dir, 'features_file': features_file, 'augment': augment,
+                   'holdout_rows': int(len(X_holdout)), 'students': rows}, f, indent=2)
+    return rows
+
+def print_report(rows):
+    """Agreement / size / latency table"""
+    print(f"\n{'student':<20} {'type':<24} {'agreement':>9} {'accuracy':>9} {'size':>10} {'µs/row':>8}")
+    for row in rows:
+        size = f"{row['bytes'] / 1024:.1f} KB" if row['bytes'] is not None else '-'
+        accuracy = f"{row['accuracy']:.2%}" if 'accuracy' in row else '-'
+        print(f"{row['name']:<20} {row['type']:<24} {row['agreement']:>9.2%} {accuracy:>9} {size:>10} "
+              f"{row['latency_us']:>8.1f}")
+
+def main():
+    """Distill a routing model directory and print the comparison table"""
+    parser = argparse.ArgumentParser(description='Distill a RF/XGBoost router into tiny students')
+    parser.add_argument('model_dir', help='Teacher directory with model.pkl, scaler.pkl and feature_cols.json')
+    parser.add_argument('--features', default=os.path.join(ML_ROOT, 'data', 'features', 'features.parquet'),
+                        help='Feature store rows the teacher labels')
+    parser.add_argument('--students', default=','.join(DEFAULT_STUDENTS),
+                        help='Comma-separated specs: tree-D, forest-NxD, linear')
+    parser.add_argument('--augment', type=int, default=4, help='Jittered copies of each training row')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Share of real rows held out')
+    parser.add_argument('--output', help=f'Student directory (default: <model_dir>/{STUDENTS_DIR})')
+    args = parser.parse_args()
+
+    students = [spec.strip() for spec in args.students.split(',') if spec.strip()]
+    try:
+        for spec in students:
+            parse_student(spec)
+    except ValueError as e:
+        parser.error(str(e))
+    if not os.path.exists(args.features):
+        print(f"❌ Features file not found: {args.features}")
+        return 1
+
+    output_dir = args.output or os.path.join(args.model_dir, STUDENTS_DIR)
+    rows = distill(args.model_dir, args.features, students, args.augment, args.holdout, output_dir)
+    print_report(rows)
+    print(f"\n💾 Saved students to: {output_dir} (serve one with model_server.py --student <name>)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+Online Feature State
+Ring buffers per metric that keep lag and rolling features up to date, one aggregated window at a time
+"""
+
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# extract_features.py builds the training features with lookback=10
+DEFAULT_LOOKBACK = 10
+# aggregate_metrics() resamples to 1-minute windows
+DEFAULT_INTERVAL_S = 60.0
+
+_LAG = re.compile(r'^(?P<metric>.+)_lag_(?P<lag>\d+)$')
+_ROLLING = re.compile(r'^(?P<metric>.+)_rolling_(?P<stat>mean|std)$')
+
+def _timestamp(value) -> Optional[datetime]:
+    """Window timestamp as an aware datetime (epoch seconds/ms or ISO 8601; naive = UTC)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        parsed = datetime.fromtimestamp(value / 1000 if value > 1e11 else value, tz=timezone.utc)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Unreadable window timestamp: {value!r}") from None
+    else:
+        raise ValueError(f"Unreadable window timestamp: {value!r}")
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+def derive_window(window: Dict) -> Dict:
+    """
+    Fill in the per-window columns aggregate_metrics() derives from raw counts
+
+    error_rate, bot_rate and avg_response_time are computed from error_count,
+    bot_count and avg_bytes when missing; hour, weekday and is_weekend from the
+    window's timestamp. Values already present are kept.
+    """
+    window = dict(window)
+    request_count = float(window.get('request_count', 0) or 0)
+    if 'error_rate' not in window and 'error_count' in window:
+        window['error_rate'] = window['error_count'] / (request_count + 1)
+    if 'bot_rate' not in window and 'bot_count' in window:
+        window['bot_rate'] = window['bot_count'] / (request_count + 1)
+    if 'avg_response_time' not in window and 'avg_bytes' in window:
+        window['avg_response_time'] = window['avg_bytes'] / 1000
+
+    timestamp = _timestamp(window.get('timestamp'))
+    if timestamp is not None:
+        window.setdefault('hour', timestamp.hour)
+        window.setdefault('weekday', timestamp.weekday())
+        window.setdefault('is_weekend', int(timestamp.weekday() >= 5))
+    return window
+
+class MetricRing:
+    """
+    Last `size` values of one metric with running sums for a rolling window
+
+    push() is O(1): the rolling sum and sum of squares are adjusted by the value
+    entering and the one leaving the window. They are recomputed from the buffer
+    once per wrap-around so float error can't build up over a long-running stream.
+    """
+
+    def __init__(self, size: int, window: int = 0):
+        """
+        Initialize ring
+
+        Args:
+            size: Values kept (the largest lag, or the rolling window if longer)
+            window: Rolling window length (0 = no rolling statistics)
+        """
+        self.values = np.zeros(max(size, window, 1), dtype=np.float64)
+        self.window = window
+        self.pos = -1
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, value: float):
+        size = len(self.values)
+        self.pos = (self.pos + 1) % size
+        if self.window:
+            leaving = self.values[(self.pos - self.window) % size] if self.count >= self.window else 0.0
+            self.total += value - leaving
+            self.total_sq += value * value - leaving * leaving
+        self.values[self.pos] = value
+        self.count += 1
+        if self.window and self.pos == size - 1:
+            recent = self.last_window()
+            self.total, self.total_sq = float(recent.sum()), float(np.dot(recent, recent))
+
+    def lag(self, steps: int) -> float:
+        """Value `steps` windows before the newest (NaN before that much history)"""
+        if steps >= self.count:
+            return np.nan
+        return self.values[(self.pos - steps) % len(self.values)]
+
+    def last_window(self) -> np.ndarray:
+        """Values in the rolling window (oldest first)"""
+        n = min(self.count, self.window)
+        return np.take(self.values, np.arange(self.pos - n + 1, self.pos + 1), mode='wrap')
+
+    def mean(self) -> float:
+        if self.count < self.window:
+            return np.nan
+        return self.total / self.window
+
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, like pandas rolling().std())"""
+        if self.count < self.window or self.window < 2:
+            return np.nan
+        variance = (self.total_sq - self.total * self.total / self.window) / (self.window - 1)
+        return float(np.sqrt(max(variance, 0.0)))
+
+class FeatureState:
+    """
+    Lag and rolling features for one stream of aggregated windows
+
+    The feature names in feature_cols decide what is tracked: `<metric>_lag_<k>`
+    keeps the last k values of metric, `<metric>_rolling_mean` / `_rolling_std`
+    keep a running window of `lookback` values, and every other column is copied
+    from the newest window. Each ingest() costs O(1) per tracked metric, and the
+    result matches create_time_series_features() on the same windows once enough
+    history has been seen.
+    """
+
+    def __init__(self, feature_cols: Sequence[str], lookback: int = DEFAULT_LOOKBACK,
+                 interval_s: float = DEFAULT_INTERVAL_S):
+        """
+        Initialize state
+
+        Args:
+            feature_cols: Model input columns (feature_cols.json order)
+            lookback: Rolling window length used in training
+            interval_s: Window length; skipped windows (by timestamp) are filled with zeros,
+                like the empty minutes resample() produces
+        """
+        if lookback < 2:
+            raise ValueError("lookback must be at least 2 for a rolling standard deviation")
+        self.feature_cols = list(feature_cols)
+        self.lookback = lookback
+        self.interval_s = interval_s
+        self.count = 0
+        self.last_timestamp = None
+        self._lock = threading.Lock()
+
+        sizes, rolling = {}, set()
+        self._current = []   # (output index, column)
+        self._lags = []      # (output index, metric, steps)
+        self._stats = []     # (output index, metric, 'mean' | 'std')
+        for i, col in enumerate(self.feature_cols):
+            lag, stat = _LAG.match(col), _ROLLING.match(col)
+            if lag:
+                metric, steps = lag.group('metric'), int(lag.group('lag'))
+                sizes[metric] = max(sizes.get(metric, 0), steps + 1)
+                self._lags.append((i, metric, steps))
+            elif stat:
+                metric = stat.group('metric')
+                sizes.setdefault(metric, 0)
+                rolling.add(metric)
+                self._stats.append((i, metric, stat.group('stat')))
+            else:
+                self._current.append((i, col))
+
+        self.rings = {metric: MetricRing(size, lookback if metric in rolling else 0) for metric, size in sizes.items()}
+        self.warmup = max([ring.window for ring in self.rings.values()] +
+                          [steps + 1 for _, _, steps in self._lags] + [1])
+        self.vector = np.full(len(self.feature_cols), np.nan)
+
+    @property
+    def ready(self) -> bool:
+        """Whether every lag and rolling feature has enough history (training drops earlier rows)"""
+        return self.count >= self.warmup
+
+    def _prepare(self, window: Dict):
+        """
+        Validate one window and convert the values ingest() will store
+
+        Returns:
+            (timestamp, tracked metric values in ring order, current-column values)
+        """
+        window = derive_window(window)
+        missing = [metric for metric in self.rings if metric not in window]
+        if missing:
+            raise ValueError(f"Window is missing tracked metrics: {', '.join(missing)}")
+        try:
+            pushes = [float(window[metric]) for metric in self.rings]
+            current = [np.nan if window.get(col) is None else float(window[col]) for _, col in self._current]
+        except (TypeError, ValueError):
+            raise ValueError("Window metrics must be numeric") from None
+        return _timestamp(window.get('timestamp')), pushes, current
+
+    def _fill_gap(self, timestamp: Optional[datetime]):
+        """Push zero windows for minutes missing between the last window and this one"""
+        if timestamp is None:
+            return
+        if self.last_timestamp is not None:
+            elapsed = (timestamp - self.last_timestamp).total_seconds()
+            # Beyond the longest ring every slot is zero anyway
+            missing = min(int(round(elapsed / self.interval_s)) - 1, self.warmup)
+            for _ in range(max(missing, 0)):
+                for ring in self.rings.values():
+                    ring.push(0.0)
+                self.count += 1
+        self.last_timestamp = timestamp
+
+    def ingest(self, window: Dict) -> np.ndarray:
+        """
+        Add the newest aggregated window
+
+        Args:
+            window: Metrics for one window (see derive_window); needs every tracked metric
+                and, for gap filling, a timestamp
+
+        Returns:
+            Feature vector in feature_cols order (NaN where history is still missing)
+        """
+        return self.extend([window])
+
+    def extend(self, windows: List[Dict]) -> Optional[np.ndarray]:
+        """
+        Ingest several windows in order; returns the vector after the last one
+
+        The batch is all-or-nothing: every window is validated and converted
+        before the rings are touched, so a rejected window leaves the state as it was.
+        """
+        prepared = [self._prepare(window) for window in windows]
+        if not prepared:
+            return None
+
+        with self._lock:
+            previous = self.last_timestamp
+            for timestamp, _, _ in prepared:
+                if timestamp is None:
+                    continue
+                if previous is not None and timestamp <= previous:
+                    raise ValueError(f"Window {timestamp.isoformat()} is not newer than {previous.isoformat()}")
+                previous = timestamp
+
+            for timestamp, pushes, _ in prepared:
+                self._fill_gap(timestamp)
+                for ring, value in zip(self.rings.values(), pushes):
+                    ring.push(value)
+                self.count += 1
+
+            # Only the newest window's vector is returned, so it is built once per batch
+            vector = self.vector
+            for (i, _), value in zip(self._current, prepared[-1][2]):
+                vector[i] = value
+            for i, metric, steps in self._lags:
+                vector[i] = self.rings[metric].lag(steps)
+            for i, metric, stat in self._stats:
+                ring = self.rings[metric]
+                vector[i] = ring.mean() if stat == 'mean' else ring.std()
+            return vector.copy()
+
+    def features(self, vector: Optional[np.ndarray] = None) -> Dict[str, Optional[float]]:
+        """
+        Feature vector as a dict (None where history is still missing)
+
+        Args:
+            vector: An ingest() result (default: the latest vector)
+        """
+        if vector is None:
+            with self._lock:
+                vector = self.vector.copy()
+        return {col: (None if np.isnan(value) else float(value)) for col, value in zip(self.feature_cols, vector)}
@@ -0,0 +1,207 @@
+"""
+Prometheus Metrics for Model Serving
+Inference latency, batching, cache, model versions, feature freshness and routing decisions for /metrics
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Compiled routers answer in tens of microseconds, HTTP requests in milliseconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# Feature windows are aggregated per minute; anything past a few windows is stale
+FRESHNESS_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+def parse_timestamp(value: Any):
+    """
+    Epoch seconds for a payload timestamp, or None if it can't be read
+
+    Accepts epoch seconds, epoch milliseconds (Date.now() from the Node backend)
+    and ISO 8601 strings; naive ISO strings are taken as UTC.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return None
+
+class BatchObserver:
+    """Per-model callback for MicroBatcher: records one finished batch"""
+
+    def __init__(self, metrics: 'ServingMetrics', model: str):
+        self.inference = metrics.inference.labels(model)
+        self.batch_size = metrics.batch_size.labels(model)
+        self.queue_wait = metrics.queue_wait.labels(model)
+        self.errors = metrics.batch_errors.labels(model)
+
+    def __call__(self, size: int, waits: List[float], seconds: float, failed: bool):
+        self.inference.observe(seconds)
+        self.batch_size.observe(size)
+        for wait in waits:
+            self.queue_wait.observe(wait)
+        if failed:
+            self.errors.inc()
+
+class ServerCollector:
+    """
+    Reads gauges and counters the server already keeps, at scrape time
+
+    Queue depths, cache counters and loaded model versions cost nothing on the
+    request path this way.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def collect(self):
+        server = self.server
+
+        info = GaugeMetricFamily('ml_model_info', 'Loaded model version (value is always 1)',
+                                 labels=['model', 'version', 'model_type'])
+        generation = GaugeMetricFamily('ml_model_generation', 'Load counter of the model being served',
+                                       labels=['model'])
+        for name, bundle in list(server.bundles.items()):
+            info.add_metric([name, str(bundle.get('version') or 'local'), bundle['model_type']], 1)
+            generation.add_metric([name], bundle.get('generation', 0))
+        yield info
+        yield generation
+
+        depth = GaugeMetricFamily('ml_queue_depth', 'Requests waiting in the batcher queue', labels=['model'])
+        capacity = GaugeMetricFamily('ml_queue_capacity', 'Batcher queue size limit', labels=['model'])
+        rejected = CounterMetricFamily('ml_requests_rejected', 'Requests rejected with a full queue',
+                                       labels=['model'])
+        for name, batcher in list(server.batchers.items()):
+            depth.add_metric([name], batcher.queue.qsize())
+            capacity.add_metric([name], batcher.queue.maxsize)
+            rejected.add_metric([name], batcher.rejected)
+        yield depth
+        yield capacity
+        yield rejected
+
+        if server.cache is not None:
+            stats = server.cache.get_stats()
+            lookups = CounterMetricFamily('ml_cache_lookups', 'Prediction cache lookups', labels=['result'])
+            lookups.add_metric(['hit'], stats['hits'])
+            lookups.add_metric(['miss'], stats['misses'])
+            yield lookups
+            yield GaugeMetricFamily('ml_cache_hit_ratio', 'Prediction cache hits / lookups since start',
+                                    value=stats['hit_rate'])
+            yield GaugeMetricFamily('ml_cache_entries', 'Prediction cache entries', value=stats['size'])
+            yield CounterMetricFamily('ml_cache_evictions', 'Entries evicted by the LRU bound',
+                                      value=stats['evictions'])
+
+        if getattr(server, 'rate_limiter', None) is not None:
+            stats = server.rate_limiter.get_stats()
+            checks = CounterMetricFamily('ml_rate_limit_checks', 'Rate limit checks by result', labels=['result'])
+            checks.add_metric(['allowed'], stats['checks'] - stats['denied'])
+            checks.add_metric(['denied'], stats['denied'])
+            yield checks
+            yield GaugeMetricFamily('ml_rate_limit_clients', 'Clients with a token bucket', value=stats['clients'])
+            yield GaugeMetricFamily('ml_rate_limit_anomaly_level', 'Anomaly level tightening client limits (0-1)',
+                                    value=stats['anomaly_level'])
+
+        yield GaugeMetricFamily('ml_server_uptime_seconds', 'Seconds since the model server started',
+                                value=time.time() - server.started_at)
+
+class ServingMetrics:
+    """
+    Prometheus metrics for one ModelServer
+
+    Uses its own CollectorRegistry so several servers (or tests) in one process
+    don't collide on metric names.
+    """
+
+    def __init__(self, server=None, registry: CollectorRegistry = None):
+        """
+        Initialize metrics
+
+        Args:
+            server: ModelServer whose queues, cache and models are read at scrape time (optional)
+            registry: Registry to register with (default: a new one)
+        """
+        self.registry = registry or CollectorRegistry()
+        self.inference = Histogram('ml_inference_seconds', 'Model call time per batch', ['model'],
+                                   buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.batch_size = Histogram('ml_batch_size', 'Requests per model call', ['model'],
+                                    buckets=BATCH_SIZE_BUCKETS, registry=self.registry)
+        self.queue_wait = Histogram('ml_queue_wait_seconds', 'Time a request waited for its batch', ['model'],
+                                    buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.batch_errors = Counter('ml_batch_errors', 'Batches whose model call raised', ['model'],
+                                    registry=self.registry)
+        self.request_latency = Histogram('ml_request_seconds', 'End-to-end HTTP request time',
+                                         ['endpoint', 'status'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.feature_lag = Histogram('ml_feature_freshness_seconds',
+                                     'Age of the feature window (payload timestamp) at prediction time', ['model'],
+                                     buckets=FRESHNESS_BUCKETS, registry=self.registry)
+        self.route_decisions = Counter('ml_route_decisions', 'Routing decisions per backend server',
+                                       ['model', 'backend'], registry=self.registry)
+        self.policy_scale_factor = Gauge('ml_policy_scale_factor', 'Last recommended scale factor',
+                                         registry=self.registry)
+        self.policy_rate_limit = Gauge('ml_policy_rate_limit', 'Last recommended rate limit',
+                                       registry=self.registry)
+        self.policy_replicas = Gauge('ml_policy_replicas', 'Replicas planned by the capacity planner',
+                                     registry=self.registry)
+        self.policy_decisions = Counter('ml_policy_decisions', 'Policy recommendations by anomaly state',
+                                        ['anomaly'], registry=self.registry)
+        if server is not None:
+            self.registry.register(ServerCollector(server))
+
+    def batch_observer(self, model: str) -> BatchObserver:
+        """Callback for a model's MicroBatcher (label children bound once)"""
+        return BatchObserver(self, model)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float):
+        """Record one HTTP request"""
+        self.request_latency.labels(endpoint, str(status)).observe(seconds)
+
+    def observe_freshness(self, model: str, payloads: Iterable[Dict], now: float = None):
+        """Record how old each payload's feature window is (payloads without 'timestamp' are skipped)"""
+        child = None
+        for payload in payloads:
+            timestamp = parse_timestamp(payload.get('timestamp'))
+            if timestamp is None:
+                continue
+            if child is None:
+                child = self.feature_lag.labels(model)
+                now = now or time.time()
+            child.observe(max(0.0, now - timestamp))
+
+    def observe_routes(self, model: str, results: Iterable[Dict]):
+        """Count routing decisions per chosen backend"""
+        for result in results:
+            self.route_decisions.labels(model, result['server']).inc()
+
+    def observe_matrix(self, model: str, server_ids, seconds: float):
+        """Record a columnar batch routed outside the micro-batcher"""
+        self.inference.labels(model).observe(seconds)
+        self.batch_size.labels(model).observe(len(server_ids))
+        labels, counts = np.unique(np.asarray(server_ids), return_counts=True)
+        for label, count in zip(labels, counts):
+            self.route_decisions.labels(model, f"server_{label}").inc(int(count))
+
+    def observe_policy(self, policy: Dict, anomaly: Dict = None):
+        """Record a /predict scaling and rate-limit recommendation"""
+        self.policy_scale_factor.set(policy['scale_factor'])
+        self.policy_rate_limit.set(policy['rate_limit'])
+        if 'replicas' in policy:
+            self.policy_replicas.set(policy['replicas'])
+        state = 'unknown' if anomaly is None else ('anomaly' if anomaly['is_anomaly'] else 'normal')
+        self.policy_decisions.labels(state).inc()
+
+    def render(self):
+        """Exposition body and content type for /metrics"""
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,274 @@
+"""
+Versioned Model Registry
+Stores trained artifacts per model and version, with an atomic CURRENT pointer for promotion and rollback
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+REGISTRY_DIR = os.path.join(ML_ROOT, 'registry')
+
+# Files copied from a training directory (anything missing is skipped)
+ARTIFACTS = ('model.pkl', 'scaler.pkl', 'feature_cols.json', 'metrics.json', 'training_state.json', 'hst.npz',
+             'lstm_model.h5', 'lstm_weights.npz', 'lstm_runtime.json', 'config.json')
+ARTIFACT_DIRS = ('compiled', 'students')
+
+# Model names and versions become path components: no separators, no '..', no hidden entries
+_SAFE_NAME = re.compile(r'^\w[\w.-]*$')
+
+class RegistryError(Exception):
+    """Raised for unknown models/versions or invalid registry operations"""
+
+def _check_name(value, kind):
+    """Reject model names/versions that could escape the registry directory"""
+    if not isinstance(value, str) or not _SAFE_NAME.match(value) or '..' in value:
+        raise RegistryError(f"Invalid {kind}: {value!r}")
+    return value
+
+def _file_sha256(path):
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json_atomic(path, data):
+    """Write JSON via a temp file and os.replace (readers never see a partial file)"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class ModelRegistry:
+    """
+    File-system model registry
+
+    Layout:
+        <root>/<model>/<version>/        artifacts + metadata.json (immutable once published)
+        <root>/<model>/CURRENT.json      active version and promotion history
+    """
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        """
+        Initialize registry
+
+        Args:
+            root: Registry directory (created on first register)
+        """
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _model_dir(self, name):
+        return os.path.join(self.root, _check_name(name, 'model name'))
+
+    def _pointer_file(self, name):
+        return os.path.join(self._model_dir(name), 'CURRENT.json')
+
+    def list_models(self):
+        """Names of registered models"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root)
+                      if _SAFE_NAME.match(d) and os.path.isdir(os.path.join(self.root, d)))
+
+    def list_versions(self, name):
+        """Published versions of a model, oldest first"""
+        model_dir = self._model_dir(name)
+        if not os.path.isdir(model_dir):
+            return []
+        return sorted(d for d in os.listdir(model_dir)
+                      if d.startswith('v') and os.path.isfile(os.path.join(model_dir, d, 'metadata.json')))
+
+    def version_dir(self, name, version):
+        """Directory of a published version"""
+        path = os.path.join(self._model_dir(name), _check_name(version, 'version'))
+        if not os.path.isfile(os.path.join(path, 'metadata.json')):
+            raise RegistryError(f"Unknown version: {name}/{version}")
+        return path
+
+    def metadata(self, name, version):
+        """Metadata of a published version"""
+        with open(os.path.join(self.version_dir(name, version), 'metadata.json'), 'r') as f:
+            return json.load(f)
+
+    def _read_pointer(self, name):
+        path = self._pointer_file(name)
+        if not os.path.exists(path):
+            return {'current': None, 'history': []}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def current(self, name):
+        """Active version of a model (None if never promoted)"""
+        return self._read_pointer(name)['current']
+
+    def register(self, name, source_dir, promote=False, notes=None):
+        """
+        Copy a training directory's artifacts into a new version
+
+        Files are staged in a temp directory and published with one rename,
+        so a half-copied version is never visible.
+
+        Args:
+            name: Model name (e.g. 'random-forest')
+            source_dir: Directory the trainer wrote model.pkl etc. into
+            promote: Make the new version current
+            notes: Optional free-text note stored in metadata
+
+        Returns:
+            New version string (e.g. 'v0003')
+        """
+        if not any(os.path.exists(os.path.join(source_dir, f)) for f in ('model.pkl', 'lstm_model.h5', 'lstm_weights.npz')):
+            raise RegistryError(f"No model artifacts found in: {source_dir}")
+
+        model_dir = self._model_dir(name)
+        os.makedirs(model_dir, exist_ok=True)
+
+        staging = tempfile.mkdtemp(dir=model_dir, prefix='.staging-')
+        try:
+            files = {}
+            for artifact in ARTIFACTS:
+                src = os.path.join(source_dir, artifact)
+                if os.path.exists(src):
+                    shutil.copy2(src, os.path.join(staging, artifact))
+                    files[artifact] = _file_sha256(src)
+            for artifact_dir in ARTIFACT_DIRS:
+                src = os.path.join(source_dir, artifact_dir)
+                if os.path.isdir(src):
+                    shutil.copytree(src, os.path.join(staging, artifact_dir))
+
+            metrics = {}
+            metrics_file = os.path.join(source_dir, 'metrics.json')
+            if os.path.exists(metrics_file):
+                with open(metrics_file, 'r') as f:
+                    metrics = {k: v for k, v in json.load(f).items() if isinstance(v, (int, float))}
+
+            with self._lock:
+                versions = self.list_versions(name)
+                version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+                _write_json_atomic(os.path.join(staging, 'metadata.json'), {
+                    'name': name,
+                    'version': version,
+                    'created_at': datetime.now().isoformat(timespec='seconds'),
+                    'source_dir': os.path.abspath(source_dir),
+                    'files': files,
+                    'metrics': metrics,
+                    'notes': notes
+                })
+                os.rename(staging, os.path.join(model_dir, version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        print(f"📦 Registered {name} {version}")
+        if promote:
+            self.promote(name, version)
+        return version
+
+    def promote(self, name, version):
+        """Make a version current (atomic pointer swap)"""
+        self.version_dir(name, version)
+
+        with self._lock:
+            pointer = self._read_pointer(name)
+            if pointer['current'] == version:
+                return version
+            if pointer['current'] is not None:
+                pointer['history'].append(pointer['current'])
+            pointer['current'] = version
+            pointer['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            _write_json_atomic(self._pointer_file(name), pointer)
+
+        print(f"🚀 {name}: {version} is now current")
+        return version
+
+    def rollback(self, name):
+        """
+        Re-activate the previously current version
+
+        Returns:
+            Version now current
+        """
+        with self._lock:
+            pointer = self._read_pointer(name)
+            if not pointer['history']:
+                raise RegistryError(f"No earlier version of {name} to roll back to")
+            pointer['current'] = pointer['history'].pop()
+            pointer['updated_at'] = datetime.now().isoformat(timespec='seconds')
+            _write_json_atomic(self._pointer_file(name), pointer)
+
+        print(f"↩️ {name}: rolled back to {pointer['current']}")
+        return pointer['current']
+
+    def verify(self, name, version):
+        """Check a version's files against the recorded SHA-256 digests"""
+        path = self.version_dir(name, version)
+        expected = self.metadata(name, version)['files']
+        return all(_file_sha256(os.path.join(path, f)) == digest for f, digest in expected.items())
+
+def main():
+    """Registry command line"""
+    parser = argparse.ArgumentParser(description='Manage versioned model artifacts')
+    parser.add_argument('--root', default=REGISTRY_DIR, help='Registry directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = subparsers.add_parser('register', help='Register a trained model directory')
+    register_parser.add_argument('name', help="Model name ('random-forest', 'xgboost', 'anomaly', 'lstm')")
+    register_parser.add_argument('source_dir', help='Directory containing model.pkl etc.')
+    register_parser.add_argument('--promote', action='store_true', help='Make the new version current')
+    register_parser.add_argument('--notes', help='Free-text note')
+
+    promote_parser = subparsers.add_parser('promote', help='Make a version current')
+    promote_parser.add_argument('name')
+    promote_parser.add_argument('version')
+
+    rollback_parser = subparsers.add_parser('rollback', help='Re-activate the previous version')
+    rollback_parser.add_argument('name')
+
+    list_parser = subparsers.add_parser('list', help='List models and versions')
+    list_parser.add_argument('name', nargs='?')
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.root)
+
+    try:
+        if args.command == 'register':
+            registry.register(args.name, args.source_dir, promote=args.promote, notes=args.notes)
+        elif args.command == 'promote':
+            registry.promote(args.name, args.version)
+        elif args.command == 'rollback':
+            registry.rollback(args.name)
+        else:
+            for name in [args.name] if args.name else registry.list_models():
+                current = registry.current(name)
+                print(f"\n📦 {name}")
+                for version in registry.list_versions(name):
+                    metadata = registry.metadata(name, version)
+                    marker = '→' if version == current else ' '
+                    print(f"   {marker} {version}  {metadata['created_at']}  {metadata['metrics']}")
+    except RegistryError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1069 @@
+"""
+Model Server for AI Load Balancing
+Long-running Flask service on :5000 that loads models once and micro-batches concurrent requests
+"""
+
+import argparse
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import wraps
+
+import joblib
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from deployment import columnar
+from deployment.batching import LatencyTracker, MicroBatcher, QueueFullError
+from deployment.capacity_planner import (CAPACITY_FILE, DEFAULT_RATE_LIMIT, MAX_SCALE_FACTOR, MIN_SCALE_FACTOR,
+                                         TARGET_UTILIZATION, CapacityPlanner, current_demand)
+from deployment.compiled_trees import CompiledEnsemble
+from deployment.distill import STUDENTS_DIR, load_student
+from deployment.feature_state import DEFAULT_LOOKBACK, FeatureState
+from deployment.metrics import ServingMetrics
+from deployment.model_registry import REGISTRY_DIR, ModelRegistry, RegistryError
+from deployment.prediction_cache import PredictionCache, parse_quantization
+from deployment.rate_limiter import (DEFAULT_LIMIT, DEFAULT_MAX_CLIENTS, AdaptiveRateLimiter, client_key,
+                                     validate_costs)
+from utils.module_loader import load_module
+
+predict = load_module('models/3_random_forest/predict.py')
+lstm_predict = load_module('models/5_lstm/predict.py')
+anomaly_detect = load_module('models/6_anomaly_detection/detect.py')
+
+MODELS_DIR = os.path.join(ML_ROOT, 'models')
+# Without --admin-token, /admin/* only answers requests from the same host
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+class ModelNotLoadedError(LookupError):
+    """Raised when a request targets a model that isn't loaded"""
+
+def _strip_feature_names(estimator):
+    """
+    Drop feature names recorded at fit time
+
+    Scalers were fitted on DataFrames but the server passes arrays already in
+    feature_cols order; without this every transform() emits a warning.
+    """
+    if hasattr(estimator, 'feature_names_in_'):
+        del estimator.feature_names_in_
+    return estimator
+
+def load_classifier(model_dir, use_compiled=False, mmap=False, student=None):
+    """
+    Load a trained classifier (model.pkl, scaler.pkl, feature_cols.json)
+
+    Args:
+        model_dir: Model directory
+        use_compiled: Also load compiled node arrays from <model_dir>/compiled if up to date
+        mmap: Memory-map NumPy arrays stored in the pickles (read-only, shared page cache)
+        student: Route with the distilled student <model_dir>/students/<student> instead
+            of the compiled teacher (deployment/distill.py; ignored if missing or stale)
+
+    Returns:
+        Dict bundle, or None if the artifacts don't exist
+    """
+    model_file = os.path.join(model_dir, 'model.pkl')
+    if not os.path.exists(model_file):
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    model = joblib.load(model_file, mmap_mode=mmap_mode)
+    scaler = _strip_feature_names(joblib.load(os.path.join(model_dir, 'scaler.pkl'), mmap_mode=mmap_mode))
+    with open(os.path.join(model_dir, 'feature_cols.json'), 'r') as f:
+        feature_cols = json.load(f)
+
+    # Batches are small; thread fan-out and progress logging cost more than they save
+    params = model.get_params()
+    if 'n_jobs' in params:
+        model.set_params(n_jobs=1)
+    if 'verbose' in params and params['verbose']:
+        model.set_params(verbose=0)
+
+    bundle = {
+        'model': model,
+        'scaler': scaler,
+        'feature_cols': feature_cols,
+        'model_dir': model_dir,
+        'model_type': type(model).__name__
+    }
+
+    if student:
+        bundle['compiled'] = load_distilled(model_dir, model_file, student)
+        if bundle['compiled'] is not None:
+            bundle['model_type'] += f' (student {student})'
+    if use_compiled and bundle.get('compiled') is None:
+        bundle['compiled'] = load_compiled(model_dir, model_file)
+        if bundle['compiled'] is not None:
+            bundle['model_type'] += ' (compiled)'
+
+    return bundle
+
+def load_compiled(model_dir, model_file):
+    """
+    Load compiled node arrays exported by deployment/compiled_trees.py
+
+    Returns:
+        CompiledEnsemble, or None if missing or older than model.pkl
+    """
+    meta_file = os.path.join(model_dir, 'compiled', 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    if os.path.getmtime(meta_file) < os.path.getmtime(model_file):
+        print(f"   ⚠️ {model_dir}/compiled is older than model.pkl, re-run compiled_trees.py")
+        return None
+    return CompiledEnsemble.load(os.path.dirname(meta_file))
+
+def load_distilled(model_dir, model_file, student):
+    """
+    Load a student exported by deployment/distill.py
+
+    Returns:
+        CompiledEnsemble or LinearStudent, or None if missing or older than model.pkl
+    """
+    student_dir = os.path.join(model_dir, STUDENTS_DIR, student)
+    meta_file = os.path.join(student_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        print(f"   ⚠️ No student '{student}' in {model_dir}, run distill.py")
+        return None
+    if os.path.getmtime(meta_file) < os.path.getmtime(model_file):
+        print(f"   ⚠️ {student_dir} is older than model.pkl, re-run distill.py")
+        return None
+    return load_student(student_dir)
+
+def load_forecaster(model_dir):
+    """
+    Load the LSTM forecaster (exported NumPy weights, or lstm_model.h5 + scaler.pkl)
+
+    Uses the TensorFlow-free runtime when lstm_weights.npz exists and falls back
+    to lstm_model.h5 through Keras otherwise.
+
+    Returns:
+        Dict bundle, or None if the artifacts (or TensorFlow, for .h5 only) are missing
+    """
+    model_file = os.path.join(model_dir, 'lstm_model.h5')
+    has_weights = os.path.exists(os.path.join(model_dir, lstm_predict.numpy_lstm.WEIGHTS_FILE))
+    if not has_weights and not os.path.exists(model_file):
+        return None
+
+    if has_weights:
+        model, scaler, seq_length = lstm_predict.load_model(model_dir)
+        model_type = 'LSTM (NumPy)'
+    else:
+        try:
+            from tensorflow import keras
+        except ImportError:
+            print("⚠️ TensorFlow not installed and no exported weights, LSTM forecasting disabled")
+            return None
+        model, model_type = keras.models.load_model(model_file, compile=False), 'LSTM'
+        scaler = _strip_feature_names(joblib.load(os.path.join(model_dir, 'scaler.pkl')))
+        with open(os.path.join(model_dir, 'config.json'), 'r') as f:
+            seq_length = json.load(f)['seq_length']
+
+    return {
+        'model': model,
+        'scaler': scaler,
+        'seq_length': seq_length,
+        'sequence_features': lstm_predict.load_sequence_features(model_dir),
+        'model_dir': model_dir,
+        'model_type': model_type
+    }
+
+def route_matrix(bundle, X):
+    """
+    Routing decisions for a raw feature matrix in feature_cols order
+
+    Returns:
+        (classes, server_ids, probabilities)
+    """
+    compiled = bundle.get('compiled')
+    if compiled is not None:
+        # Scaler is folded into the compiled thresholds: raw features go straight in
+        probabilities = compiled.predict_proba(X)
+        classes = compiled.classes_
+    else:
+        probabilities = bundle['model'].predict_proba(bundle['scaler'].transform(X))
+        classes = bundle['model'].classes_
+    return classes, classes[probabilities.argmax(axis=1)], probabilities
+
+def route_batch(bundle, payloads):
+    """Routing decisions for a batch: one predict_proba pass, argmax per row"""
+    _, server_ids, probabilities = route_matrix(bundle, predict.build_feature_matrix(payloads, bundle['feature_cols']))
+
+    return [
+        {
+            'server_id': int(server_id),
+            'server': f"server_{server_id}",
+            'confidence': float(row.max()),
+            'probabilities': row.tolist()
+        }
+        for server_id, row in zip(server_ids, probabilities)
+    ]
+
+def anomaly_batch(bundle, payloads):
+    """Anomaly scores for a batch: one score_samples pass (decision = score - offset)"""
+    model = bundle['compiled'] if bundle.get('compiled') is not None else bundle['model']
+    scores, flags = anomaly_detect.score_windows(model, bundle['scaler'], payloads, bundle['feature_cols'])
+
+    return [
+        {'anomaly_score': float(score), 'is_anomaly': bool(flag)}
+        for score, flag in zip(scores, flags)
+    ]
+
+def forecast_result(row):
+    """Response fields for one series' forecasts (index 0 = next minute)"""
+    return {
+        'predicted_request_count': float(row[0]),
+        'peak_request_count': float(row.max()),
+        'forecast': row.tolist()
+    }
+
+def forecast_batch(bundle, payloads):
+    """Multi-horizon load forecasts for a batch of sequences (one forward pass)"""
+    predicted = lstm_predict.predict_batch(
+        bundle['model'], bundle['scaler'], [p['sequence'] for p in payloads], bundle['seq_length']
+    )
+
+    return [forecast_result(row) for row in predicted]
+
+def sequence_matches(sequence, bundle):
+    """Whether every step of a /predict sequence has the LSTM's input shape (plain counts only for 1-feature models)"""
+    n_features = len(bundle['sequence_features'])
+    for step in sequence:
+        if isinstance(step, (list, tuple)):
+            if len(step) != n_features:
+                return False
+        elif n_features != 1:
+            return False
+    return True
+
+def recommend_policy(metrics, forecast=None, anomaly=None, sequence_features=('request_count',)):
+    """
+    Turn metrics and model outputs into a scaling and rate-limit policy
+
+    Args:
+        metrics: Dict sent by the backend (cpuUsage = 1-min load average, memoryUsage = %)
+        forecast: Forecast result for metrics['sequence'] (optional)
+        anomaly: Anomaly result for the current window (optional)
+        sequence_features: LSTM input columns, to find request_count in sequence rows
+
+    Returns:
+        Dict with scale_factor and rate_limit
+    """
+    if forecast is not None and metrics.get('sequence'):
+        # Scale ahead of the highest load expected within the forecast horizon
+        current = max(current_demand({'sequence': metrics['sequence']}, sequence_features), 1.0)
+        scale_factor = forecast.get('peak_request_count', forecast['predicted_request_count']) / current
+    else:
+        cpu_utilization = float(metrics.get('cpuUsage', 0)) / (os.cpu_count() or 1)
+        memory_utilization = float(metrics.get('memoryUsage', 0)) / 100
+        scale_factor = max(cpu_utilization, memory_utilization) / TARGET_UTILIZATION
+
+    rate_limit = DEFAULT_RATE_LIMIT
+    if anomaly is not None and anomaly['is_anomaly']:
+        rate_limit = DEFAULT_RATE_LIMIT // 2
+
+    return {
+        'scale_factor': round(min(MAX_SCALE_FACTOR, max(MIN_SCALE_FACTOR, scale_factor)), 2),
+        'rate_limit': rate_limit
+    }
+
+class ModelServer:
+    """Holds loaded models and one micro-batcher per model"""
+
+    ROUTERS = {'random-forest': '3_random_forest', 'xgboost': '4_xgboost'}
+    MODEL_FOLDERS = dict(ROUTERS, anomaly='6_anomaly_detection', lstm='5_lstm')
+    BATCH_FUNCTIONS = {'random-forest': route_batch, 'xgboost': route_batch,
+                       'anomaly': anomaly_batch, 'lstm': forecast_batch}
+
+    def __init__(self, models_dir=MODELS_DIR, default_router='random-forest', max_batch_size=64,
+                 max_wait_ms=2.0, max_queue_size=1024, request_timeout=1.0, use_compiled=True,
+                 registry=None, warmup_rounds=3, cache=None, student=None, metrics=True,
+                 feature_lookback=DEFAULT_LOOKBACK, planner=None, rate_limiter=None):
+        """
+        Initialize server
+
+        Args:
+            models_dir: Directory containing the numbered model folders
+            default_router: Routing model used by /predict/route and /batch-predict
+            max_batch_size: Maximum requests per model call
+            max_wait_ms: Time budget for filling a batch
+            max_queue_size: Pending requests per model before returning 503
+            request_timeout: Seconds a request waits for its result before returning 504
+            use_compiled: Route with compiled node arrays when a fresh export exists
+            registry: ModelRegistry to load current versions from (models_dir is the fallback)
+            warmup_rounds: Predictions run on a new model before it is swapped in
+            cache: PredictionCache consulted before queueing (None = no caching)
+            student: Distilled student name routers serve instead of the compiled teacher
+            metrics: Collect Prometheus metrics for /metrics
+            feature_lookback: Rolling window of the online feature streams (training lookback)
+            planner: CapacityPlanner behind /predict (None = stateless recommend_policy)
+            rate_limiter: AdaptiveRateLimiter behind /ratelimit/check, fed by /detect/anomaly/stream
+        """
+        self.models_dir = models_dir
+        self.default_router = default_router
+        self.batch_config = {
+            'max_batch_size': max_batch_size,
+            'max_wait_ms': max_wait_ms,
+            'max_queue_size': max_queue_size
+        }
+        self.request_timeout = request_timeout
+        self.use_compiled = use_compiled
+        self.student = student
+        self.registry = registry
+        self.warmup_rounds = warmup_rounds
+        self.cache = cache
+        self._generation = 0
+        self.bundles = {}
+        self.batchers = {}
+        self.recent_payloads = {}
+        self.endpoint_latency = {}
+        self.started_at = time.time()
+        self.streams = OrderedDict()
+        self.max_streams = 1024
+        self._stream_lock = threading.Lock()
+        self.feature_lookback = feature_lookback
+        self.planner = planner
+        self.rate_limiter = rate_limiter
+        self.feature_states = OrderedDict()
+        self._feature_lock = threading.Lock()
+        self._anomaly_stream_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self.metrics = ServingMetrics(self) if metrics else None
+
+    def _load_bundle(self, name, version=None):
+        """
+        Load one model from the registry (if it has a current version) or models_dir
+
+        Args:
+            name: Model name
+            version: Registry version (default: current)
+        """
+        model_dir, mmap = os.path.join(self.models_dir, self.MODEL_FOLDERS[name]), False
+        if self.registry is not None:
+            version = version or self.registry.current(name)
+            if version is not None:
+                model_dir, mmap = self.registry.version_dir(name, version), True
+
+        if name == 'lstm':
+            bundle = load_forecaster(model_dir)
+        else:
+            bundle = load_classifier(model_dir, use_compiled=self.use_compiled, mmap=mmap,
+                                     student=self.student if name in self.ROUTERS else None)
+        if bundle is not None:
+            bundle['version'] = version
+        if name == 'anomaly' and bundle is not None:
+            hst_file = os.path.join(model_dir, anomaly_detect.HST_FILE)
+            bundle['hst'] = anomaly_detect.HalfSpaceTrees.load(hst_file) if os.path.exists(hst_file) else None
+        return bundle
+
+    def _warm_up(self, name, bundle):
+        """
+        Run predictions on a freshly loaded model before it takes traffic
+
+        Uses recently served payloads (or a zero row) so page faults on memory-mapped
+        arrays and first-call allocations happen here, not on a live request.
+
+        Returns:
+            Warm-up time in milliseconds
+        """
+        payloads = list(self.recent_payloads.get(name, ()))
+        if not payloads:
+            if 'seq_length' in bundle:
+                step = [0.0] * len(bundle['sequence_features'])
+                payloads = [{'sequence': [step] * bundle['seq_length']}]
+            else:
+                payloads = [{col: 0.0 for col in bundle['feature_cols']}]
+
+        start = time.perf_counter()
+        for _ in range(self.warmup_rounds):
+            self.BATCH_FUNCTIONS[name](bundle, payloads)
+        return (time.perf_counter() - start) * 1000
+
+    def _add_model(self, name, bundle):
+        """Register a loaded model and start its batcher"""
+        if bundle is None:
+            print(f"   ⚠️ {name}: no trained model found")
+            return
+
+        # Generation token keys the prediction cache: results from a replaced model never hit
+        self._generation += 1
+        bundle['generation'] = self._generation
+        self.bundles[name] = bundle
+        if self.cache is not None:
+            self.cache.invalidate(name)
+        self.recent_payloads.setdefault(name, deque(maxlen=32))
+        if name not in self.batchers:
+            batch_fn = self.BATCH_FUNCTIONS[name]
+            # Look the bundle up per batch so a reload swaps models between batches
+            self.batchers[name] = MicroBatcher(
+                name, lambda payloads: batch_fn(self.bundles[name], payloads), **self.batch_config,
+                observer=self.metrics.batch_observer(name) if self.metrics is not None else None
+            ).start()
+
+        version = f" {bundle['version']}" if bundle.get('version') else ''
+        print(f"   ✅ {name}{version}: {bundle['model_type']} from {bundle['model_dir']}")
+
+    def load(self):
+        """Load every available model once"""
+        source = self.registry.root if self.registry is not None else self.models_dir
+        print(f"📖 Loading models from: {source}")
+
+        for name in self.MODEL_FOLDERS:
+            self._add_model(name, self._load_bundle(name))
+
+        if self.default_router not in self.bundles:
+            self.default_router = next((name for name in self.ROUTERS if name in self.bundles), None)
+
+        return self
+
+    def reload(self, name, version=None):
+        """
+        Load, warm up and atomically swap in a model version
+
+        The old model keeps serving until the new one has answered warm-up
+        predictions; a failed load or warm-up leaves the old model in place.
+
+        Args:
+            name: Model name
+            version: Registry version (default: the registry's current version)
+
+        Returns:
+            Dict describing the swap
+        """
+        if name not in self.MODEL_FOLDERS:
+            raise ModelNotLoadedError(name)
+
+        with self._reload_lock:
+            previous = self.bundles.get(name, {}).get('version')
+            start = time.perf_counter()
+            bundle = self._load_bundle(name, version)
+            if bundle is None:
+                raise ModelNotLoadedError(f"{name} {version or ''}".strip())
+            load_ms = (time.perf_counter() - start) * 1000
+            warmup_ms = self._warm_up(name, bundle)
+
+            self._add_model(name, bundle)
+            if self.default_router is None and name in self.ROUTERS:
+                self.default_router = name
+
+        print(f"🔄 {name}: {previous} → {bundle['version']} (load {load_ms:.0f} ms, warm-up {warmup_ms:.0f} ms)")
+        return {'model': name, 'previous_version': previous, 'version': bundle['version'],
+                'load_ms': load_ms, 'warmup_ms': warmup_ms}
+
+    def rollback(self, name):
+        """Roll the registry back to the previous version and swap it in"""
+        if self.registry is None:
+            raise ValueError("Rollback needs a model registry (--registry)")
+        version = self.registry.rollback(name)
+        return self.reload(name, version)
+
+    def check_for_updates(self):
+        """Reload any model whose registry CURRENT pointer moved"""
+        swaps = []
+        for name in self.MODEL_FOLDERS:
+            current = self.registry.current(name)
+            if current is not None and current != self.bundles.get(name, {}).get('version'):
+                try:
+                    swaps.append(self.reload(name, current))
+                except Exception as e:
+                    print(f"❌ {name}: failed to load {current}, keeping current model ({e})")
+        return swaps
+
+    def watch_registry(self, interval=5.0):
+        """Poll the registry in a background thread and hot-reload promoted versions"""
+        def poll():
+            while not self._watch_stop.wait(interval):
+                self.check_for_updates()
+
+        threading.Thread(target=poll, name='registry-watch', daemon=True).start()
+        return self
+
+    def predict(self, name, payloads):
+        """
+        Run payloads through a model's batcher
+
+        Raises:
+            ModelNotLoadedError: Model not loaded
+            ValueError: Invalid payload (checked before queueing so one bad request can't fail a batch)
+            QueueFullError: Batcher queue at capacity
+            FutureTimeoutError: Result not ready within request_timeout
+        """
+        if name not in self.batchers:
+            raise ModelNotLoadedError(name)
+
+        bundle = self.bundles[name]
+        seq_length = bundle.get('seq_length')
+        for payload in payloads:
+            if not isinstance(payload, dict):
+                raise ValueError("Each instance must be a JSON object")
+            if seq_length and len(payload.get('sequence') or []) < seq_length:
+                raise ValueError(f"'sequence' must contain at least {seq_length} steps")
+
+        self.recent_payloads[name].extend(payloads[-4:])
+        if self.metrics is not None:
+            self.metrics.observe_freshness(name, payloads)
+
+        if self.cache is None:
+            batcher = self.batchers[name]
+            futures = [batcher.submit(payload) for payload in payloads]
+            results = [future.result(self.request_timeout) for future in futures]
+        else:
+            keys = [self._cache_key(name, bundle, payload) for payload in payloads]
+            results = [self.cache.get(key) for key in keys]
+            misses = [i for i, result in enumerate(results) if result is None]
+            if misses:
+                batcher = self.batchers[name]
+                futures = [(i, batcher.submit(payloads[i])) for i in misses]
+                for i, future in futures:
+                    results[i] = future.result(self.request_timeout)
+                    self.cache.put(keys[i], results[i])
+
+        if self.metrics is not None and name in self.ROUTERS:
+            self.metrics.observe_routes(name, results)
+        return results
+
+    def route_columns(self, name, X, columns):
+        """
+        Route a decoded columnar batch in one model call
+
+        The batch is already vectorized, so it skips the micro-batcher queue and the
+        prediction cache.
+
+        Args:
+            name: Router name
+            X: Matrix with one column per name in columns
+            columns: Column names sent by the client (reordered to the model's feature_cols)
+
+        Returns:
+            (classes, server_ids, probabilities)
+        """
+        if name not in self.ROUTERS:
+            raise ValueError(f"Columnar batches are for routers ({', '.join(sorted(self.ROUTERS))}), not '{name}'")
+        bundle = self.bundles.get(name)
+        if bundle is None:
+            raise ModelNotLoadedError(name)
+        if len(X) == 0:
+            raise ValueError("Columnar batch has no rows")
+
+        start = time.perf_counter()
+        result = route_matrix(bundle, columnar.to_feature_matrix(X, columns, bundle['feature_cols']))
+        if self.metrics is not None:
+            self.metrics.observe_matrix(name, result[1], time.perf_counter() - start)
+        return result
+
+    def _cache_key(self, name, bundle, payload):
+        """Prediction cache key for one payload under the bundle's generation"""
+        if 'seq_length' in bundle:
+            # Multi-feature steps are rows; key on all their values
+            window = np.ravel(np.asarray(payload['sequence'][-bundle['seq_length']:], dtype=np.float64))
+            return self.cache.make_sequence_key(name, bundle['generation'], window)
+        return self.cache.make_key(name, bundle['generation'], payload, bundle['feature_cols'])
+
+    def stream_forecast(self, stream_id, values):
+        """
+        Feed new per-minute values into a stateful forecast stream
+
+        Each value costs one batched LSTM cell update instead of a full-window pass.
+        Streams are kept per id (least recently used dropped beyond max_streams) and
+        restart when the LSTM is reloaded.
+
+        Args:
+            stream_id: Caller-chosen series id (e.g. a backend instance)
+            values: Request counts (or feature rows) since the last call, oldest first
+
+        Returns:
+            Dict with the stream's update count and forecast (None until seq_length values were seen)
+        """
+        bundle = self.bundles.get('lstm')
+        if bundle is None:
+            raise ModelNotLoadedError('lstm')
+        if not getattr(bundle['model'], 'streamable', False):
+            raise ValueError("Streaming forecasts need the exported NumPy LSTM weights")
+
+        with self._stream_lock:
+            entry = self.streams.get(stream_id)
+            if entry is None or entry[0] != bundle['generation']:
+                entry = (bundle['generation'],
+                         lstm_predict.StreamingForecaster(bundle['model'], bundle['scaler'], bundle['seq_length']))
+                self.streams[stream_id] = entry
+            self.streams.move_to_end(stream_id)
+            while len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+
+            stream = entry[1]
+            forecast = stream.extend(values)
+            if forecast is None:
+                forecast = stream.last_forecast
+
+        return {
+            'stream': stream_id,
+            'updates': stream.count,
+            'warming_up': forecast is None,
+            **(forecast_result(forecast) if forecast is not None else {})
+        }
+
+    def stream_features(self, stream_id, windows, route=False):
+        """
+        Feed aggregated windows into an online feature stream
+
+        Lags and rolling statistics are kept in ring buffers per stream (see
+        feature_state.py), so callers only send the newest window's metrics.
+        Streams follow the default router's feature_cols (least recently used
+        dropped beyond max_streams) and restart if those columns change.
+
+        Args:
+            stream_id: Caller-chosen series id (e.g. a backend instance)
+            windows: Window metric dicts since the last call, oldest first
+            route: Also route the resulting feature vector once the stream is warm
+
+        Returns:
+            Dict with the stream's update count, features and (with route) the routing decision
+        """
+        name = self.default_router
+        bundle = self.bundles.get(name) if name else None
+        if bundle is None:
+            raise ModelNotLoadedError(name or 'router')
+
+        feature_cols = list(bundle['feature_cols'])
+        with self._feature_lock:
+            state = self.feature_states.get(stream_id)
+            if state is None or state.feature_cols != feature_cols:
+                state = FeatureState(feature_cols, lookback=self.feature_lookback)
+            # extend() is all-or-nothing, so a rejected batch leaves the stream (or its absence) as it was
+            vector = state.extend(windows)
+            self.feature_states[stream_id] = state
+            self.feature_states.move_to_end(stream_id)
+            while len(self.feature_states) > self.max_streams:
+                self.feature_states.popitem(last=False)
+            updates, ready = state.count, state.ready
+
+        features = state.features(vector)
+        result = {
+            'stream': stream_id,
+            'updates': updates,
+            'warming_up': not ready,
+            'features': features
+        }
+        if route and ready:
+            # Columns the window didn't carry are 0, as for /predict/route
+            result['prediction'] = self.predict(name, [{col: value or 0.0 for col, value in features.items()}])[0]
+        return result
+
+    def stream_anomaly(self, windows):
+        """
+        Score just-closed windows and let the Half-Space Trees learn from them
+
+        Unlike /detect/anomaly (stateless, cacheable), every call updates the
+        streaming detector, so each window should be sent exactly once.
+
+        Args:
+            windows: List of feature dicts, oldest first
+
+        Returns:
+            List of result dicts (Isolation Forest and Half-Space Trees scores)
+        """
+        bundle = self.bundles.get('anomaly')
+        if bundle is None:
+            raise ModelNotLoadedError('anomaly')
+
+        model = bundle['compiled'] if bundle.get('compiled') is not None else bundle['model']
+        scorer = anomaly_detect.OnlineAnomalyScorer(model, bundle['scaler'], bundle['feature_cols'], bundle['hst'])
+        with self._anomaly_stream_lock:
+            results = scorer.score(windows)
+        if self.rate_limiter is not None and results:
+            self.rate_limiter.observe_anomaly(results[-1])
+        return results
+
+    def check_rate_limits(self, requests):
+        """
+        Admit or reject a batch of client requests with the adaptive rate limiter
+
+        Args:
+            requests: List of dicts with 'ip' and/or 'api_key' and an optional 'cost'
+
+        Returns:
+            Dict with 'allowed' and 'retry_after' (seconds) lists in request order
+        """
+        keys = [client_key(r.get('ip'), r.get('api_key')) for r in requests]
+        costs = validate_costs([float(r.get('cost', 1)) for r in requests])
+        allowed, retry_after = self.rate_limiter.check_many(keys, costs, retry_after=True)
+        return {'allowed': allowed.tolist(), 'retry_after': np.round(retry_after, 3).tolist()}
+
+    def record_latency(self, endpoint, seconds, status=200):
+        """Record end-to-end latency for an endpoint"""
+        if endpoint not in self.endpoint_latency:
+            self.endpoint_latency[endpoint] = LatencyTracker()
+        self.endpoint_latency[endpoint].record(seconds)
+        if self.metrics is not None:
+            self.metrics.observe_request(endpoint, status, seconds)
+
+    def get_stats(self):
+        """Get batcher and endpoint latency metrics"""
+        return {
+            'uptime_s': time.time() - self.started_at,
+            'batchers': {name: batcher.get_stats() for name, batcher in self.batchers.items()},
+            'cache': self.cache.get_stats() if self.cache is not None else None,
+            'planner': self.planner.state() if self.planner is not None else None,
+            'rate_limiter': self.rate_limiter.get_stats() if self.rate_limiter is not None else None,
+            'endpoints': {name: tracker.summary() for name, tracker in self.endpoint_latency.items()}
+        }
+
+    def stop(self):
+        """Stop all batchers"""
+        self._watch_stop.set()
+        for batcher in self.batchers.values():
+            batcher.stop()
+
+def _parse_instances(body):
+    """
+    Normalize a request body to a list of payload dicts
+
+    Returns:
+        (payloads, is_batch)
+    """
+    if isinstance(body, dict) and isinstance(body.get('instances'), list):
+        return body['instances'], True
+    if isinstance(body, list):
+        return body, True
+    if isinstance(body, dict):
+        return [body], False
+    raise ValueError("Expected a JSON object, a list of objects or {\"instances\": [...]}")
+
+def create_app(server, admin_token=None):
+    """
+    Create the Flask app for a loaded ModelServer
+
+    Args:
+        server: Loaded ModelServer
+        admin_token: Shared secret /admin/* requests must send as X-Admin-Token
+            (None = only loopback clients may use them)
+    """
+    app = Flask(__name__)
+
+    def admin_only(view):
+        """Reject /admin/* calls without the admin token (or from another host when none is set)"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if admin_token:
+                allowed = hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), admin_token.encode())
+            else:
+                allowed = request.remote_addr in LOOPBACK_ADDRS
+            if not allowed:
+                return jsonify({'status': 'error', 'message': 'Admin access denied'}), 403
+            return view(*args, **kwargs)
+        return wrapper
+
+    def timed(endpoint):
+        """Record latency and map serving errors to HTTP status codes"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                status = 500
+                try:
+                    response = view(*args, **kwargs)
+                    status = 200
+                    return response
+                except ModelNotLoadedError as e:
+                    status = 503
+                    return jsonify({'status': 'error', 'message': f"Model not loaded: {e}"}), 503
+                except QueueFullError as e:
+                    status = 503
+                    return jsonify({'status': 'error', 'message': str(e)}), 503, {'Retry-After': '1'}
+                except FutureTimeoutError:
+                    status = 504
+                    return jsonify({'status': 'error', 'message': 'Prediction timed out'}), 504
+                except (ValueError, TypeError, RegistryError) as e:
+                    status = 400
+                    return jsonify({'status': 'error', 'message': str(e)}), 400
+                finally:
+                    server.record_latency(endpoint, time.perf_counter() - start, status)
+            return wrapper
+        return decorator
+
+    def run_model(name):
+        payloads, is_batch = _parse_instances(request.get_json(force=True))
+        results = server.predict(name, payloads)
+        return jsonify({'predictions': results} if is_batch else results[0])
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({
+            'status': 'ok',
+            'models': sorted(server.bundles),
+            'default_router': server.default_router
+        })
+
+    @app.route('/model-info', methods=['GET'])
+    def model_info():
+        return jsonify({
+            'models': {
+                name: {
+                    'model_type': bundle['model_type'],
+                    'model_dir': bundle['model_dir'],
+                    'version': bundle.get('version'),
+                    'feature_cols': bundle.get('feature_cols'),
+                    'seq_length': bundle.get('seq_length'),
+                    'sequence_features': bundle.get('sequence_features')
+                }
+                for name, bundle in server.bundles.items()
+            },
+            'batching': server.batch_config
+        })
+
+    @app.route('/stats', methods=['GET'])
+    def stats():
+        return jsonify(server.get_stats())
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        if server.metrics is None:
+            return jsonify({'status': 'error', 'message': 'Metrics are disabled'}), 404
+        body, content_type = server.metrics.render()
+        return Response(body, content_type=content_type)
+
+    @app.route('/admin/reload', methods=['POST'])
+    @admin_only
+    @timed('admin_reload')
+    def admin_reload():
+        body = request.get_json(force=True, silent=True) or {}
+        if body.get('name'):
+            if body.get('version') and server.registry is not None:
+                server.registry.promote(body['name'], body['version'])
+            return jsonify(server.reload(body['name'], body.get('version')))
+        if server.registry is None:
+            raise ValueError("Specify 'name' (no registry configured)")
+        return jsonify({'reloaded': server.check_for_updates()})
+
+    @app.route('/admin/rollback', methods=['POST'])
+    @admin_only
+    @timed('admin_rollback')
+    def admin_rollback():
+        body = request.get_json(force=True, silent=True) or {}
+        if not body.get('name'):
+            raise ValueError("Specify 'name'")
+        return jsonify(server.rollback(body['name']))
+
+    @app.route('/predict/random-forest', methods=['POST'])
+    @timed('predict_random_forest')
+    def predict_random_forest():
+        return run_model('random-forest')
+
+    @app.route('/predict/xgboost', methods=['POST'])
+    @timed('predict_xgboost')
+    def predict_xgboost():
+        return run_model('xgboost')
+
+    @app.route('/predict/route', methods=['POST'])
+    @timed('predict_route')
+    def predict_route():
+        return run_model(server.default_router)
+
+    @app.route('/batch-predict', methods=['POST'])
+    @timed('batch_predict')
+    def batch_predict():
+        return run_model(server.default_router)
+
+    @app.route('/batch-predict/columnar', methods=['POST'])
+    @timed('batch_predict_columnar')
+    def batch_predict_columnar():
+        # Packed float32 matrix or Arrow IPC stream in; the same format comes back
+        name = request.args.get('model', server.default_router)
+        body = request.get_data()
+        if request.mimetype == columnar.ARROW_CONTENT_TYPE:
+            X, columns = columnar.decode_arrow(body)
+            encode, content_type = columnar.encode_arrow_routes, columnar.ARROW_CONTENT_TYPE
+        elif request.mimetype in (columnar.PACKED_CONTENT_TYPE, 'application/octet-stream'):
+            X, columns = columnar.decode_matrix(body)
+            encode, content_type = columnar.encode_routes, columnar.PACKED_CONTENT_TYPE
+        else:
+            raise ValueError(f"Content-Type must be {columnar.PACKED_CONTENT_TYPE} or {columnar.ARROW_CONTENT_TYPE}")
+        return Response(encode(*server.route_columns(name, X, columns)), content_type=content_type)
+
+    @app.route('/predict/lstm', methods=['POST'])
+    @timed('predict_lstm')
+    def predict_lstm():
+        return run_model('lstm')
+
+    @app.route('/forecast/stream', methods=['POST'])
+    @timed('forecast_stream')
+    def forecast_stream():
+        body = request.get_json(force=True)
+        if not isinstance(body, dict):
+            raise ValueError("Expected {'stream': id, 'value': n} or {'stream': id, 'values': [...]}")
+        values = body['values'] if 'values' in body else [body.get('value')]
+
+        def is_number(v):
+            return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+        # A value is a number, or a row of numbers for multi-feature models
+        if not values or any(not (is_number(v) or (isinstance(v, list) and v and all(map(is_number, v))))
+                             for v in values):
+            raise ValueError("'value'/'values' must be numbers (or rows of numbers, one per LSTM input feature)")
+        return jsonify(server.stream_forecast(str(body.get('stream', 'default')), values))
+
+    @app.route('/features/stream', methods=['POST'])
+    @timed('features_stream')
+    def features_stream():
+        body = request.get_json(force=True)
+        if not isinstance(body, dict):
+            raise ValueError("Expected {'stream': id, 'window': {...}} or {'stream': id, 'windows': [...]}")
+        windows = body['windows'] if 'windows' in body else [body.get('window')]
+        if not windows or not all(isinstance(window, dict) for window in windows):
+            raise ValueError("'window'/'windows' must be JSON objects with the window's metrics")
+        return jsonify(server.stream_features(str(body.get('stream', 'default')), windows,
+                                              route=bool(body.get('route'))))
+
+    @app.route('/detect/anomaly/stream', methods=['POST'])
+    @timed('detect_anomaly_stream')
+    def detect_anomaly_stream():
+        windows, is_batch = _parse_instances(request.get_json(force=True))
+        if not all(isinstance(window, dict) for window in windows):
+            raise ValueError("Each window must be a JSON object")
+        results = server.stream_anomaly(windows)
+        return jsonify({'predictions': results} if is_batch else results[0])
+
+    @app.route('/ratelimit/check', methods=['POST'])
+    @timed('ratelimit_check')
+    def ratelimit_check():
+        if server.rate_limiter is None:
+            return jsonify({'status': 'error', 'message': 'Rate limiting is disabled'}), 404
+        requests, is_batch = _parse_instances(request.get_json(force=True))
+        if not all(isinstance(r, dict) for r in requests):
+            raise ValueError("Each request must be a JSON object with 'ip' and/or 'api_key'")
+        result = server.check_rate_limits(requests)
+        if is_batch:
+            return jsonify(result)
+        return jsonify({'allowed': result['allowed'][0], 'retry_after': result['retry_after'][0]})
+
+    @app.route('/detect/anomaly', methods=['POST'])
+    @timed('detect_anomaly')
+    def detect_anomaly():
+        return run_model('anomaly')
+
+    @app.route('/predict', methods=['POST'])
+    @timed('predict_policy')
+    def predict_policy():
+        metrics = request.get_json(force=True)
+        if not isinstance(metrics, dict):
+            raise ValueError("Expected a JSON object of metrics")
+
+        forecast = anomaly = None
+        sequence = metrics.get('sequence') or []
+        sequence_features = ('request_count',)
+        if 'lstm' in server.batchers:
+            bundle = server.bundles['lstm']
+            sequence_features = bundle['sequence_features'] or sequence_features
+            # Sequences that don't fit the model (e.g. plain counts for a multi-feature LSTM) skip the forecast
+            if len(sequence) >= bundle['seq_length'] and sequence_matches(sequence, bundle):
+                forecast = server.predict('lstm', [metrics])[0]
+        if 'anomaly' in server.batchers and any(
+                col in metrics for col in server.bundles['anomaly']['feature_cols']):
+            anomaly = server.predict('anomaly', [metrics])[0]
+
+        # The planner needs request counts; payloads with only cpu/memory keep the stateless policy
+        if server.planner is not None and (metrics.get('request_count') is not None or sequence):
+            policy = server.planner.recommend(metrics, forecast=forecast, anomaly=anomaly,
+                                              sequence_features=sequence_features)
+        else:
+            policy = recommend_policy(metrics, forecast=forecast, anomaly=anomaly, sequence_features=sequence_features)
+        if server.metrics is not None:
+            server.metrics.observe_policy(policy, anomaly)
+        policy['forecast'] = forecast
+        policy['anomaly'] = anomaly
+        return jsonify(policy)
+
+    return app
+
+def main():
+    """Start the model server"""
+    parser = argparse.ArgumentParser(description='Serve load-balancing models over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    parser.add_argument('--router', default='random-forest', choices=sorted(ModelServer.ROUTERS))
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--max-queue-size', type=int, default=1024)
+    parser.add_argument('--timeout', type=float, default=1.0, help='Per-request timeout (seconds)')
+    parser.add_argument('--no-compiled', action='store_true', help='Ignore compiled node arrays')
+    parser.add_argument('--no-metrics', action='store_true', help='Disable the Prometheus /metrics endpoint')
+    parser.add_argument('--student', help='Route with a distilled student, e.g. tree-5 (see distill.py)')
+    parser.add_argument('--feature-lookback', type=int, default=DEFAULT_LOOKBACK,
+                        help='Rolling window of /features/stream (the lookback used in training)')
+    parser.add_argument('--capacity', nargs='?', const=CAPACITY_FILE,
+                        help='Plan /predict with measured capacity, hysteresis and cooldowns '
+                             '(default file: data/capacity.json; see capacity_planner.py)')
+    parser.add_argument('--replicas', type=int, help='Current replicas for --capacity (default: --min-replicas)')
+    parser.add_argument('--min-replicas', type=int, default=1)
+    parser.add_argument('--max-replicas', type=int, default=10)
+    parser.add_argument('--client-limit', type=int, default=DEFAULT_LIMIT,
+                        help='Requests per --client-window per IP / API key for /ratelimit/check (0 = off)')
+    parser.add_argument('--client-window', type=float, default=3600.0, help='Rate limit window in seconds')
+    parser.add_argument('--max-clients', type=int, default=DEFAULT_MAX_CLIENTS,
+                        help='Token buckets kept before idle clients are evicted')
+    parser.add_argument('--cache-size', type=int, default=4096, help='Prediction cache entries (0 = off)')
+    parser.add_argument('--cache-ttl', type=float, default=60.0, help='Prediction cache TTL in seconds')
+    parser.add_argument('--cache-step', type=float, default=None,
+                        help='Default feature quantization step for cache keys (default: exact values)')
+    parser.add_argument('--cache-quantization', default='',
+                        help="Per-feature steps, e.g. 'request_count=1,rolling_std_5=0.25'")
+    parser.add_argument('--registry', nargs='?', const=REGISTRY_DIR,
+                        help='Load current versions from a model registry (default dir: registry/)')
+    parser.add_argument('--watch-interval', type=float, default=5.0,
+                        help='Seconds between registry checks for promoted versions (0 = off)')
+    parser.add_argument('--admin-token', default=os.environ.get('ML_ADMIN_TOKEN'),
+                        help='Shared secret for /admin/* sent as X-Admin-Token '
+                             '(default: $ML_ADMIN_TOKEN; unset = loopback clients only)')
+    args = parser.parse_args()
+
+    print("🚀 Starting Model Server\n")
+    server = ModelServer(
+        models_dir=args.models_dir,
+        default_router=args.router,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue_size=args.max_queue_size,
+        request_timeout=args.timeout,
+        use_compiled=not args.no_compiled,
+        student=args.student,
+        metrics=not args.no_metrics,
+        feature_lookback=args.feature_lookback,
+        planner=CapacityPlanner.from_file(
+            args.capacity, replicas=args.replicas, min_replicas=args.min_replicas, max_replicas=args.max_replicas
+        ) if args.capacity else None,
+        rate_limiter=AdaptiveRateLimiter(
+            args.client_limit, args.client_window, max_clients=args.max_clients
+        ) if args.client_limit > 0 else None,
+        registry=ModelRegistry(args.registry) if args.registry else None,
+        cache=PredictionCache(
+            max_size=args.cache_size,
+            ttl_s=args.cache_ttl,
+            default_step=args.cache_step,
+            quantization=parse_quantization(args.cache_quantization)
+        ) if args.cache_size > 0 else None
+    ).load()
+
+    if server.registry is not None and args.watch_interval > 0:
+        server.watch_registry(args.watch_interval)
+
+    app = create_app(server, admin_token=args.admin_token)
+    print(f"\n🌐 Listening on http://{args.host}:{args.port}")
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
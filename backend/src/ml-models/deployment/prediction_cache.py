@@ -0,0 +1,176 @@
+"""
+Prediction Cache
+Bounded LRU/TTL cache for model outputs, keyed on quantized feature vectors
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache with a time-to-live
+
+    Routing features only change once per aggregation window, so most requests
+    repeat a feature vector that was already scored. Each feature is snapped to
+    a grid (value // step) before keying, so float noise below the step size still
+    hits. Keys also carry the model version: results from a replaced model are
+    never returned, even if they were stored after the swap.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_s: float = 60.0, default_step: float = None,
+                 quantization: Optional[Dict[str, float]] = None):
+        """
+        Initialize cache
+
+        Args:
+            max_size: Maximum entries across all models (least recently used evicted first)
+            ttl_s: Seconds an entry stays valid (0 = no expiry)
+            default_step: Quantization step for features not in quantization (None = exact value)
+            quantization: Per-feature quantization steps, e.g. {'request_count': 1, 'rolling_mean_5': 0.5}
+        """
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.default_step = default_step
+        self.quantization = dict(quantization or {})
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def _steps_for(self, feature_cols):
+        """Quantization step per column (cached per feature_cols list)"""
+        cache_key = tuple(feature_cols)
+        steps = self._steps.get(cache_key)
+        if steps is None:
+            steps = tuple(self.quantization.get(col, self.default_step) for col in feature_cols)
+            self._steps[cache_key] = steps
+        return steps
+
+    @staticmethod
+    def _quantize(value, step):
+        value = float(value)
+        if step and math.isfinite(value):
+            return int(value // step)
+        # NaN != NaN, but tuples compare items by identity first: one shared NaN object keeps such keys hitting
+        return math.nan if math.isnan(value) else value
+
+    def make_key(self, model: str, version: Any, payload: Dict, feature_cols: Iterable[str]):
+        """
+        Build the cache key for one feature payload
+
+        Args:
+            model: Model name
+            version: Model version token (anything hashable)
+            payload: Feature dict (missing features = 0, as in build_feature_matrix)
+            feature_cols: Feature column order
+
+        Returns:
+            Hashable key
+        """
+        steps = self._steps_for(feature_cols)
+        return (model, version) + tuple(
+            self._quantize(payload.get(col, 0), step) for col, step in zip(feature_cols, steps)
+        )
+
+    def make_sequence_key(self, model: str, version: Any, sequence: Iterable[float]):
+        """Build the cache key for a value sequence (e.g. an LSTM input window)"""
+        step = self.default_step
+        return (model, version) + tuple(self._quantize(value, step) for value in sequence)
+
+    def get(self, key):
+        """
+        Look up a key
+
+        Returns:
+            Cached value, or None on a miss or expired entry
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, stored_at = entry
+            if self.ttl_s and time.monotonic() - stored_at > self.ttl_s:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a value (evicts the least recently used entry when full)"""
+        with self._lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute: Callable[[], Any]):
+        """Return the cached value for key, computing and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, model: str = None):
+        """
+        Drop entries for one model (or everything)
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            if model is None:
+                removed = len(self.entries)
+                self.entries.clear()
+                return removed
+
+            stale = [key for key in self.entries if key[0] == model]
+            for key in stale:
+                del self.entries[key]
+            return len(stale)
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl_s': self.ttl_s,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+def parse_quantization(spec: str) -> Dict[str, float]:
+    """
+    Parse a per-feature quantization spec
+
+    Args:
+        spec: Comma-separated feature=step pairs, e.g. 'request_count=1,rolling_std_5=0.25'
+
+    Returns:
+        Dict of feature name -> step
+    """
+    quantization = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, step = item.partition('=')
+        if not sep:
+            raise ValueError(f"Expected feature=step, got: {item!r}")
+        quantization[name.strip()] = float(step)
+    return quantization
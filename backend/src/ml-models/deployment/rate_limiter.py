@@ -0,0 +1,295 @@
+"""
+Adaptive Rate Limiter
+Token buckets per client IP / API key in flat arrays, tightened by live anomaly scores and heavy-hitter share
+"""
+
+import math
+import threading
+import time
+from typing import Dict, Hashable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Matches the Express limiter in app.js: 1000 requests per hour per client
+DEFAULT_LIMIT = 1000
+DEFAULT_WINDOW_S = 3600.0
+DEFAULT_MAX_CLIENTS = 100_000
+# Refills are fractional; don't reject a request over rounding error in the refill arithmetic
+TOKEN_EPSILON = 1e-9
+
+def client_key(ip: Optional[str] = None, api_key: Optional[str] = None) -> str:
+    """Bucket key for a request: its API key if it has one (clients behind one NAT differ), else its IP"""
+    if api_key:
+        return f"key:{api_key}"
+    if ip:
+        return f"ip:{ip}"
+    raise ValueError("A request needs an 'ip' or an 'api_key'")
+
+def validate_costs(costs):
+    """Raise ValueError unless every cost is finite and non-negative (NaN would poison a bucket, negatives refill it)"""
+    costs = np.asarray(costs, dtype=np.float64)
+    if not np.all(np.isfinite(costs)) or np.any(costs < 0):
+        raise ValueError("Request costs must be finite and non-negative")
+    return costs
+
+def anomaly_level(result: Dict, score_scale: float = 0.2, flagged_level: float = 0.5) -> float:
+    """
+    Anomaly result from /detect/anomaly(/stream) as a tightening level in [0, 1]
+
+    Isolation Forest scores are decision_function values (negative = anomalous);
+    -score_scale and below count as fully anomalous. A flagged window (either
+    detector) is at least flagged_level.
+    """
+    level = min(1.0, max(0.0, -float(result.get('anomaly_score', 0.0)) / score_scale))
+    if result.get('is_anomaly'):
+        level = max(level, flagged_level)
+    return level
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket per client, with limits that tighten under anomalies and for heavy hitters
+
+    Each client owns one slot in a set of NumPy arrays (tokens, last update,
+    decayed request count, key), about 28 bytes plus its dict entry, instead of a
+    Python object per bucket. The table is bounded by max_clients: clients idle
+    for idle_ttl_s are evicted first, then the least recently seen. An evicted
+    client comes back with a full bucket.
+
+    Every client refills at limit / window_s tokens per second up to a burst of
+    `limit`, scaled by a factor:
+
+    - The anomaly level (observe_anomaly) scales everyone by
+      1 - (1 - min_factor) * level. The level decays with a half-life of
+      recovery_half_life_s, so limits relax gradually after an incident.
+    - A client whose share of recent traffic (requests decayed over
+      share_window_s) exceeds heavy_share is scaled further by
+      (heavy_share / share) ** level. Heavy hitters are untouched while traffic
+      looks normal, and are cut toward heavy_share as the anomaly level rises.
+
+    check_many() takes a whole batch in a few vectorized passes. Requests from
+    one client are admitted in order until its tokens run out; with unequal
+    costs, a request that doesn't fit also rejects that client's later requests
+    in the batch. Traffic shares are updated once per batch.
+    """
+
+    def __init__(self, limit: float = DEFAULT_LIMIT, window_s: float = DEFAULT_WINDOW_S,
+                 burst: Optional[float] = None, max_clients: int = DEFAULT_MAX_CLIENTS, idle_ttl_s: float = 3600.0,
+                 min_factor: float = 0.2, heavy_share: float = 0.05, share_window_s: float = 60.0,
+                 recovery_half_life_s: float = 300.0, clock=time.monotonic):
+        """
+        Initialize limiter
+
+        Args:
+            limit: Requests per window per client
+            window_s: Window the limit applies to
+            burst: Bucket size (default: limit)
+            max_clients: Buckets kept
+            idle_ttl_s: Seconds without requests before a bucket may be evicted
+            min_factor: Rate multiplier at anomaly level 1
+            heavy_share: Share of recent traffic above which a client counts as a heavy hitter
+            share_window_s: Time constant of the decayed per-client request counts
+            recovery_half_life_s: Half-life of the anomaly level
+            clock: Time source in seconds
+        """
+        if limit <= 0 or window_s <= 0:
+            raise ValueError("limit and window_s must be positive")
+        if not 0 < min_factor <= 1:
+            raise ValueError("min_factor must be in (0, 1]")
+        self.limit = float(limit)
+        self.window_s = float(window_s)
+        self.burst = float(burst if burst is not None else limit)
+        self.max_clients = max_clients
+        self.idle_ttl_s = idle_ttl_s
+        self.min_factor = min_factor
+        self.heavy_share = heavy_share
+        self.share_window_s = share_window_s
+        self.recovery_half_life_s = recovery_half_life_s
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every client and the anomaly level"""
+        self.slots = {}
+        self.keys = np.empty(self.max_clients, dtype=object)
+        self.tokens = np.zeros(self.max_clients, dtype=np.float64)
+        self.recent = np.zeros(self.max_clients, dtype=np.float32)
+        self.updated = np.full(self.max_clients, -np.inf)
+        self.free = list(range(self.max_clients - 1, -1, -1))
+        self.total_recent = 0.0
+        self.total_updated = None
+        self.level = 0.0
+        self.level_at = None
+        self.checks = 0
+        self.denied = 0
+        self.evictions = 0
+
+    @property
+    def rate(self) -> float:
+        """Tokens per second at factor 1"""
+        return self.limit / self.window_s
+
+    def observe_anomaly(self, result: Dict, now: Optional[float] = None) -> float:
+        """
+        Feed an anomaly result; the level only rises here and decays over time
+
+        Returns:
+            Current anomaly level
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            self.level = max(self._level(now), anomaly_level(result))
+            self.level_at = now
+            return self.level
+
+    def _level(self, now: float) -> float:
+        if self.level_at is None:
+            return 0.0
+        return self.level * 0.5 ** (max(now - self.level_at, 0.0) / self.recovery_half_life_s)
+
+    def _add_traffic(self, requests: float, now: float):
+        """Decay the overall recent traffic to now and add requests"""
+        if self.total_updated is not None and now > self.total_updated:
+            self.total_recent *= math.exp(-(now - self.total_updated) / self.share_window_s)
+        self.total_recent += requests
+        self.total_updated = now
+
+    def _factor(self, recent, level: float):
+        """Limit multiplier for clients with the given decayed request counts"""
+        factor = 1.0 - (1.0 - self.min_factor) * level
+        if level > 0 and self.total_recent > 0:
+            share = np.maximum(recent / self.total_recent, 1e-12)
+            factor = factor * np.minimum(1.0, self.heavy_share / share) ** level
+        return factor
+
+    def _evict(self, needed: int, now: float, keep: np.ndarray):
+        """Free at least `needed` slots: idle clients first, then the least recently seen (never `keep`)"""
+        updated = self.updated.copy()
+        updated[np.isneginf(updated)] = np.inf   # free slots
+        updated[keep] = np.inf
+        idle = np.flatnonzero(updated < now - self.idle_ttl_s)
+        if len(idle) < needed:
+            # Evict an extra 1/16 of the table so a full table isn't searched on every new client
+            count = min(max(needed, self.max_clients // 16), len(self.slots) - len(keep))
+            idle = np.argpartition(updated, count - 1)[:count]
+        for slot in idle:
+            del self.slots[self.keys[slot]]
+            self.keys[slot] = None
+            self.free.append(int(slot))
+        self.updated[idle] = -np.inf
+        self.evictions += len(idle)
+
+    def _resolve(self, uniques, now: float) -> np.ndarray:
+        """Slot per distinct key, allocating full buckets for new clients"""
+        if len(uniques) > self.max_clients:
+            raise ValueError(f"Batch has {len(uniques)} distinct clients; max_clients is {self.max_clients}")
+        get = self.slots.get
+        slots = np.fromiter((get(key, -1) for key in uniques), dtype=np.int64, count=len(uniques))
+        new = np.flatnonzero(slots < 0)
+        if len(new):
+            if len(new) > len(self.free):
+                self._evict(len(new) - len(self.free), now, slots[slots >= 0])
+            for i in new:
+                slot = self.free.pop()
+                self.slots[uniques[i]] = slot
+                self.keys[slot] = uniques[i]
+                slots[i] = slot
+            self.tokens[slots[new]] = self.burst
+            self.recent[slots[new]] = 0.0
+            self.updated[slots[new]] = now
+        return slots
+
+    def check_many(self, keys: Iterable[Hashable], costs=None, now: Optional[float] = None,
+                   retry_after: bool = False):
+        """
+        Admit or reject a batch of requests
+
+        Args:
+            keys: Client key per request, in arrival order (see client_key)
+            costs: Tokens per request (default: 1 each)
+            now: Check time in seconds (default: clock())
+            retry_after: Also return the seconds until each rejected request would fit
+
+        Returns:
+            Bool array of admitted requests (and a float array of retry delays, 0 when admitted)
+        """
+        now = self.clock() if now is None else now
+        if not isinstance(keys, (np.ndarray, pd.Series, pd.Index)):
+            keys = np.array(keys if isinstance(keys, list) else list(keys), dtype=object)
+        codes, uniques = pd.factorize(keys)
+        n_clients = len(uniques)
+        costs = np.ones(len(codes)) if costs is None else validate_costs(costs)
+        if len(costs) != len(codes):
+            raise ValueError(f"Got {len(costs)} costs for {len(codes)} requests")
+        demand = np.bincount(codes, weights=costs, minlength=n_clients)
+
+        with self._lock:
+            slots = self._resolve(uniques, now)
+            elapsed = np.maximum(now - self.updated[slots], 0.0)
+
+            # Decayed traffic per client and overall
+            self._add_traffic(float(demand.sum()), now)
+            recent = self.recent[slots] * np.exp(-elapsed / self.share_window_s) + demand
+            self.recent[slots] = recent
+
+            factor = np.broadcast_to(self._factor(recent, self._level(now)), (n_clients,))
+            rate = self.rate * factor
+            tokens = np.minimum(self.burst * factor, self.tokens[slots] + elapsed * rate)
+
+            # Tokens each request needs including the earlier requests of its client in this batch
+            # Stable sorts of 16-bit keys are radix sorts, several times faster than on int64
+            order = np.argsort(codes.astype(np.uint16) if n_clients <= 65_536 else codes, kind='stable')
+            cumulative = np.cumsum(costs[order])
+            first = np.searchsorted(codes[order], np.arange(n_clients))
+            needed = np.empty_like(cumulative)
+            needed[order] = cumulative - (cumulative[first] - costs[order][first])[codes[order]]
+            allowed = needed <= tokens[codes] + TOKEN_EPSILON
+
+            self.tokens[slots] = tokens - np.bincount(codes, weights=costs * allowed, minlength=n_clients)
+            self.updated[slots] = now
+            self.checks += len(codes)
+            self.denied += int(len(codes) - np.count_nonzero(allowed))
+
+        if not retry_after:
+            return allowed
+        wait = np.where(allowed, 0.0, (needed - tokens[codes]) / rate[codes])
+        return allowed, wait
+
+    def check(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> bool:
+        """Admit or reject one request (same rules as check_many, without the batch machinery)"""
+        if not (math.isfinite(cost) and cost >= 0):
+            raise ValueError("Request costs must be finite and non-negative")
+        now = self.clock() if now is None else now
+        with self._lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = int(self._resolve([key], now)[0])
+            elapsed = max(now - float(self.updated[slot]), 0.0)
+            self._add_traffic(cost, now)
+            recent = float(self.recent[slot]) * math.exp(-elapsed / self.share_window_s) + cost
+            self.recent[slot] = recent
+
+            factor = float(self._factor(recent, self._level(now)))
+            tokens = min(self.burst * factor, float(self.tokens[slot]) + elapsed * self.rate * factor)
+            allowed = cost <= tokens + TOKEN_EPSILON
+            self.tokens[slot] = tokens - cost if allowed else tokens
+            self.updated[slot] = now
+            self.checks += 1
+            self.denied += not allowed
+        return allowed
+
+    def get_stats(self) -> Dict:
+        """Clients, admitted/denied counts, evictions and the current anomaly level"""
+        with self._lock:
+            return {
+                'clients': len(self.slots),
+                'max_clients': self.max_clients,
+                'checks': self.checks,
+                'denied': self.denied,
+                'evictions': self.evictions,
+                'anomaly_level': self._level(self.clock()),
+                'limit': self.limit,
+                'window_s': self.window_s,
+                'bytes': int(self.tokens.nbytes + self.recent.nbytes + self.updated.nbytes + self.keys.nbytes)
+            }
@@ -0,0 +1,482 @@
+"""
+Walk-Forward Backtesting
+Rolling-origin folds for every model, run in parallel, reporting accuracy/forecast error and training/inference cost
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.module_loader import load_module
+from utils.resources import apply_cpu_budget
+
+RESULTS_DIR = os.path.join(ML_ROOT, 'evaluation', 'results')
+CACHE_DIR = os.path.join(RESULTS_DIR, 'backtest_cache')
+
+TRAINERS = {
+    'random-forest': 'models/3_random_forest/train.py',
+    'xgboost': 'models/4_xgboost/train.py',
+    'lstm': 'models/5_lstm/train.py',
+    'anomaly': 'models/6_anomaly_detection/train.py'
+}
+
+# Slowest first, so the pool is not left waiting on one long fold at the end
+MODEL_ORDER = ['lstm', 'xgboost', 'random-forest', 'anomaly']
+
+# Columns the synthetic anomaly labels are derived from (see create_anomaly_labels)
+ANOMALY_LABEL_COLS = ['request_count', 'error_rate', 'avg_response_time', 'bot_rate']
+
+def _quiet():
+    """Swallow the trainers' progress prints inside a fold"""
+    stack = contextlib.ExitStack()
+    sink = io.StringIO()
+    stack.enter_context(contextlib.redirect_stdout(sink))
+    stack.enter_context(contextlib.redirect_stderr(sink))
+    return stack
+
+def _cache_file(model, features_file):
+    """Cache path keyed on the model and the features file's identity (path, size, mtime)"""
+    stat = os.stat(features_file)
+    key = f"{model}|{os.path.realpath(features_file)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return os.path.join(CACHE_DIR, f"{model}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz")
+
+def build_dataset(model, df):
+    """
+    Time-ordered arrays a model's folds are cut from
+
+    Labels are not stored: each fold derives them from its own training rows
+    (load-level edges, anomaly thresholds), as a retrain at that point would.
+
+    Returns:
+        Dict with X, feature_cols, request_count, timestamp (ns) and, for anomaly, label columns
+    """
+    trainer = load_module(TRAINERS[model])
+    if model == 'lstm':
+        feature_cols = [col for col in trainer.SEQUENCE_FEATURES if col in df.columns]
+        X = df[feature_cols]
+    elif model == 'anomaly':
+        with _quiet():
+            X, _, feature_cols = trainer.prepare_features(df)
+    else:
+        with _quiet():
+            X, _, feature_cols = trainer.prepare_data(df.copy(), bins=[0.0, 1.0])
+
+    dataset = {
+        'X': X.to_numpy(dtype=np.float64),
+        'feature_cols': np.array(feature_cols),
+        'request_count': df['request_count'].to_numpy(dtype=np.float64),
+        'timestamp': df['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    }
+    if model == 'anomaly':
+        dataset['label_cols'] = df.reindex(columns=ANOMALY_LABEL_COLS, fill_value=0).to_numpy(dtype=np.float64)
+    return dataset
+
+def load_datasets(models, features_file, use_cache=True):
+    """
+    Fold datasets for every model, built once and cached on disk
+
+    Every fold of a model slices the same arrays, and pool workers inherit them
+    on fork, so nothing is re-read or re-derived per fold. The cache is reused
+    until the features file changes.
+    """
+    datasets, df = {}, None
+    for model in models:
+        path = _cache_file(model, features_file)
+        if use_cache and os.path.exists(path):
+            with np.load(path) as data:
+                datasets[model] = {name: data[name] for name in data.files}
+            print(f"📦 {model}: cached fold dataset {os.path.relpath(path, ML_ROOT)}")
+            continue
+
+        if df is None:
+            from utils.dataset import read_features
+            df = read_features(features_file).sort_values('timestamp').reset_index(drop=True)
+        datasets[model] = build_dataset(model, df)
+        if use_cache:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            np.savez(path, **datasets[model])
+        print(f"🔧 {model}: built fold dataset ({len(datasets[model]['X'])} rows, "
+              f"{datasets[model]['X'].shape[1]} features)")
+    return datasets
+
+def make_folds(n_rows, n_folds, step, window='expanding', train_size=None, min_train=100):
+    """
+    Rolling-origin folds: train on rows before the origin, test on the next `step` rows
+
+    The last fold's test window ends at the newest row; origins move back by
+    `step` per fold. With window='sliding' every fold trains on the `train_size`
+    rows just before its origin (default: the first fold's training size).
+
+    Returns:
+        List of dicts with fold, train_start, origin, test_end
+    """
+    first_origin = n_rows - n_folds * step
+    if first_origin < min_train:
+        n_folds = max(0, (n_rows - min_train) // step)
+        first_origin = n_rows - n_folds * step
+        print(f"⚠️ Only {n_folds} folds of {step} rows fit after {min_train} training rows")
+
+    train_size = train_size or first_origin
+    folds = []
+    for k in range(n_folds):
+        origin = first_origin + k * step
+        train_start = max(0, origin - train_size) if window == 'sliding' else 0
+        folds.append({'fold': k, 'train_start': train_start, 'origin': origin, 'test_end': origin + step})
+    return folds
+
+def load_level_labels(request_count, edges):
+    """Right-closed load-level labels from qcut edges (same rule as pd.cut in prepare_data)"""
+    return np.searchsorted(np.asarray(edges[1:-1], dtype=np.float64), request_count, side='left')
+
+def _predict_time(predict, X):
+    """Seconds for one batch prediction over X, and its result"""
+    start = time.perf_counter()
+    result = predict(X)
+    return time.perf_counter() - start, result
+
+def backtest_router(model, data, fold, params):
+    """Fit RF/XGBoost on the fold's training rows and score routing accuracy on its test rows"""
+    from sklearn.metrics import accuracy_score
+    from sklearn.preprocessing import StandardScaler
+
+    from utils import incremental
+
+    trainer = load_module(TRAINERS[model])
+    train, test = slice(fold['train_start'], fold['origin']), slice(fold['origin'], fold['test_end'])
+    edges = incremental.load_level_bins(data['request_count'][train])
+    y_train = load_level_labels(data['request_count'][train], edges)
+    y_test = load_level_labels(data['request_count'][test], edges)
+
+    start = time.perf_counter()
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(data['X'][train])
+    with _quiet():
+        if model == 'xgboost':
+            # Early stopping on the newest 20% of the training rows, never on the test window
+            split = int(len(X_train) * 0.8)
+            estimator = trainer.train_model(X_train[:split], y_train[:split], X_train[split:], y_train[split:], **params)
+        else:
+            estimator = trainer.train_model(X_train, y_train, **params)
+    fit_s = time.perf_counter() - start
+    estimator.verbose = 0  # RF prints per-batch progress on predict too
+
+    predict_s, y_pred = _predict_time(lambda X: estimator.predict(scaler.transform(X)), data['X'][test])
+    return {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'fit_s': fit_s,
+        'predict_s': predict_s
+    }
+
+def backtest_lstm(data, fold, epochs=20, seq_length=10, horizon=10, batch_size=32):
+    """
+    Fit the LSTM on windows whose targets end before the origin, forecast the test window
+
+    Test windows may read history from before the origin, but every forecast
+    target lies inside the test rows.
+    """
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    from sklearn.preprocessing import MinMaxScaler
+    from tensorflow import keras
+
+    trainer = load_module(TRAINERS['lstm'])
+    numpy_lstm = trainer.numpy_lstm
+
+    last_train = fold['origin'] - seq_length - horizon + 1
+    test_first = max(fold['origin'] - seq_length, 0)
+    test_last = fold['test_end'] - seq_length - horizon + 1
+    if last_train - fold['train_start'] < 20 or test_last <= test_first:
+        return {'skipped': f"fold too short for seq_length={seq_length}, horizon={horizon}"}
+
+    scaler = MinMaxScaler().fit(data['X'][fold['train_start']:fold['origin']])
+    series = scaler.transform(data['X']).astype(np.float32)
+    windows, y = trainer.create_sequences(series, seq_length, horizon)
+
+    split = fold['train_start'] + int((last_train - fold['train_start']) * 0.85)
+    ranges = [(fold['train_start'], split), (split, last_train), (test_first, test_last)]
+    train_data, val_data, test_data = trainer.make_datasets(series, ranges, seq_length, horizon, batch_size)
+
+    start = time.perf_counter()
+    keras.utils.set_random_seed(42)
+    with _quiet():
+        model = trainer.build_model(seq_length, series.shape[1], horizon)
+    early_stop = keras.callbacks.EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
+    model.fit(train_data, validation_data=val_data, epochs=epochs, shuffle=False, callbacks=[early_stop], verbose=0)
+    fit_s = time.perf_counter() - start
+
+    # Inference cost on the NumPy runtime the model server uses
+    runtime = numpy_lstm.extract_weights(model)
+    X_test = np.ascontiguousarray(windows[test_first:test_last])
+    predict_s, predicted = _predict_time(runtime.predict, X_test)
+
+    actual = numpy_lstm.inverse_target(scaler, y[test_first:test_last])
+    forecast = numpy_lstm.inverse_target(scaler, predicted)
+    errors = forecast - actual
+    return {
+        'mae': float(np.abs(errors).mean()),
+        'rmse': float(np.sqrt((errors ** 2).mean())),
+        'mae_next_minute': float(np.abs(errors[:, 0]).mean()),
+        'fit_s': fit_s,
+        'predict_s': predict_s
+    }
+
+def anomaly_labels(label_cols, reference):
+    """
+    Synthetic anomaly labels as in create_anomaly_labels
+
+    The 95th-percentile thresholds come from the reference (training) rows.
+    """
+    request_count, error_rate, response_time, bot_rate = label_cols.T
+    ref_count, _, ref_time, _ = reference.T
+    return ((request_count > np.quantile(ref_count, 0.95)) | (error_rate > 0.2) |
+            (response_time > np.quantile(ref_time, 0.95)) | (bot_rate > 0.5)).astype(int)
+
+def backtest_anomaly(data, fold, contamination=0.1):
+    """Fit the Isolation Forest on the fold's training rows and score the test rows against synthetic labels"""
+    from sklearn.metrics import f1_score, precision_score, recall_score
+    from sklearn.preprocessing import StandardScaler
+
+    trainer = load_module(TRAINERS['anomaly'])
+    train, test = slice(fold['train_start'], fold['origin']), slice(fold['origin'], fold['test_end'])
+    y_test = anomaly_labels(data['label_cols'][test], data['label_cols'][train])
+
+    start = time.perf_counter()
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(data['X'][train])
+    with _quiet():
+        estimator = trainer.train_model(X_train, contamination)
+    fit_s = time.perf_counter() - start
+    estimator.verbose = 0
+
+    predict_s, scores = _predict_time(lambda X: estimator.decision_function(scaler.transform(X)), data['X'][test])
+    y_pred = (scores < 0).astype(int)
+    return {
+        'precision': float(precision_score(y_test, y_pred, zero_division=0)),
+        'recall': float(recall_score(y_test, y_pred, zero_division=0)),
+        'f1_score': float(f1_score(y_test, y_pred, zero_division=0)),
+        'anomaly_rate': float(y_pred.mean()),
+        'fit_s': fit_s,
+        'predict_s': predict_s
+    }
+
+# Fold datasets for pool workers, set once per process by _init_worker
+_worker_data = None
+
+def _init_worker(data, cpus):
+    global _worker_data
+    _worker_data = data
+    apply_cpu_budget(cpus)
+
+def run_fold(model, fold, options, data=None):
+    """
+    Backtest one model on one fold
+
+    Args:
+        model: Model name (TRAINERS key)
+        fold: make_folds() entry (plus the cadence it belongs to)
+        options: Dict with params (per router), lstm_epochs, contamination
+        data: Fold datasets by model (default: the pool worker's copy)
+
+    Returns:
+        Result dict: fold geometry, metrics, fit_s, predict_s and predict_us_per_row
+    """
+    data = (data or _worker_data)[model]
+    if model == 'lstm':
+        metrics = backtest_lstm(data, fold, epochs=options['lstm_epochs'])
+    elif model == 'anomaly':
+        metrics = backtest_anomaly(data, fold, options['contamination'])
+    else:
+        metrics = backtest_router(model, data, fold, options['params'].get(model, {}))
+
+    timestamps = data['timestamp']
+    result = {
+        'model': model,
+        **fold,
+        'train_rows': fold['origin'] - fold['train_start'],
+        'test_rows': fold['test_end'] - fold['origin'],
+        'origin_time': str(np.datetime64(int(timestamps[fold['origin']]), 'ns')),
+        **metrics
+    }
+    if 'predict_s' in metrics:
+        result['predict_us_per_row'] = metrics['predict_s'] / result['test_rows'] * 1e6
+    return result
+
+def run_backtest(datasets, tasks, options, jobs=None):
+    """
+    Run (model, fold) tasks across a process pool
+
+    Workers fork with the fold datasets already in memory and get an even share
+    of the CPUs (applied before any trainer creates its thread pools). jobs=1
+    runs everything in-process.
+
+    Returns:
+        Fold results in task order
+    """
+    cpus = os.cpu_count() or 1
+    jobs = max(1, min(jobs or cpus, len(tasks)))
+    results = [None] * len(tasks)
+
+    def report(i, result):
+        results[i] = result
+        score = result.get('accuracy', result.get('mae', result.get('f1_score')))
+        if 'skipped' in result:
+            summary = f"skipped ({result['skipped']})"
+        else:
+            summary = f"score={score:.4f}  fit={result['fit_s']:.2f}s  predict={result['predict_us_per_row']:.1f} µs/row"
+        print(f"   {result['model']:<14} step={result['step']:<5} fold {result['fold']}: {summary}")
+
+    if jobs == 1:
+        for i, (model, fold) in enumerate(tasks):
+            report(i, run_fold(model, fold, options, datasets))
+        return results
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import multiprocessing
+
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker,
+                             initargs=(datasets, max(1, cpus // jobs))) as pool:
+        futures = {pool.submit(run_fold, model, fold, options): i for i, (model, fold) in enumerate(tasks)}
+        for future in as_completed(futures):
+            report(futures[future], future.result())
+    return results
+
+def summarize(results, minutes_per_row=1.0):
+    """
+    Per model and cadence: mean/std of the score, and what retraining at that cadence costs
+
+    A cadence of `step` rows means one retrain every step * minutes_per_row minutes,
+    so the daily training cost is the mean fit time times the retrains per day.
+    """
+    metric_names = {'random-forest': 'accuracy', 'xgboost': 'accuracy', 'lstm': 'mae', 'anomaly': 'f1_score'}
+    groups = {}
+    for result in results:
+        if 'skipped' not in result:
+            groups.setdefault((result['model'], result['step']), []).append(result)
+
+    summary = []
+    for (model, step), rows in groups.items():
+        metric = metric_names[model]
+        scores = np.array([r[metric] for r in rows])
+        fit_s = float(np.mean([r['fit_s'] for r in rows]))
+        retrains_per_day = 1440 / (step * minutes_per_row)
+        summary.append({
+            'model': model,
+            'step': step,
+            'folds': len(rows),
+            'metric': metric,
+            'mean': float(scores.mean()),
+            'std': float(scores.std()),
+            'fit_s_mean': fit_s,
+            'predict_us_per_row': float(np.mean([r['predict_us_per_row'] for r in rows])),
+            'retrains_per_day': retrains_per_day,
+            'train_s_per_day': fit_s * retrains_per_day
+        })
+    return summary
+
+def print_summary(summary):
+    """Table of the summarize() rows"""
+    print(f"\n{'model':<14} {'step':>6} {'folds':>5} {'metric':<9} {'mean':>9} {'std':>8} "
+          f"{'fit s':>7} {'µs/row':>8} {'retrains/day':>13} {'train s/day':>12}")
+    for row in summary:
+        print(f"{row['model']:<14} {row['step']:>6} {row['folds']:>5} {row['metric']:<9} {row['mean']:>9.4f} "
+              f"{row['std']:>8.4f} {row['fit_s_mean']:>7.2f} {row['predict_us_per_row']:>8.1f} "
+              f"{row['retrains_per_day']:>13.1f} {row['train_s_per_day']:>12.1f}")
+
+def main():
+    """Walk-forward backtest of the selected models"""
+    parser = argparse.ArgumentParser(description='Walk-forward (rolling-origin) backtest of the models')
+    parser.add_argument('models', nargs='*', help=f"Models to backtest (default: all of {', '.join(MODEL_ORDER)})")
+    parser.add_argument('--features', default=os.path.join(ML_ROOT, 'data', 'features', 'features.parquet'))
+    parser.add_argument('--folds', type=int, default=5, help='Folds per cadence')
+    parser.add_argument('--step', default=None,
+                        help='Test window / retraining cadence in rows; comma-separate to compare cadences '
+                             '(default: rows // (2 * folds))')
+    parser.add_argument('--window', choices=['expanding', 'sliding'], default='expanding',
+                        help='Train on all history before the origin, or a fixed-size window')
+    parser.add_argument('--train-size', type=int, help='Training rows per fold with --window sliding')
+    parser.add_argument('--min-train', type=int, default=100, help='Fewest training rows for the first fold')
+    parser.add_argument('--lstm-epochs', type=int, default=20, help='Maximum LSTM epochs per fold')
+    parser.add_argument('--contamination', type=float, default=0.1, help='Isolation Forest contamination')
+    parser.add_argument('--jobs', type=int, help='Parallel folds (default: CPU count; 1 = in-process)')
+    parser.add_argument('--no-cache', action='store_true', help='Rebuild fold datasets instead of reusing the cache')
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'backtest.json'))
+    args = parser.parse_args()
+
+    models = args.models or MODEL_ORDER
+    unknown = [m for m in models if m not in TRAINERS]
+    if unknown:
+        parser.error(f"Unknown model(s): {', '.join(unknown)} (choose from {', '.join(MODEL_ORDER)})")
+    models = [m for m in MODEL_ORDER if m in models]
+
+    if not os.path.exists(args.features):
+        print(f"❌ Features file not found: {args.features}")
+        return 1
+
+    # Plots are never wanted here, and forked workers must not start GUI backends
+    os.environ['ML_NO_PLOTS'] = '1'
+    tune = load_module('evaluation/tune.py')
+
+    start = time.perf_counter()
+    datasets = load_datasets(models, args.features, use_cache=not args.no_cache)
+    n_rows = len(next(iter(datasets.values()))['X'])
+    timestamps = next(iter(datasets.values()))['timestamp']
+    minutes_per_row = float(np.median(np.diff(timestamps))) / 60e9 if n_rows > 1 else 1.0
+
+    steps = [int(s) for s in args.step.split(',')] if args.step else [max(1, n_rows // (2 * args.folds))]
+    tasks = []
+    for step in steps:
+        for fold in make_folds(n_rows, args.folds, step, args.window, args.train_size, args.min_train):
+            tasks.extend((model, {**fold, 'step': step}) for model in models)
+    if not tasks:
+        print("❌ No folds fit the data; lower --step, --folds or --min-train")
+        return 1
+
+    # Slowest models first so the pool does not wait on one long fold at the end
+    tasks.sort(key=lambda task: MODEL_ORDER.index(task[0]))
+    options = {
+        'params': {m: tune.load_tuned_params(tune.MODEL_DIRS[m]) for m in tune.MODEL_DIRS if m in models},
+        'lstm_epochs': args.lstm_epochs,
+        'contamination': args.contamination
+    }
+
+    print(f"\n🔁 Walk-forward backtest: {', '.join(models)} | {len(tasks)} folds "
+          f"(steps {steps}, {args.window} window, {n_rows} rows of {minutes_per_row:g} min)")
+    results = run_backtest(datasets, tasks, options, args.jobs)
+    summary = summarize(results, minutes_per_row)
+    print_summary(summary)
+
+    report = {
+        'features_file': os.path.abspath(args.features),
+        'config': {
+            'models': models,
+            'folds': args.folds,
+            'steps': steps,
+            'window': args.window,
+            'train_size': args.train_size,
+            'lstm_epochs': args.lstm_epochs,
+            'jobs': args.jobs or os.cpu_count()
+        },
+        'wall_s': time.perf_counter() - start,
+        'summary': summary,
+        'folds': results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n⏱️ Wall time: {report['wall_s']:.1f}s")
+    print(f"💾 Saved backtest results to: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,595 @@
+"""
+Benchmark Suite for ML Hot Paths
+Times parsing, feature extraction, balancers and prediction; saves JSON results and flags regressions
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.module_loader import load_module
+
+RESULTS_DIR = os.path.join(ML_ROOT, 'evaluation', 'results')
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/70.0 Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 12_1 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:64.0) Gecko/20100101 Firefox/64.0',
+]
+
+def generate_log_lines(num_lines, minutes=600, seed=42):
+    """
+    Generate deterministic synthetic access log lines
+
+    Args:
+        num_lines: Number of lines to generate
+        minutes: Time span covered by the lines
+        seed: Random seed (same seed = same lines)
+    """
+    rng = random.Random(seed)
+    start = datetime(2019, 1, 22, 3, 0, 0, tzinfo=timezone(timedelta(hours=3, minutes=30)))
+    step = minutes * 60 / max(num_lines, 1)
+
+    lines = []
+    for i in range(num_lines):
+        ts = (start + timedelta(seconds=int(i * step))).strftime('%d/%b/%Y:%H:%M:%S %z')
+        method = 'POST' if rng.random() < 0.1 else 'GET'
+        endpoint = f"/product/{rng.randint(1, 500)}"
+        status = rng.choice((200, 200, 200, 200, 200, 200, 302, 404, 500))
+        size = rng.randint(100, 50000)
+        lines.append(
+            f'10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)} - - [{ts}] '
+            f'"{method} {endpoint} HTTP/1.1" {status} {size} "-" "{rng.choice(USER_AGENTS)}"'
+        )
+    return lines
+
+def time_callable(fn, repeat=5, number=1, items_per_call=1, setup=None):
+    """
+    Time a callable with perf_counter
+
+    Args:
+        fn: Callable to time (called with no arguments)
+        repeat: Number of timed rounds
+        number: Calls per round
+        items_per_call: Work items per call (lines, rows, decisions) for throughput
+        setup: Optional callable run before each round, outside the timed region
+
+    Returns:
+        Dict of timing statistics (seconds per call, items per second)
+    """
+    timings = []
+    sink = io.StringIO()
+
+    # Progress prints from pipeline functions go to a buffer, not the terminal
+    with contextlib.redirect_stdout(sink):
+        fn()  # Warm-up
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            timings.append((time.perf_counter() - start) / number)
+            sink.seek(0)
+            sink.truncate()
+
+    median = statistics.median(timings)
+    return {
+        'repeat': repeat,
+        'number': number,
+        'items_per_call': items_per_call,
+        'min_s': min(timings),
+        'median_s': median,
+        'mean_s': statistics.mean(timings),
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'items_per_sec': items_per_call / median if median > 0 else float('inf')
+    }
+
+def bench_parsing(num_lines):
+    """Benchmark parse_log_line and parse_access_log"""
+    parse_logs = load_module('preprocessing/parse_logs.py')
+    lines = generate_log_lines(num_lines)
+    results = {}
+
+    def parse_lines():
+        for line in lines:
+            parse_logs.parse_log_line(line)
+
+    results['parse_log_line'] = time_callable(parse_lines, repeat=5, items_per_call=len(lines))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = os.path.join(tmp_dir, 'access.log')
+        output_file = os.path.join(tmp_dir, 'parsed_logs.csv')
+        with open(log_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        def remove_output():
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+        # tqdm writes to stderr; silence it so timings aren't dominated by terminal I/O
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            results['parse_access_log'] = time_callable(
+                lambda: parse_logs.parse_access_log(log_file, output_file),
+                repeat=3, items_per_call=len(lines), setup=remove_output
+            )
+
+    return results
+
+def build_feature_frames(num_lines):
+    """Run the feature pipeline on synthetic logs (returns parsed and aggregated frames)"""
+    import pandas as pd
+
+    parse_logs = load_module('preprocessing/parse_logs.py')
+    extract_features = load_module('preprocessing/extract_features.py')
+
+    rows = [parse_logs.parse_log_line(line) for line in generate_log_lines(num_lines)]
+    df = pd.DataFrame([row for row in rows if row])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = extract_features.extract_temporal_features(df)
+        df = extract_features.extract_request_features(df)
+        df_metrics = extract_features.aggregate_metrics(df, interval='1min')
+
+    return df, df_metrics
+
+def bench_features(num_lines):
+    """Benchmark aggregate_metrics and create_time_series_features"""
+    extract_features = load_module('preprocessing/extract_features.py')
+    df, df_metrics = build_feature_frames(num_lines)
+
+    return {
+        'aggregate_metrics': time_callable(
+            lambda: extract_features.aggregate_metrics(df, interval='1min'),
+            repeat=5, items_per_call=len(df)
+        ),
+        'create_time_series_features': time_callable(
+            lambda: extract_features.create_time_series_features(df_metrics, lookback=10),
+            repeat=5, items_per_call=len(df_metrics)
+        ),
+        **bench_feature_state(extract_features, df_metrics),
+        **bench_bot_detection(df)
+    }
+
+def bench_bot_detection(df):
+    """Benchmark is_bot: regex per row vs once per distinct user agent of a categorical column"""
+    interning = load_module('utils/interning.py')
+
+    user_agents = df['user_agent'].astype(str)
+    categorical = user_agents.astype('category')
+
+    return {
+        'is_bot.str_contains': time_callable(
+            lambda: user_agents.str.contains('bot|crawler|spider', case=False, na=False),
+            repeat=10, items_per_call=len(df)
+        ),
+        'is_bot.classify_unique': time_callable(
+            lambda: interning.classify_unique(categorical, interning.is_bot_agent),
+            repeat=10, items_per_call=len(df)
+        )
+    }
+
+def bench_feature_state(extract_features, df_metrics, lookback=10):
+    """Benchmark one new window: pandas rebuild over the recent history vs FeatureState.ingest"""
+    feature_state = load_module('deployment/feature_state.py')
+
+    recent = df_metrics.iloc[-(lookback + 1):]
+    with contextlib.redirect_stdout(io.StringIO()):
+        columns = extract_features.create_time_series_features(recent, lookback).columns
+    feature_cols = [col for col in columns if col != 'timestamp']
+    # No timestamps: rounds replay the same windows, which gap filling would reject as out of order
+    windows = df_metrics.drop(columns=['timestamp']).to_dict('records')
+    state = {}
+
+    def reset():
+        state['features'] = feature_state.FeatureState(feature_cols, lookback=lookback)
+
+    def ingest_all():
+        ingest = state['features'].ingest
+        for window in windows:
+            ingest(window)
+
+    reset()
+    return {
+        'create_time_series_features.recent': time_callable(
+            lambda: extract_features.create_time_series_features(recent, lookback=lookback), repeat=10, number=5
+        ),
+        'feature_state.ingest': time_callable(ingest_all, repeat=5, items_per_call=len(windows), setup=reset)
+    }
+
+def bench_balancers(num_decisions, num_servers=3):
+    """Benchmark get_next_server for each baseline balancer"""
+    import numpy as np
+    import pandas as pd
+
+    round_robin = load_module('models/1_round_robin/round_robin.py')
+    least_connection = load_module('models/2_least_connection/least_connection.py')
+    servers = [f"server_{i+1}" for i in range(num_servers)]
+    results = {}
+
+    rr = round_robin.RoundRobinBalancer(servers)
+
+    def route_round_robin():
+        get_next_server = rr.get_next_server
+        for _ in range(num_decisions):
+            get_next_server()
+
+    results['round_robin.get_next_server'] = time_callable(
+        route_round_robin, repeat=5, items_per_call=num_decisions, setup=rr.reset
+    )
+
+    lc = least_connection.LeastConnectionBalancer(servers)
+
+    def route_least_connection():
+        get_next_server = lc.get_next_server
+        for _ in range(num_decisions):
+            get_next_server()
+
+    results['least_connection.get_next_server'] = time_callable(
+        route_least_connection, repeat=5, items_per_call=num_decisions, setup=lc.reset
+    )
+
+    # Cost-weighted mode with an endpoint cost lookup per request (paths repeat, so lookups hit the cache)
+    cost_model = load_module('models/8_endpoint_cost/cost_model.py')
+    paths = pd.Series([line.split('"')[1].split(' ')[1] for line in generate_log_lines(2000)])
+    costs = cost_model.EndpointCostModel.fit(pd.Series(['GET'] * len(paths)), paths, pd.Series(np.ones(len(paths))))
+    requests = paths.tolist() * (num_decisions // len(paths) + 1)
+    lc_cost = least_connection.LeastConnectionBalancer(servers, weighting='cost')
+
+    def route_least_cost():
+        get_next_server, estimate = lc_cost.get_next_server, costs.estimate
+        for path in requests[:num_decisions]:
+            get_next_server(estimate('GET', path))
+
+    results['least_cost.get_next_server'] = time_callable(
+        route_least_cost, repeat=5, items_per_call=num_decisions, setup=lc_cost.reset
+    )
+
+    return results
+
+def load_or_train_router(model_dir, num_lines):
+    """
+    Load Random Forest artifacts, or train a small model on synthetic features
+
+    Returns:
+        model, scaler, feature_cols, feature_rows (list of dicts)
+    """
+    import joblib
+    from sklearn.preprocessing import StandardScaler
+
+    extract_features = load_module('preprocessing/extract_features.py')
+    rf_train = load_module('models/3_random_forest/train.py')
+
+    _, df_metrics = build_feature_frames(num_lines)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_features = extract_features.create_time_series_features(df_metrics, lookback=10)
+
+    if model_dir and os.path.exists(os.path.join(model_dir, 'model.pkl')):
+        print(f"📖 Using trained model from: {model_dir}")
+        model = joblib.load(os.path.join(model_dir, 'model.pkl'))
+        scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+        with open(os.path.join(model_dir, 'feature_cols.json'), 'r') as f:
+            feature_cols = json.load(f)
+    else:
+        print("🌲 No trained model found, fitting Random Forest on synthetic features...")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            X, y, feature_cols = rf_train.prepare_data(df_features.copy(), num_servers=3)
+            scaler = StandardScaler()
+            model = rf_train.train_model(scaler.fit_transform(X), y, n_estimators=100, max_depth=10)
+
+    # Trained models keep verbose=1; joblib progress output would be timed along with inference
+    if hasattr(model, 'verbose'):
+        model.set_params(verbose=0)
+
+    feature_rows = df_features.reindex(columns=feature_cols, fill_value=0).to_dict('records')
+    return model, scaler, feature_cols, feature_rows
+
+def bench_prediction(model_dir, num_lines, batch_size=256, large_batch_size=4096):
+    """Benchmark predict_server single-row and predict_batch latency"""
+    import numpy as np
+
+    predict = load_module('models/3_random_forest/predict.py')
+    model, scaler, feature_cols, feature_rows = load_or_train_router(model_dir, num_lines)
+
+    # Single-row calls run the forest in-process; keep the model single-threaded like a request handler
+    if hasattr(model, 'n_jobs'):
+        model.set_params(n_jobs=1)
+
+    row = feature_rows[len(feature_rows) // 2]
+    batch = (feature_rows * (batch_size // len(feature_rows) + 1))[:batch_size]
+    large_batch = np.resize(predict.build_feature_matrix(feature_rows, feature_cols),
+                            (large_batch_size, len(feature_cols)))
+
+    # predict_server passes plain arrays to a scaler fitted on a DataFrame; skip the repeated warning
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return {
+            'predict_server.single': time_callable(
+                lambda: predict.predict_server(model, scaler, row, feature_cols),
+                repeat=20, number=5
+            ),
+            'predict_server.batch': time_callable(
+                lambda: predict.predict_batch(model, scaler, batch, feature_cols),
+                repeat=10, items_per_call=batch_size
+            ),
+            'predict_batch.array_4096': time_callable(
+                lambda: predict.predict_batch(model, scaler, large_batch, feature_cols),
+                repeat=5, items_per_call=large_batch_size
+            ),
+            **bench_compiled(model, scaler, feature_cols, row, batch),
+            **bench_cache(feature_cols, row),
+            **bench_columnar(feature_cols, batch)
+        }
+
+def bench_compiled(model, scaler, feature_cols, row, batch):
+    """Benchmark the compiled flat-array evaluator on the same rows"""
+    compiled_trees = load_module('deployment/compiled_trees.py')
+    predict = load_module('models/3_random_forest/predict.py')
+
+    compiled = compiled_trees.compile_model(model, scaler, feature_cols)
+    x = predict.build_feature_matrix([row], feature_cols)[0]
+    X = predict.build_feature_matrix(batch, feature_cols)
+
+    return {
+        'compiled.predict_one': time_callable(lambda: compiled.predict_one(x), repeat=20, number=20),
+        'compiled.predict_proba.batch': time_callable(
+            lambda: compiled.predict_proba(X), repeat=10, items_per_call=len(batch)
+        )
+    }
+
+def bench_cache(feature_cols, row):
+    """Benchmark a prediction cache hit (key build + lookup) for one routing row"""
+    prediction_cache = load_module('deployment/prediction_cache.py')
+
+    cache = prediction_cache.PredictionCache(default_step=0.01)
+    cache.put(cache.make_key('random-forest', 1, row, feature_cols), {'server_id': 0})
+
+    return {
+        'prediction_cache.hit': time_callable(
+            lambda: cache.get(cache.make_key('random-forest', 1, row, feature_cols)), repeat=20, number=200
+        )
+    }
+
+def bench_columnar(feature_cols, batch):
+    """Benchmark request decoding for a routing batch: JSON rows vs a packed float32 matrix"""
+    import json
+
+    columnar = load_module('deployment/columnar.py')
+    predict = load_module('models/3_random_forest/predict.py')
+
+    json_body = json.dumps(batch)
+    # Clients send their own column order; the server reorders to feature_cols
+    columns = list(reversed(feature_cols))
+    packed_body = columnar.encode_matrix(predict.build_feature_matrix(batch, columns), columns)
+
+    return {
+        'decode.json.batch': time_callable(
+            lambda: predict.build_feature_matrix(json.loads(json_body), feature_cols),
+            repeat=10, items_per_call=len(batch)
+        ),
+        'decode.columnar.batch': time_callable(
+            lambda: columnar.to_feature_matrix(*columnar.decode_matrix(packed_body), feature_cols),
+            repeat=10, number=20, items_per_call=len(batch)
+        )
+    }
+
+def bench_rate_limiter(num_checks, num_clients=50000, batch_size=4096):
+    """Benchmark AdaptiveRateLimiter: bulk checks (small and large batches, Zipf-skewed clients) and single checks"""
+    import numpy as np
+
+    rate_limiter = load_module('deployment/rate_limiter.py')
+    rng = np.random.default_rng(42)
+    clients = np.array([rate_limiter.client_key(f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}")
+                        for i in range(num_clients)], dtype=object)
+    keys = clients[rng.zipf(1.3, num_checks) % num_clients]
+    batches = [keys[i:i + batch_size] for i in range(0, num_checks, batch_size)]
+    single = keys[:min(num_checks, 20000)].tolist()
+    limiter = rate_limiter.AdaptiveRateLimiter(max_clients=num_clients)
+    # A live anomaly level, so the heavy-hitter path is timed too
+    limiter.observe_anomaly({'anomaly_score': -0.1, 'is_anomaly': True})
+
+    def check_batches():
+        check_many = limiter.check_many
+        for batch in batches:
+            check_many(batch)
+
+    def check_single():
+        check = limiter.check
+        for key in single:
+            check(key)
+
+    return {
+        'rate_limiter.check_many': time_callable(check_batches, repeat=5, items_per_call=num_checks),
+        'rate_limiter.check_many.large': time_callable(lambda: limiter.check_many(keys), repeat=5,
+                                                       items_per_call=num_checks),
+        'rate_limiter.check': time_callable(check_single, repeat=3, items_per_call=len(single))
+    }
+
+def git_commit():
+    """Current git commit hash (None outside a checkout)"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ML_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def machine_metadata():
+    """Collect machine and library metadata for a results file"""
+    metadata = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'libraries': {}
+    }
+
+    for lib in ('numpy', 'pandas', 'sklearn', 'xgboost'):
+        try:
+            metadata['libraries'][lib] = __import__(lib).__version__
+        except ImportError:
+            metadata['libraries'][lib] = None
+
+    return metadata
+
+def run_benchmarks(suites, num_lines=20000, num_decisions=100000, model_dir=None):
+    """
+    Run the selected benchmark suites
+
+    Args:
+        suites: Suite names to run ('parsing', 'features', 'balancers', 'prediction', 'ratelimit')
+        num_lines: Synthetic log lines for parsing/feature benchmarks
+        num_decisions: Routing decisions per balancer round
+        model_dir: Directory with model.pkl/scaler.pkl/feature_cols.json (optional)
+    """
+    runners = {
+        'parsing': lambda: bench_parsing(num_lines),
+        'features': lambda: bench_features(num_lines),
+        'balancers': lambda: bench_balancers(num_decisions),
+        'prediction': lambda: bench_prediction(model_dir, num_lines),
+        'ratelimit': lambda: bench_rate_limiter(num_decisions * 10)
+    }
+
+    results = {}
+    for suite in suites:
+        print(f"⏱️ Running {suite} benchmarks...")
+        for name, stats in runners[suite]().items():
+            results[name] = stats
+            print(f"   {name}: {stats['median_s'] * 1000:.3f} ms/call, "
+                  f"{stats['items_per_sec']:,.0f} items/s")
+
+    return {
+        'metadata': machine_metadata(),
+        'config': {
+            'suites': list(suites),
+            'num_lines': num_lines,
+            'num_decisions': num_decisions,
+            'model_dir': model_dir
+        },
+        'results': results
+    }
+
+def save_results(report, output_file=None):
+    """Save a benchmark report as JSON"""
+    if output_file is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_file = os.path.join(RESULTS_DIR, f"benchmark_{stamp}.json")
+
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"💾 Saved benchmark results to: {output_file}")
+    return output_file
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    Compare two benchmark reports
+
+    Args:
+        baseline: Baseline report dict
+        current: Current report dict
+        threshold: Relative slowdown of the median that counts as a regression (0.10 = 10%)
+
+    Returns:
+        List of comparison rows (dicts), regressions flagged with 'regression': True;
+        ratio is None when the baseline median is zero (too fast for the timer)
+    """
+    rows = []
+    for name, current_stats in current['results'].items():
+        baseline_stats = baseline['results'].get(name)
+        if baseline_stats is None:
+            continue
+
+        ratio = current_stats['median_s'] / baseline_stats['median_s'] if baseline_stats['median_s'] > 0 else None
+        rows.append({
+            'name': name,
+            'baseline_s': baseline_stats['median_s'],
+            'current_s': current_stats['median_s'],
+            'ratio': ratio,
+            'regression': ratio is not None and ratio > 1 + threshold,
+            'improvement': ratio is not None and ratio < 1 - threshold
+        })
+
+    return rows
+
+def print_comparison(rows, threshold):
+    """Print a comparison table"""
+    print(f"\n📊 Benchmark comparison (threshold: {threshold:.0%})\n")
+    print(f"   {'benchmark':<36} {'baseline ms':>12} {'current ms':>12} {'change':>9}")
+    for row in rows:
+        flag = '❌ REGRESSION' if row['regression'] else ('✅ faster' if row['improvement'] else '')
+        change = f"{row['ratio'] - 1:>+8.1%}" if row['ratio'] is not None else f"{'n/a':>8}"
+        print(f"   {row['name']:<36} {row['baseline_s'] * 1000:>12.3f} {row['current_s'] * 1000:>12.3f} "
+              f"{change}  {flag}")
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark the ML hot paths')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run benchmarks and save results')
+    run_parser.add_argument('--suite', action='append', choices=['parsing', 'features', 'balancers', 'prediction',
+                                                                  'ratelimit'],
+                            help='Suite to run (repeatable, default: all)')
+    run_parser.add_argument('--lines', type=int, default=20000, help='Synthetic log lines')
+    run_parser.add_argument('--decisions', type=int, default=100000, help='Routing decisions per round')
+    run_parser.add_argument('--model-dir', default=os.path.join(ML_ROOT, 'models', '3_random_forest'),
+                            help='Directory with trained Random Forest artifacts')
+    run_parser.add_argument('--output', help='Output JSON file (default: evaluation/results/)')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline', help='Baseline results JSON')
+    compare_parser.add_argument('current', help='Current results JSON')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='Relative slowdown flagged as regression (default: 0.10)')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        suites = args.suite or ['parsing', 'features', 'balancers', 'prediction', 'ratelimit']
+        report = run_benchmarks(suites, num_lines=args.lines, num_decisions=args.decisions,
+                                model_dir=args.model_dir)
+        save_results(report, args.output)
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r') as f:
+        current = json.load(f)
+
+    rows = compare_results(baseline, current, threshold=args.threshold)
+    print_comparison(rows, args.threshold)
+
+    regressions = [row['name'] for row in rows if row['regression']]
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+
+    print("\n✅ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Hyperparameter Search for the Routing Models
+Successive halving over a process pool, scoring accuracy and measured per-row prediction latency
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.module_loader import load_module
+from utils.resources import apply_cpu_budget, get_n_jobs
+
+# Written next to model.pkl; train.py picks it up on the next training run
+TUNED_PARAMS_FILE = 'tuned_params.json'
+
+MODEL_DIRS = {
+    'random-forest': os.path.join(ML_ROOT, 'models', '3_random_forest'),
+    'xgboost': os.path.join(ML_ROOT, 'models', '4_xgboost')
+}
+
+SEARCH_SPACES = {
+    'random-forest': {
+        'n_estimators': [10, 25, 50, 100, 200],
+        'max_depth': [4, 6, 8, 10, 12, None],
+        'min_samples_split': [2, 5, 10],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': ['sqrt', 0.5, 1.0]
+    },
+    'xgboost': {
+        'n_estimators': [25, 50, 100, 200, 300],
+        'max_depth': [2, 3, 4, 6, 8],
+        'learning_rate': [0.03, 0.1, 0.3],
+        'subsample': [0.7, 0.8, 1.0],
+        'colsample_bytree': [0.6, 0.8, 1.0],
+        'min_child_weight': [1, 3, 5]
+    }
+}
+
+def load_tuned_params(model_dir='.'):
+    """
+    Parameters chosen by the last search for a model folder
+
+    Returns:
+        Dict of estimator parameters ({} if the folder has no tuned_params.json)
+    """
+    path = os.path.join(model_dir, TUNED_PARAMS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)['params']
+
+def sample_candidates(space, n_candidates, seed=42):
+    """Draw distinct random configurations from a grid of choices"""
+    rng = random.Random(seed)
+    total = math.prod(len(values) for values in space.values())
+    candidates, seen = [], set()
+    while len(candidates) < min(n_candidates, total):
+        params = {name: rng.choice(values) for name, values in space.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+def build_estimator(kind, params):
+    """Estimator with the trainers' fixed settings plus the searched parameters"""
+    if kind == 'random-forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=42, n_jobs=get_n_jobs(), **params)
+
+    import xgboost as xgb
+    return xgb.XGBClassifier(random_state=42, n_jobs=get_n_jobs(), eval_metric='mlogloss', **params)
+
+def measure_latency(model, scaler, feature_cols, X_rows, runtime='compiled', calls=200):
+    """
+    Median single-row prediction latency
+
+    Args:
+        model: Fitted estimator
+        scaler: Fitted scaler (rows are unscaled)
+        X_rows: Unscaled rows to cycle through
+        runtime: 'compiled' (flat node arrays, the model server's path) or 'native' (predict_proba)
+        calls: Timed calls
+
+    Returns:
+        Median seconds per row
+    """
+    if runtime == 'compiled':
+        compiled_trees = load_module('deployment/compiled_trees.py')
+        compiled = compiled_trees.compile_model(model, scaler, feature_cols)
+        predict_row = compiled.predict_one
+    else:
+        predict_row = lambda x: model.predict_proba(scaler.transform(x.reshape(1, -1)))
+
+    rows = [np.ascontiguousarray(row) for row in X_rows[:50]]
+    for row in rows[:5]:
+        predict_row(row)
+
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        predict_row(rows[i % len(rows)])
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+# Data for pool workers, set once per process by _init_worker
+_worker_data = None
+
+def _init_worker(data, cpus):
+    global _worker_data
+    _worker_data = data
+    apply_cpu_budget(cpus)
+
+def evaluate_candidate(kind, params, fraction, runtime, data=None):
+    """
+    Fit a candidate on a fraction of the tuning split and score it on the validation split
+
+    Args:
+        kind: 'random-forest' or 'xgboost'
+        params: Searched parameters
+        fraction: Share of the training rows to use (the successive halving resource)
+        runtime: Latency runtime ('compiled' or 'native')
+        data: Prepared split dict (default: the pool worker's copy)
+
+    Returns:
+        Trial dict with accuracy, latency_us and fit_s
+    """
+    from sklearn.metrics import accuracy_score
+
+    data = data or _worker_data
+    X_train, y_train = data['X_train'], data['y_train']
+    n_rows = max(int(len(X_train) * fraction), 10 * len(np.unique(y_train)))
+    rows = np.random.default_rng(0).permutation(len(X_train))[:n_rows]
+
+    start = time.perf_counter()
+    model = build_estimator(kind, params)
+    model.fit(data['scaler'].transform(X_train[rows]), y_train[rows])
+    fit_s = time.perf_counter() - start
+
+    accuracy = accuracy_score(data['y_val'], model.predict(data['scaler'].transform(data['X_val'])))
+    latency = measure_latency(model, data['scaler'], data['feature_cols'], data['X_val'], runtime)
+
+    return {
+        'params': params,
+        'fraction': fraction,
+        'rows': int(n_rows),
+        'accuracy': float(accuracy),
+        'latency_us': latency * 1e6,
+        'fit_s': fit_s
+    }
+
+def rank_key(trial, latency_budget_us):
+    """Sort key: within the latency budget first, then accuracy, then latency"""
+    return (trial['latency_us'] <= latency_budget_us, trial['accuracy'], -trial['latency_us'])
+
+def pareto_front(trials):
+    """Trials not dominated on (higher accuracy, lower latency), fastest first"""
+    front = [
+        t for t in trials
+        if not any(o['accuracy'] >= t['accuracy'] and o['latency_us'] <= t['latency_us'] and
+                   (o['accuracy'] > t['accuracy'] or o['latency_us'] < t['latency_us']) for o in trials)
+    ]
+    return sorted(front, key=lambda t: t['latency_us'])
+
+def successive_halving(kind, data, candidates, eta=3, min_fraction=None, time_budget_s=600,
+                       latency_budget_us=200, runtime='compiled', jobs=None):
+    """
+    Successive halving: score all candidates on a small share of the data, keep the best 1/eta, repeat
+
+    Rungs use training fractions min_fraction, min_fraction*eta, ... 1.0. Candidates of
+    a rung run concurrently in a process pool, each worker limited to its share of the
+    CPUs (parallel fits would otherwise distort each other's latency). The time budget is
+    checked between candidates: once it runs out, unstarted candidates are cancelled and
+    the search ends with the rung reached so far.
+
+    Returns:
+        all_trials: Every completed trial
+        final_trials: Trials of the highest rung reached
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    import multiprocessing
+
+    cpus = os.cpu_count() or 1
+    jobs = max(1, min(jobs or cpus, len(candidates)))
+    rungs = max(1, round(math.log(len(candidates), eta)))
+    min_fraction = min_fraction or eta ** -(rungs - 1)
+    deadline = time.perf_counter() + time_budget_s
+
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+    all_trials, final_trials = [], []
+    fraction = min_fraction
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker,
+                             initargs=(data, max(1, cpus // jobs))) as pool:
+        while candidates:
+            fraction = min(fraction, 1.0)
+            print(f"\n🪜 Rung: {len(candidates)} candidates on {fraction:.0%} of the training rows")
+            futures = {pool.submit(evaluate_candidate, kind, params, fraction, runtime) for params in candidates}
+            rung_trials = []
+
+            while futures:
+                done, futures = wait(futures, timeout=max(0.0, deadline - time.perf_counter()),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial = future.result()
+                    rung_trials.append(trial)
+                    print(f"   acc={trial['accuracy']:.4f}  latency={trial['latency_us']:7.1f} µs  "
+                          f"fit={trial['fit_s']:.2f}s  {trial['params']}")
+                if time.perf_counter() >= deadline and futures:
+                    cancelled = sum(future.cancel() for future in futures)
+                    print(f"⏰ Time budget spent: cancelled {cancelled} queued candidates")
+                    wait(futures)
+                    rung_trials.extend(f.result() for f in futures if not f.cancelled())
+                    futures = set()
+
+            all_trials.extend(rung_trials)
+            if rung_trials:
+                final_trials = rung_trials
+            if fraction >= 1.0 or time.perf_counter() >= deadline or len(rung_trials) <= 1:
+                break
+
+            rung_trials.sort(key=lambda t: rank_key(t, latency_budget_us), reverse=True)
+            candidates = [t['params'] for t in rung_trials[:max(1, len(rung_trials) // eta)]]
+            fraction *= eta
+
+    return all_trials, final_trials
+
+def prepare_split(kind, features_file):
+    """Trainer's features/labels and train/test split, plus a validation split from the training rows"""
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    dataset = load_module('utils/dataset.py')
+    trainer = load_module(os.path.relpath(os.path.join(MODEL_DIRS[kind], 'train.py'), ML_ROOT))
+
+    X, y, feature_cols = trainer.prepare_data(dataset.read_features(features_file), num_servers=3)
+    X, y = X.to_numpy(dtype=np.float64), y.to_numpy()
+
+    # Same split as train.py; the test rows are only used for the final check
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.25, random_state=42,
+                                                  stratify=y_train)
+    return {
+        'feature_cols': feature_cols,
+        'scaler': StandardScaler().fit(X_fit),
+        'X_train': X_fit, 'y_train': y_fit,
+        'X_val': X_val, 'y_val': y_val,
+        'X_full': X_train, 'y_full': y_train,
+        'X_test': X_test, 'y_test': y_test
+    }
+
+def select_best(trials, latency_budget_us):
+    """Most accurate trial within the latency budget (fastest trial if none fits)"""
+    within = [t for t in trials if t['latency_us'] <= latency_budget_us]
+    if within:
+        return max(within, key=lambda t: (t['accuracy'], -t['latency_us']))
+    return min(trials, key=lambda t: t['latency_us'])
+
+def main():
+    """Search parameters for a routing model and write tuned_params.json"""
+    parser = argparse.ArgumentParser(description='Successive-halving search over accuracy and prediction latency')
+    parser.add_argument('model', choices=sorted(MODEL_DIRS))
+    parser.add_argument('--features', default=os.path.join(ML_ROOT, 'data', 'features', 'features.parquet'))
+    parser.add_argument('--candidates', type=int, default=27, help='Configurations sampled for the first rung')
+    parser.add_argument('--eta', type=int, default=3, help='Keep 1/eta of the candidates per rung')
+    parser.add_argument('--time-budget', type=float, default=600, help='Wall-clock budget in seconds')
+    parser.add_argument('--latency-budget-us', type=float, default=200, help='Per-row routing latency budget')
+    parser.add_argument('--runtime', choices=['compiled', 'native'], default='compiled',
+                        help='Latency of compiled node arrays (model server) or predict_proba')
+    parser.add_argument('--jobs', type=int, help='Parallel candidates (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help=f'Output file (default: <model dir>/{TUNED_PARAMS_FILE})')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.features):
+        print(f"❌ Features file not found: {args.features}")
+        return 1
+
+    from sklearn.metrics import accuracy_score
+
+    start = time.perf_counter()
+    data = prepare_split(args.model, args.features)
+    candidates = sample_candidates(SEARCH_SPACES[args.model], args.candidates, args.seed)
+    print(f"🎛️ Tuning {args.model}: {len(candidates)} candidates, eta={args.eta}, "
+          f"budget {args.time_budget:.0f}s, latency budget {args.latency_budget_us:.0f} µs ({args.runtime})")
+
+    all_trials, final_trials = successive_halving(
+        args.model, data, candidates, eta=args.eta, time_budget_s=args.time_budget,
+        latency_budget_us=args.latency_budget_us, runtime=args.runtime, jobs=args.jobs
+    )
+    if not final_trials:
+        print("❌ No candidate finished within the time budget")
+        return 1
+
+    front = pareto_front(final_trials)
+    best = select_best(front, args.latency_budget_us)
+
+    print(f"\n📈 Pareto front ({len(front)} configs, final rung):")
+    for t in front:
+        marker = '⭐' if t is best else '  '
+        print(f"   {marker} acc={t['accuracy']:.4f}  latency={t['latency_us']:7.1f} µs  {t['params']}")
+
+    # Refit the winner on all training rows; latency measured again without other workers running
+    model = build_estimator(args.model, best['params'])
+    model.fit(data['scaler'].transform(data['X_full']), data['y_full'])
+    test_accuracy = accuracy_score(data['y_test'], model.predict(data['scaler'].transform(data['X_test'])))
+    latency_us = measure_latency(model, data['scaler'], data['feature_cols'], data['X_test'], args.runtime) * 1e6
+
+    result = {
+        'model': args.model,
+        'params': best['params'],
+        'validation_accuracy': best['accuracy'],
+        'test_accuracy': float(test_accuracy),
+        'latency_us': latency_us,
+        'within_latency_budget': latency_us <= args.latency_budget_us,
+        'config': {
+            'candidates': len(candidates),
+            'eta': args.eta,
+            'time_budget_s': args.time_budget,
+            'latency_budget_us': args.latency_budget_us,
+            'runtime': args.runtime,
+            'seed': args.seed
+        },
+        'search_s': time.perf_counter() - start,
+        'pareto_front': front,
+        'trials': all_trials
+    }
+
+    output_file = args.output or os.path.join(MODEL_DIRS[args.model], TUNED_PARAMS_FILE)
+    with open(output_file, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\n✅ Best: {best['params']}")
+    print(f"   Test accuracy: {test_accuracy:.4f}, latency: {latency_us:.1f} µs/row "
+          f"({'within' if result['within_latency_budget'] else 'over'} the {args.latency_budget_us:.0f} µs budget)")
+    print(f"   Search time: {result['search_s']:.1f}s")
+    print(f"💾 Saved to: {output_file} (used by train.py on the next run)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
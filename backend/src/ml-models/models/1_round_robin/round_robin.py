@@ -80,18 +80,20 @@ def simulate_load_balancing(num_requests=1000, num_servers=3):
     # Initialize balancer
     balancer = RoundRobinBalancer(servers)
     
-    # Simulate requests
-    start_time = time.time()
+    # Simulate requests in chunks; only routing calls are timed, progress prints are not
+    elapsed = 0.0
+    chunk_size = max(1, num_requests // 10)
     
-    for i in range(num_requests):
-        server = balancer.get_next_server()
+    for chunk_start in range(0, num_requests, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, num_requests)
+        
+        start_time = time.perf_counter()
+        for _ in range(chunk_start, chunk_end):
+            balancer.get_next_server()
+        elapsed += time.perf_counter() - start_time
         
         # Print progress
-        if (i + 1) % (num_requests // 10) == 0:
-            print(f"✅ Processed {i + 1}/{num_requests} requests")
-    
-    end_time = time.time()
-    elapsed = end_time - start_time
+        print(f"✅ Processed {chunk_end}/{num_requests} requests")
     
     # Get metrics
     metrics = balancer.get_metrics()
@@ -101,7 +103,7 @@ def simulate_load_balancing(num_requests=1000, num_servers=3):
     # Display results
     print(f"\n📊 Round Robin Results:")
     print(f"   Total Requests: {metrics['total_requests']}")
-    print(f"   Elapsed Time: {elapsed:.2f}s")
+    print(f"   Elapsed Time: {elapsed:.4f}s")
     print(f"   Throughput: {metrics['throughput']:.0f} req/s")
     print(f"   Fairness Score: {metrics['fairness_score']:.3f}")
     print(f"\n   Server Distribution:")
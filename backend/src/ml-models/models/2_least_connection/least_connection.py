@@ -1,11 +1,12 @@
 """
 Least Connection Load Balancer - Dynamic Baseline Algorithm
-Routes requests to server with fewest active connections
+Routes requests to server with fewest active connections (or least outstanding request cost)
 """
 
 import json
 import time
 import random
+from operator import attrgetter
 from typing import List, Dict
 
 class Server:
@@ -15,70 +16,94 @@ class Server:
         self.name = name
         self.active_connections = 0
         self.total_requests = 0
+        self.active_cost = 0.0
+        self.total_cost = 0.0
         
-    def add_connection(self):
-        """Add a new connection"""
+    def add_connection(self, cost: float = 1.0):
+        """Add a new connection (cost = expected service time, see models/8_endpoint_cost)"""
         self.active_connections += 1
         self.total_requests += 1
+        self.active_cost += cost
+        self.total_cost += cost
         
-    def release_connection(self):
+    def release_connection(self, cost: float = 1.0):
         """Release a connection"""
         self.active_connections = max(0, self.active_connections - 1)
+        self.active_cost = max(0.0, self.active_cost - cost) if self.active_connections else 0.0
         
     def __repr__(self):
         return f"Server({self.name}, connections={self.active_connections})"
 
 class LeastConnectionBalancer:
-    """Least Connection Load Balancing Algorithm"""
+    """
+    Least Connection Load Balancing Algorithm
+    
+    With weighting='cost' each request counts with its expected service time
+    instead of 1, so a few expensive requests spread across servers instead of
+    piling onto the one with the fewest (cheap) connections.
+    """
+    
+    WEIGHTINGS = {'connections': 'active_connections', 'cost': 'active_cost'}
     
-    def __init__(self, server_names: List[str]):
+    def __init__(self, server_names: List[str], weighting: str = 'connections'):
         """
         Initialize Least Connection balancer
         
         Args:
             server_names: List of server names/IDs
+            weighting: 'connections' (count requests) or 'cost' (sum expected request costs)
         """
+        if weighting not in self.WEIGHTINGS:
+            raise ValueError(f"weighting must be one of {sorted(self.WEIGHTINGS)}, got '{weighting}'")
         self.servers = [Server(name) for name in server_names]
+        self.by_name = {server.name: server for server in self.servers}
+        self.weighting = weighting
+        self._load = attrgetter(self.WEIGHTINGS[weighting])
         self.total_requests = 0
         
-    def get_next_server(self) -> str:
+    def get_next_server(self, cost: float = 1.0) -> str:
         """
-        Get server with least connections
+        Get server with least connections (or least outstanding cost)
+        
+        Args:
+            cost: Expected cost of this request (EndpointCostModel.estimate)
         
         Returns:
             Server name/ID
         """
-        # Find server with minimum connections
-        min_server = min(self.servers, key=lambda s: s.active_connections)
-        min_server.add_connection()
+        # Find server with minimum load
+        min_server = min(self.servers, key=self._load)
+        min_server.add_connection(cost)
         self.total_requests += 1
         
         return min_server.name
     
-    def release_connection(self, server_name: str):
+    def release_connection(self, server_name: str, cost: float = 1.0):
         """
         Release connection from server
         
         Args:
             server_name: Name of server to release connection from
+            cost: Cost the request was assigned with
         """
-        for server in self.servers:
-            if server.name == server_name:
-                server.release_connection()
-                break
+        server = self.by_name.get(server_name)
+        if server is not None:
+            server.release_connection(cost)
     
     def get_metrics(self) -> Dict:
         """Get balancer metrics"""
         server_stats = {
             server.name: {
                 'active_connections': server.active_connections,
-                'total_requests': server.total_requests
+                'total_requests': server.total_requests,
+                'active_cost': server.active_cost,
+                'total_cost': server.total_cost
             }
             for server in self.servers
         }
         
         return {
-            'algorithm': 'Least Connection',
+            'algorithm': 'Least Cost' if self.weighting == 'cost' else 'Least Connection',
             'total_requests': self.total_requests,
             'server_stats': server_stats,
             'load_balance_score': self._calculate_load_balance()
@@ -103,6 +128,8 @@ class LeastConnectionBalancer:
         for server in self.servers:
             server.active_connections = 0
             server.total_requests = 0
+            server.active_cost = 0.0
+            server.total_cost = 0.0
         self.total_requests = 0
 
 def simulate_load_balancing(num_requests=1000, num_servers=3, avg_duration=0.1):
@@ -5,49 +5,104 @@ Load trained model and make predictions for load balancing
 
 import joblib
 import json
+import os
 import numpy as np
-import pandas as pd
 
-def load_model():
-    """Load trained Random Forest model"""
+def load_model(model_dir='.'):
+    """
+    Load trained Random Forest model
+    
+    Args:
+        model_dir: Directory containing model.pkl, scaler.pkl and feature_cols.json
+    """
     print("📖 Loading Random Forest model...")
     
-    model = joblib.load('model.pkl')
-    scaler = joblib.load('scaler.pkl')
+    model = joblib.load(os.path.join(model_dir, 'model.pkl'))
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
     
-    with open('feature_cols.json', 'r') as f:
+    with open(os.path.join(model_dir, 'feature_cols.json'), 'r') as f:
         feature_cols = json.load(f)
     
+    # The scaler was fitted on a DataFrame; predictions pass arrays already in
+    # feature_cols order, so drop the names to skip a warning on every transform
+    if hasattr(scaler, 'feature_names_in_'):
+        del scaler.feature_names_in_
+    
+    # Trained with verbose=1; joblib progress logs would print on every prediction
+    if getattr(model, 'verbose', 0):
+        model.set_params(verbose=0)
+    
     print("✅ Model loaded successfully!")
     return model, scaler, feature_cols
 
-def predict_server(model, scaler, features, feature_cols):
+def build_feature_matrix(features, feature_cols):
     """
-    Predict best server for given features
+    Convert a batch of features to a float matrix in feature_cols order
+    
+    Args:
+        features: DataFrame, list of dicts, or 2-D array (columns already in feature_cols order)
+        feature_cols: List of feature column names
+    
+    Returns:
+        X: float64 array of shape (n_rows, len(feature_cols)); missing features = 0
+    """
+    # DataFrame check without importing pandas (keeps the predict path's startup light)
+    if type(features).__name__ == 'DataFrame' and hasattr(features, 'reindex'):
+        return features.reindex(columns=feature_cols, fill_value=0).to_numpy(dtype=np.float64)
+    
+    if isinstance(features, (list, tuple)) and features and isinstance(features[0], dict):
+        return np.array([[row.get(col, 0) for col in feature_cols] for row in features], dtype=np.float64)
+    
+    X = np.asarray(features, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(feature_cols):
+        raise ValueError(f"Expected a 2-D array with {len(feature_cols)} columns, got shape {X.shape}")
+    return X
+
+def predict_batch(model, scaler, features, feature_cols):
+    """
+    Predict best server for a batch of feature rows
+    
+    Runs a single predict_proba pass over the whole batch; the predicted
+    server is the argmax of those probabilities (same as model.predict).
     
     Args:
         model: Trained Random Forest model
         scaler: Feature scaler
-        features: Dict of feature values
+        features: DataFrame, list of dicts, or 2-D array (see build_feature_matrix)
         feature_cols: List of feature column names
     
     Returns:
-        server_id: Predicted server ID (0, 1, 2, ...)
+        server_ids: int array of predicted server IDs, shape (n_rows,)
+        probabilities: array of class probabilities, shape (n_rows, n_classes)
     """
-    # Create feature vector
-    feature_vector = [features.get(col, 0) for col in feature_cols]
-    feature_vector = np.array(feature_vector).reshape(1, -1)
+    X = build_feature_matrix(features, feature_cols)
     
     # Scale features
-    feature_vector_scaled = scaler.transform(feature_vector)
+    X_scaled = scaler.transform(X)
     
-    # Predict
-    server_id = model.predict(feature_vector_scaled)[0]
+    # Predict (one pass through the forest)
+    probabilities = model.predict_proba(X_scaled)
+    server_ids = model.classes_[probabilities.argmax(axis=1)].astype(int)
+    
+    return server_ids, probabilities
+
+def predict_server(model, scaler, features, feature_cols):
+    """
+    Predict best server for given features
     
-    # Get prediction probabilities
-    probabilities = model.predict_proba(feature_vector_scaled)[0]
+    Args:
+        model: Trained Random Forest model
+        scaler: Feature scaler
+        features: Dict of feature values
+        feature_cols: List of feature column names
+    
+    Returns:
+        server_id: Predicted server ID (0, 1, 2, ...)
+        probabilities: Prediction probabilities per server
+    """
+    server_ids, probabilities = predict_batch(model, scaler, [features], feature_cols)
     
-    return int(server_id), probabilities
+    return int(server_ids[0]), probabilities[0]
 
 def main():
     """Example usage"""
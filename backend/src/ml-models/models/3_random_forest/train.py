@@ -9,37 +9,50 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+import argparse
 import joblib
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import sys
+import time
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import incremental, profiling
+from utils.dataset import read_features
+from utils.module_loader import load_module
+from utils.plotting import get_pyplot, get_seaborn, plots_enabled, save_figure
+from utils.resources import get_n_jobs
+
+tune = load_module('evaluation/tune.py')
 
 def load_features(features_file):
     """Load preprocessed features"""
     print(f"📖 Loading features from: {features_file}")
     
-    if features_file.endswith('.parquet'):
-        df = pd.read_parquet(features_file)
-    else:
-        df = pd.read_csv(features_file)
+    df = read_features(features_file)
     
     print(f"   Loaded {len(df)} samples")
     return df
 
-def prepare_data(df, num_servers=3):
+def prepare_data(df, num_servers=3, bins=None):
     """
     Prepare data for training
     
     Args:
         df: Features DataFrame
         num_servers: Number of servers to simulate
+        bins: request_count label edges (default: quantiles of df; incremental runs pass the saved ones)
     """
     print(f"🔧 Preparing data for {num_servers} servers...")
     
     # Create synthetic server labels based on load
     # High load -> server 0, Medium -> server 1, Low -> server 2
-    df['load_level'] = pd.qcut(df['request_count'], q=num_servers, labels=False, duplicates='drop')
+    if bins is None:
+        bins = incremental.load_level_bins(df['request_count'], num_servers)
+    df['load_level'] = pd.cut(df['request_count'], bins=[-np.inf] + list(bins[1:-1]) + [np.inf], labels=False)
     
     # Feature columns
     feature_cols = [
@@ -64,7 +77,7 @@ def prepare_data(df, num_servers=3):
     
     return X, y, feature_cols
 
-def train_model(X_train, y_train, n_estimators=100, max_depth=10):
+def train_model(X_train, y_train, n_estimators=100, max_depth=10, **params):
     """
     Train Random Forest model
     
@@ -73,17 +86,18 @@ def train_model(X_train, y_train, n_estimators=100, max_depth=10):
         y_train: Training labels
         n_estimators: Number of trees
         max_depth: Maximum tree depth
+        params: Other RandomForestClassifier parameters (e.g. from tuned_params.json)
     """
     print(f"🌲 Training Random Forest (n_estimators={n_estimators}, max_depth={max_depth})...")
     
+    params = {'min_samples_split': 10, 'min_samples_leaf': 5, **params}
     model = RandomForestClassifier(
         n_estimators=n_estimators,
         max_depth=max_depth,
-        min_samples_split=10,
-        min_samples_leaf=5,
         random_state=42,
-        n_jobs=-1,
-        verbose=1
+        n_jobs=get_n_jobs(),
+        verbose=1,
+        **params
     )
     
     model.fit(X_train, y_train)
@@ -108,13 +122,15 @@ def evaluate_model(model, X_test, y_test):
     print(classification_report(y_test, y_pred))
     
     # Save confusion matrix plot
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
-    plt.title('Confusion Matrix - Random Forest')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.savefig('confusion_matrix.png', dpi=300, bbox_inches='tight')
-    print(f"\n💾 Saved confusion matrix to: confusion_matrix.png")
+    if plots_enabled():
+        plt, sns = get_pyplot(), get_seaborn()
+        plt.figure(figsize=(8, 6))
+        sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
+        plt.title('Confusion Matrix - Random Forest')
+        plt.ylabel('True Label')
+        plt.xlabel('Predicted Label')
+        save_figure(plt, 'confusion_matrix.png')
+        print(f"\n💾 Saved confusion matrix to: confusion_matrix.png")
     
     return {
         'accuracy': accuracy,
@@ -130,13 +146,15 @@ def plot_feature_importance(model, feature_cols):
     indices = np.argsort(importances)[::-1]
     
     # Plot
-    plt.figure(figsize=(10, 6))
-    plt.title('Feature Importance - Random Forest')
-    plt.bar(range(len(importances)), importances[indices])
-    plt.xticks(range(len(importances)), [feature_cols[i] for i in indices], rotation=90)
-    plt.tight_layout()
-    plt.savefig('feature_importance.png', dpi=300, bbox_inches='tight')
-    print(f"💾 Saved feature importance to: feature_importance.png")
+    if plots_enabled():
+        plt = get_pyplot()
+        plt.figure(figsize=(10, 6))
+        plt.title('Feature Importance - Random Forest')
+        plt.bar(range(len(importances)), importances[indices])
+        plt.xticks(range(len(importances)), [feature_cols[i] for i in indices], rotation=90)
+        plt.tight_layout()
+        save_figure(plt, 'feature_importance.png')
+        print(f"💾 Saved feature importance to: feature_importance.png")
     
     # Print top features
     print("\n🔝 Top 10 Features:")
@@ -168,8 +186,124 @@ def save_model(model, scaler, feature_cols, metrics):
         json.dump(metrics, f, indent=2)
     print("   ✅ Saved metrics.json")
 
+def labelled_windows(df, feature_cols, bins):
+    """Features in the saved column order and labels from the saved edges"""
+    X, y, _ = prepare_data(df.copy(), bins=bins)
+    return X.reindex(columns=feature_cols, fill_value=0), y
+
+def train_incremental(df, new_trees=20, max_trees=300, holdout=0.2, verify=True, tolerance=0.01):
+    """
+    Refresh the saved forest with trees fitted only on windows newer than the last training
+    
+    The existing scaler and label edges are kept, so old and new trees agree on
+    feature scale and label meaning. Beyond max_trees the oldest trees are dropped.
+    The newest `holdout` share of the new windows is held out. With verify, a full
+    retrain on all older windows is scored on the same holdout and replaces the
+    incremental model if that is more than `tolerance` less accurate.
+    
+    Args:
+        df: Features DataFrame (full history, with timestamps)
+        new_trees: Trees added per run
+        max_trees: Forest size limit (sliding window over time)
+        holdout: Share of the new windows held out for the accuracy check
+        verify: Compare against a full retrain
+        tolerance: Accepted accuracy drop versus the full retrain
+    
+    Returns:
+        Metrics dict ({} if there was nothing new), or None if a full training is needed
+    """
+    state = incremental.load_state()
+    if state is None or not os.path.exists('model.pkl'):
+        print(f"⚠️ No {incremental.STATE_FILE} from a previous training; running a full training")
+        return None
+    
+    history, new, held_out = incremental.split_new_windows(df, state, holdout)
+    print(f"🔁 Incremental update: {len(new)} new windows since {state['trained_until']}, {len(held_out)} held out")
+    if len(new) == 0 or len(held_out) == 0:
+        print("   Not enough new windows; model unchanged")
+        return {}
+    
+    model = joblib.load('model.pkl')
+    scaler = joblib.load('scaler.pkl')
+    with open('feature_cols.json', 'r') as f:
+        feature_cols = json.load(f)
+    bins = state['load_level_bins']
+    
+    X_new, y_new = labelled_windows(new, feature_cols, bins)
+    X_hold, y_hold = labelled_windows(held_out, feature_cols, bins)
+    
+    # Trees that never saw a class would break the forest's probability averaging
+    missing = sorted(set(model.classes_) - set(np.unique(y_new)))
+    if missing:
+        print(f"⚠️ New windows have no samples of class(es) {missing}; running a full training")
+        return None
+    
+    start = time.perf_counter()
+    n_before = len(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=n_before + new_trees, n_jobs=get_n_jobs(), verbose=0)
+    model.fit(scaler.transform(X_new), y_new)
+    model.set_params(warm_start=False)
+    dropped = max(0, len(model.estimators_) - max_trees)
+    if dropped:
+        # The oldest trees learned the oldest traffic
+        del model.estimators_[:dropped]
+        model.set_params(n_estimators=len(model.estimators_))
+    fit_s = time.perf_counter() - start
+    
+    accuracy = accuracy_score(y_hold, model.predict(scaler.transform(X_hold)))
+    report = {
+        'new_windows': len(new),
+        'holdout_windows': len(held_out),
+        'trees_added': new_trees,
+        'trees_dropped': dropped,
+        'n_trees': len(model.estimators_),
+        'fit_s': fit_s,
+        'holdout_accuracy': accuracy,
+        'used': 'incremental'
+    }
+    print(f"   +{new_trees} trees (-{dropped} oldest) in {fit_s:.2f}s, holdout accuracy: {accuracy:.4f}")
+    
+    rows = state['rows'] + len(new)
+    if verify:
+        X_all, y_all = labelled_windows(pd.concat([history, new]), feature_cols, bins)
+        start = time.perf_counter()
+        full_scaler = StandardScaler()
+        params = {'n_estimators': 100, 'max_depth': 10, **tune.load_tuned_params()}
+        full_model = train_model(full_scaler.fit_transform(X_all), y_all, **params)
+        full_accuracy = accuracy_score(y_hold, full_model.predict(full_scaler.transform(X_hold)))
+        report.update(full_retrain_accuracy=full_accuracy, full_fit_s=time.perf_counter() - start)
+        print(f"   Full retrain: {report['full_fit_s']:.2f}s, holdout accuracy: {full_accuracy:.4f}")
+        
+        if accuracy < full_accuracy - tolerance:
+            print(f"⚠️ Incremental model is {full_accuracy - accuracy:.2%} less accurate; keeping the full retrain")
+            model, scaler, accuracy, rows = full_model, full_scaler, full_accuracy, len(X_all)
+            report['used'] = 'full'
+    
+    metrics = {
+        'accuracy': accuracy,
+        'classification_report': classification_report(
+            y_hold, model.predict(scaler.transform(X_hold)), output_dict=True
+        ),
+        'incremental': report
+    }
+    metrics['feature_importance'] = plot_feature_importance(model, feature_cols)
+    save_model(model, scaler, feature_cols, metrics)
+    # The holdout windows count as new again next time
+    incremental.save_state(new['timestamp'].max(), rows, bins, last_run=report)
+    return metrics
+
 def main():
     """Main training pipeline"""
+    parser = argparse.ArgumentParser(description='Train the Random Forest router')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Add trees fitted only on windows newer than the last training')
+    parser.add_argument('--new-trees', type=int, default=20, help='Trees added per incremental run')
+    parser.add_argument('--max-trees', type=int, default=300, help='Drop the oldest trees beyond this many')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Share of the new windows held out')
+    parser.add_argument('--no-verify', action='store_true', help='Skip the comparison with a full retrain')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Accepted accuracy drop vs a full retrain')
+    args = parser.parse_args()
+    
     print("🚀 Random Forest Training Pipeline\n")
     
     # Paths
@@ -184,37 +318,60 @@ def main():
         return
     
     # Load features
-    df = load_features(FEATURES_FILE)
+    with profiling.stage('load_features'):
+        df = load_features(FEATURES_FILE)
+    
+    if args.incremental:
+        with profiling.stage('incremental'):
+            metrics = train_incremental(df, args.new_trees, args.max_trees, args.holdout,
+                                        not args.no_verify, args.tolerance)
+        if metrics is not None:
+            if metrics:
+                print(f"\n✅ Incremental update complete! Holdout accuracy: {metrics['accuracy']:.2%}")
+            return
     
     # Prepare data
-    X, y, feature_cols = prepare_data(df, num_servers=3)
+    with profiling.stage('label_bins'):
+        bins = incremental.load_level_bins(df['request_count'], num_servers=3)
+    with profiling.stage('prepare'):
+        X, y, feature_cols = prepare_data(df, num_servers=3, bins=bins)
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    with profiling.stage('split'):
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y
+        )
     print(f"\n📊 Data Split:")
     print(f"   Training: {len(X_train)} samples")
     print(f"   Testing: {len(X_test)} samples")
     
     # Scale features
     print(f"\n🔧 Scaling features...")
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Train model
-    model = train_model(X_train_scaled, y_train, n_estimators=100, max_depth=10)
+    with profiling.stage('scale'):
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+    
+    # Train model (parameters from evaluation/tune.py when available)
+    params = tune.load_tuned_params()
+    if params:
+        print(f"\n🎛️ Using tuned parameters from {tune.TUNED_PARAMS_FILE}: {params}")
+    with profiling.stage('fit'):
+        model = train_model(X_train_scaled, y_train, **{'n_estimators': 100, 'max_depth': 10, **params})
     
     # Evaluate
-    metrics = evaluate_model(model, X_test_scaled, y_test)
+    with profiling.stage('evaluate'):
+        metrics = evaluate_model(model, X_test_scaled, y_test)
     
     # Feature importance
-    feature_importance = plot_feature_importance(model, feature_cols)
+    with profiling.stage('feature_importance'):
+        feature_importance = plot_feature_importance(model, feature_cols)
     metrics['feature_importance'] = feature_importance
     
     # Save everything
-    save_model(model, scaler, feature_cols, metrics)
+    with profiling.stage('save'):
+        save_model(model, scaler, feature_cols, metrics)
+        incremental.save_state(df['timestamp'].max(), len(df), bins)
     
     print("\n✅ Training complete!")
     print(f"\n📊 Final Accuracy: {metrics['accuracy']:.2%}")
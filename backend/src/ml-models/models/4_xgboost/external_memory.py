@@ -0,0 +1,250 @@
+"""
+XGBoost External-Memory Training
+Streams partitioned feature files through a DataIter into histogram pages on disk, so data size is bounded by disk, not RAM
+"""
+
+import glob
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import xgboost as xgb
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.resources import get_n_jobs
+
+# Same candidate list as prepare_data in train.py
+FEATURE_COLS = [
+    'request_count', 'avg_response_time', 'error_rate', 'bot_rate',
+    'hour', 'weekday', 'is_weekend',
+    'request_count_lag_1', 'request_count_lag_2', 'request_count_lag_3',
+    'request_count_lag_4', 'request_count_lag_5',
+    'avg_response_time_lag_1', 'avg_response_time_lag_2',
+    'error_rate_lag_1', 'error_rate_lag_2',
+    'request_count_rolling_mean', 'request_count_rolling_std'
+]
+
+def list_partitions(source):
+    """Feature files to stream: a single .parquet/.csv file, or every one in a directory (sorted)"""
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.parquet')) + glob.glob(os.path.join(source, '*.csv')))
+    else:
+        paths = [source]
+    if not paths:
+        raise FileNotFoundError(f"No .parquet or .csv partitions in {source}")
+    return paths
+
+def iter_frames(paths, batch_rows, columns=None):
+    """
+    Yield DataFrames of at most batch_rows rows, one partition at a time
+
+    Parquet files are read by record batch and CSV files in chunks, so only one
+    batch is in memory at once, however large a partition is.
+    """
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    for path in paths:
+        if path.endswith('.parquet'):
+            parquet = pq.ParquetFile(path)
+            names = [c for c in columns if c in parquet.schema_arrow.names] if columns else None
+            for batch in parquet.iter_batches(batch_size=batch_rows, columns=names):
+                yield batch.to_pandas()
+        else:
+            for chunk in pd.read_csv(path, chunksize=batch_rows):
+                yield chunk[[c for c in columns if c in chunk.columns]] if columns else chunk
+
+def scan_partitions(paths, batch_rows, num_servers=3):
+    """
+    One streaming pass for what training needs up front
+
+    Label edges equal pd.qcut on the full column: request_count values are
+    counted (memory grows with distinct values, not rows) and the quantiles are
+    interpolated from the cumulative counts the way np.quantile does.
+
+    Returns:
+        Dict with rows, feature_cols, load_level_bins and trained_until
+    """
+    values, counts = np.array([]), np.array([], dtype=np.int64)
+    rows, trained_until, columns = 0, None, None
+
+    for frame in iter_frames(paths, batch_rows, FEATURE_COLS + ['timestamp']):
+        if columns is None:
+            columns = [c for c in FEATURE_COLS if c in frame.columns]
+        rows += len(frame)
+        batch_values, batch_counts = np.unique(frame['request_count'].to_numpy(dtype=np.float64), return_counts=True)
+        merged = np.concatenate([values, batch_values])
+        values, inverse = np.unique(merged, return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([counts, batch_counts]),
+                             minlength=len(values)).astype(np.int64)
+        if 'timestamp' in frame.columns and len(frame):
+            newest = frame['timestamp'].max()
+            trained_until = newest if trained_until is None else max(trained_until, newest)
+
+    if rows == 0:
+        raise ValueError("Feature partitions contain no rows")
+
+    cumulative = np.cumsum(counts)
+    edges = []
+    for q in np.linspace(0, 1, num_servers + 1):
+        position = q * (rows - 1)
+        lower, upper = int(np.floor(position)), int(np.ceil(position))
+        lo = values[np.searchsorted(cumulative, lower, side='right')]
+        hi = values[np.searchsorted(cumulative, upper, side='right')]
+        edges.append(float(lo + (hi - lo) * (position - lower)))
+
+    return {
+        'rows': rows,
+        'feature_cols': columns,
+        'load_level_bins': sorted(set(edges)),
+        'trained_until': trained_until
+    }
+
+class FeatureBatchIter(xgb.DataIter):
+    """
+    Feeds feature partitions to XGBoost batch by batch
+
+    Labels come from the load-level edges; every `valid_every`-th row (by global
+    row index, so the split is identical on every pass) goes to the validation
+    iterator instead of the training one. Features are passed unscaled: trees
+    split on thresholds, so StandardScaler would not change the model.
+    """
+
+    def __init__(self, paths, feature_cols, bins, batch_rows=100000, subset='train', valid_every=5,
+                 cache_prefix=None):
+        self.paths = paths
+        self.feature_cols = feature_cols
+        self.inner_edges = np.asarray(bins[1:-1], dtype=np.float64)
+        self.batch_rows = batch_rows
+        self.subset = subset
+        self.valid_every = valid_every
+        self._frames = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def batches(self):
+        """(X, y) arrays for this subset, one batch at a time"""
+        offset = 0
+        for frame in iter_frames(self.paths, self.batch_rows, self.feature_cols):
+            X = frame.reindex(columns=self.feature_cols).to_numpy(dtype=np.float32)
+            # Right-closed bins, as pd.cut / pd.qcut
+            y = np.searchsorted(self.inner_edges, frame['request_count'].to_numpy(dtype=np.float64), side='left')
+            is_valid = (np.arange(offset, offset + len(frame)) % self.valid_every) == 0
+            offset += len(frame)
+            mask = is_valid if self.subset == 'valid' else ~is_valid
+            if mask.any():
+                yield X[mask], y[mask]
+
+    def next(self, input_data):
+        if self._frames is None:
+            self._frames = self.batches()
+        batch = next(self._frames, None)
+        if batch is None:
+            return False
+        input_data(data=batch[0], label=batch[1])
+        return True
+
+    def reset(self):
+        self._frames = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (MB)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+def train_external(source, params=None, batch_rows=100000, max_bin=256, valid_every=5, cache_dir=None,
+                   num_servers=3):
+    """
+    Train the XGBoost router without loading the data into memory
+
+    Histogram pages (ExtMemQuantileDMatrix, tree_method='hist') are built from
+    the iterator and cached on disk. Memory is roughly one batch of raw rows
+    plus the histogram cuts and the booster, independent of the total row count.
+
+    Args:
+        source: Feature file or directory of partitions (.parquet / .csv)
+        params: XGBClassifier-style parameters (n_estimators, max_depth, learning_rate, ...)
+        batch_rows: Rows per batch handed to XGBoost (main memory knob)
+        max_bin: Histogram bins per feature
+        valid_every: Every n-th row is held out for early stopping and accuracy
+        cache_dir: Where to put the page cache (default: a temporary directory, removed afterwards)
+
+    Returns:
+        model: XGBClassifier wrapping the trained booster
+        info: Dict with rows, feature_cols, load_level_bins, trained_until, accuracy, confusion_matrix, timings
+    """
+    params = {
+        'n_estimators': 100,
+        'max_depth': 6,
+        'learning_rate': 0.1,
+        'subsample': 0.8,
+        'colsample_bytree': 0.8,
+        **(params or {})
+    }
+    paths = list_partitions(source)
+
+    start = time.perf_counter()
+    info = scan_partitions(paths, batch_rows, num_servers)
+    feature_cols, bins = info['feature_cols'], info['load_level_bins']
+    n_classes = len(bins) - 1
+    print(f"   {info['rows']:,} rows in {len(paths)} partition(s), {len(feature_cols)} features, "
+          f"{n_classes} classes (scan {time.perf_counter() - start:.1f}s)")
+
+    own_cache = cache_dir is None
+    cache_dir = cache_dir or tempfile.mkdtemp(prefix='xgb-extmem-')
+    os.makedirs(cache_dir, exist_ok=True)
+    dtrain = dvalid = None
+    try:
+        start = time.perf_counter()
+        train_iter = FeatureBatchIter(paths, feature_cols, bins, batch_rows, 'train', valid_every,
+                                      os.path.join(cache_dir, 'train'))
+        valid_iter = FeatureBatchIter(paths, feature_cols, bins, batch_rows, 'valid', valid_every,
+                                      os.path.join(cache_dir, 'valid'))
+        dtrain = xgb.ExtMemQuantileDMatrix(train_iter, max_bin=max_bin)
+        dvalid = xgb.ExtMemQuantileDMatrix(valid_iter, max_bin=max_bin, ref=dtrain)
+        info['build_s'] = time.perf_counter() - start
+
+        n_jobs = get_n_jobs()
+        booster_params = {
+            'objective': 'multi:softprob',
+            'num_class': n_classes,
+            'eval_metric': 'mlogloss',
+            'tree_method': 'hist',
+            'max_bin': max_bin,
+            'seed': 42,
+            **({'nthread': n_jobs} if n_jobs > 0 else {}),
+            **{k: v for k, v in params.items() if k not in ('n_estimators', 'random_state', 'n_jobs')}
+        }
+        start = time.perf_counter()
+        booster = xgb.train(booster_params, dtrain, num_boost_round=params['n_estimators'],
+                            evals=[(dvalid, 'valid')], early_stopping_rounds=10, verbose_eval=10)
+        info['train_s'] = time.perf_counter() - start
+        info['cache_bytes'] = sum(os.path.getsize(p) for p in glob.glob(os.path.join(cache_dir, '*')))
+
+        # Accuracy on the held-out rows, streamed like the training data
+        confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        best = getattr(booster, 'best_iteration', None)
+        iteration_range = (0, best + 1) if best is not None else (0, 0)
+        for X, y in valid_iter.batches():
+            predicted = booster.inplace_predict(X, iteration_range=iteration_range).argmax(axis=1)
+            np.add.at(confusion, (y, predicted), 1)
+        info['accuracy'] = float(np.trace(confusion) / max(confusion.sum(), 1))
+        info['confusion_matrix'] = confusion.tolist()
+        info['valid_rows'] = int(confusion.sum())
+    finally:
+        # The DMatrix objects keep the cache pages open; release them before deleting the directory
+        del dtrain, dvalid
+        if own_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Same object type as in-memory training, so predict.py, the model server and compiled_trees work unchanged
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw('json')))
+    info['peak_rss_mb'] = peak_rss_mb()
+    return model, info
@@ -9,29 +9,42 @@ import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, classification_report
+import argparse
 import joblib
 import json
-import matplotlib.pyplot as plt
 import os
+import sys
+import time
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import incremental, profiling
+from utils.dataset import read_features
+from utils.module_loader import load_module
+from utils.plotting import get_pyplot, plots_enabled, save_figure
+from utils.resources import get_n_jobs
+
+tune = load_module('evaluation/tune.py')
 
 def load_features(features_file):
     """Load preprocessed features"""
     print(f"📖 Loading features from: {features_file}")
     
-    if features_file.endswith('.parquet'):
-        df = pd.read_parquet(features_file)
-    else:
-        df = pd.read_csv(features_file)
+    df = read_features(features_file)
     
     print(f"   Loaded {len(df)} samples")
     return df
 
-def prepare_data(df, num_servers=3):
-    """Prepare data for training"""
+def prepare_data(df, num_servers=3, bins=None):
+    """Prepare data for training (bins: saved request_count label edges for incremental runs)"""
     print(f"🔧 Preparing data for {num_servers} servers...")
     
     # Create server labels
-    df['load_level'] = pd.qcut(df['request_count'], q=num_servers, labels=False, duplicates='drop')
+    if bins is None:
+        bins = incremental.load_level_bins(df['request_count'], num_servers)
+    df['load_level'] = pd.cut(df['request_count'], bins=[-np.inf] + list(bins[1:-1]) + [np.inf], labels=False)
     
     # Feature columns
     feature_cols = [
@@ -51,19 +64,24 @@ def prepare_data(df, num_servers=3):
     
     return X, y, feature_cols
 
-def train_model(X_train, y_train, X_test, y_test):
-    """Train XGBoost model"""
+def train_model(X_train, y_train, X_test, y_test, **params):
+    """Train XGBoost model (params override the defaults, e.g. from tuned_params.json)"""
     print(f"🚀 Training XGBoost...")
     
+    params = {
+        'n_estimators': 100,
+        'max_depth': 6,
+        'learning_rate': 0.1,
+        'subsample': 0.8,
+        'colsample_bytree': 0.8,
+        **params
+    }
     model = xgb.XGBClassifier(
-        n_estimators=100,
-        max_depth=6,
-        learning_rate=0.1,
-        subsample=0.8,
-        colsample_bytree=0.8,
         random_state=42,
+        n_jobs=get_n_jobs(),
         eval_metric='mlogloss',
-        early_stopping_rounds=10
+        early_stopping_rounds=10,
+        **params
     )
     
     # Train with validation
@@ -100,13 +118,15 @@ def plot_feature_importance(model, feature_cols):
     importance = model.feature_importances_
     indices = np.argsort(importance)[::-1]
     
-    plt.figure(figsize=(10, 6))
-    plt.title('Feature Importance - XGBoost')
-    plt.bar(range(len(importance)), importance[indices])
-    plt.xticks(range(len(importance)), [feature_cols[i] for i in indices], rotation=90)
-    plt.tight_layout()
-    plt.savefig('feature_importance.png', dpi=300, bbox_inches='tight')
-    print(f"💾 Saved to: feature_importance.png")
+    if plots_enabled():
+        plt = get_pyplot()
+        plt.figure(figsize=(10, 6))
+        plt.title('Feature Importance - XGBoost')
+        plt.bar(range(len(importance)), importance[indices])
+        plt.xticks(range(len(importance)), [feature_cols[i] for i in indices], rotation=90)
+        plt.tight_layout()
+        save_figure(plt, 'feature_importance.png')
+        print(f"💾 Saved to: feature_importance.png")
     
     return {feature_cols[i]: float(importance[i]) for i in range(len(feature_cols))}
 
@@ -123,10 +143,188 @@ def save_model(model, scaler, feature_cols, metrics):
     
     print("\n💾 Model saved!")
 
+def labelled_windows(df, feature_cols, bins):
+    """Features in the saved column order and labels from the saved edges"""
+    X, y, _ = prepare_data(df.copy(), bins=bins)
+    return X.reindex(columns=feature_cols, fill_value=0), y
+
+def train_incremental(df, new_rounds=20, holdout=0.2, verify=True, tolerance=0.01):
+    """
+    Continue boosting the saved model on windows newer than the last training
+    
+    New rounds are fitted on the residuals of the existing booster (trimmed to its
+    early-stopping best iteration), with the saved scaler and label edges. The
+    newest `holdout` share of the new windows is held out; with verify, a full
+    retrain replaces the result if that is more than `tolerance` more accurate.
+    
+    Args:
+        df: Features DataFrame (full history, with timestamps)
+        new_rounds: Boosting rounds added per run
+        holdout: Share of the new windows held out for the accuracy check
+        verify: Compare against a full retrain
+        tolerance: Accepted accuracy drop versus the full retrain
+    
+    Returns:
+        Metrics dict ({} if there was nothing new), or None if a full training is needed
+    """
+    state = incremental.load_state()
+    if state is None or not os.path.exists('model.pkl'):
+        print(f"⚠️ No {incremental.STATE_FILE} from a previous training; running a full training")
+        return None
+    
+    history, new, held_out = incremental.split_new_windows(df, state, holdout)
+    print(f"🔁 Incremental update: {len(new)} new windows since {state['trained_until']}, {len(held_out)} held out")
+    if len(new) == 0 or len(held_out) == 0:
+        print("   Not enough new windows; model unchanged")
+        return {}
+    
+    previous = joblib.load('model.pkl')
+    scaler = joblib.load('scaler.pkl')
+    with open('feature_cols.json', 'r') as f:
+        feature_cols = json.load(f)
+    bins = state['load_level_bins']
+    
+    X_new, y_new = labelled_windows(new, feature_cols, bins)
+    X_hold, y_hold = labelled_windows(held_out, feature_cols, bins)
+    
+    # The booster's num_class is fixed; XGBoost infers it from the labels present
+    missing = sorted(set(previous.classes_) - set(np.unique(y_new)))
+    if missing:
+        print(f"⚠️ New windows have no samples of class(es) {missing}; running a full training")
+        return None
+    
+    booster = previous.get_booster()
+    best_iteration = getattr(previous, 'best_iteration', None)
+    if best_iteration is not None:
+        booster = booster[:best_iteration + 1]
+    rounds_before = booster.num_boosted_rounds()
+    
+    start = time.perf_counter()
+    params = {name: value for name, value in previous.get_params().items()
+              if name not in ('n_estimators', 'n_jobs', 'early_stopping_rounds')}
+    model = xgb.XGBClassifier(n_estimators=new_rounds, n_jobs=get_n_jobs(), **params)
+    model.fit(scaler.transform(X_new), y_new, xgb_model=booster, verbose=False)
+    fit_s = time.perf_counter() - start
+    
+    accuracy = accuracy_score(y_hold, model.predict(scaler.transform(X_hold)))
+    report = {
+        'new_windows': len(new),
+        'holdout_windows': len(held_out),
+        'rounds_before': rounds_before,
+        'rounds_added': new_rounds,
+        'fit_s': fit_s,
+        'holdout_accuracy': accuracy,
+        'used': 'incremental'
+    }
+    print(f"   {rounds_before} + {new_rounds} boosting rounds in {fit_s:.2f}s, holdout accuracy: {accuracy:.4f}")
+    
+    rows = state['rows'] + len(new)
+    if verify:
+        X_all, y_all = labelled_windows(pd.concat([history, new]), feature_cols, bins)
+        start = time.perf_counter()
+        full_scaler = StandardScaler()
+        X_all_scaled = full_scaler.fit_transform(X_all)
+        X_hold_scaled = full_scaler.transform(X_hold)
+        # Early stopping on the holdout (as the full training does with its test split)
+        # favours the full retrain, so the comparison errs on the strict side
+        full_model = train_model(X_all_scaled, y_all, X_hold_scaled, y_hold, **tune.load_tuned_params())
+        full_accuracy = accuracy_score(y_hold, full_model.predict(X_hold_scaled))
+        report.update(full_retrain_accuracy=full_accuracy, full_fit_s=time.perf_counter() - start)
+        print(f"   Full retrain: {report['full_fit_s']:.2f}s, holdout accuracy: {full_accuracy:.4f}")
+        
+        if accuracy < full_accuracy - tolerance:
+            print(f"⚠️ Incremental model is {full_accuracy - accuracy:.2%} less accurate; keeping the full retrain")
+            model, scaler, accuracy, rows = full_model, full_scaler, full_accuracy, len(X_all)
+            report['used'] = 'full'
+    
+    metrics = {
+        'accuracy': accuracy,
+        'classification_report': classification_report(
+            y_hold, model.predict(scaler.transform(X_hold)), output_dict=True
+        ),
+        'incremental': report
+    }
+    metrics['feature_importance'] = plot_feature_importance(model, feature_cols)
+    save_model(model, scaler, feature_cols, metrics)
+    # The holdout windows count as new again next time
+    incremental.save_state(new['timestamp'].max(), rows, bins, last_run=report)
+    return metrics
+
+def train_external_memory(source, batch_rows=100000, max_bin=256, cache_dir=None):
+    """
+    Full training from feature partitions that need not fit in memory
+    
+    Streams the data through external_memory.train_external (hist method, page
+    cache on disk) and saves the same artifacts as the in-memory training. Trees
+    are fitted on raw features, so scaler.pkl is an identity StandardScaler.
+    """
+    external_memory = load_module('models/4_xgboost/external_memory.py')
+    
+    print(f"💽 External-memory training from: {source}")
+    params = tune.load_tuned_params()
+    if params:
+        print(f"\n🎛️ Using tuned parameters from {tune.TUNED_PARAMS_FILE}: {params}")
+    model, info = external_memory.train_external(
+        source, params, batch_rows=batch_rows, max_bin=max_bin, cache_dir=cache_dir
+    )
+    feature_cols = info['feature_cols']
+    
+    # Fitted on one batch only to record n_features_in_; it does not transform
+    first_batch = next(external_memory.iter_frames(external_memory.list_partitions(source), 1, feature_cols))
+    scaler = StandardScaler(with_mean=False, with_std=False).fit(
+        first_batch.reindex(columns=feature_cols).to_numpy(dtype=np.float32)
+    )
+    
+    print(f"\n   Accuracy: {info['accuracy']:.4f} on {info['valid_rows']:,} held-out rows")
+    print(f"   Build {info['build_s']:.1f}s, train {info['train_s']:.1f}s, "
+          f"page cache {info['cache_bytes'] / 1e6:.1f} MB, peak RSS {info['peak_rss_mb']:.0f} MB")
+    
+    metrics = {
+        'accuracy': info['accuracy'],
+        'confusion_matrix': info['confusion_matrix'],
+        'external_memory': {
+            'source': source,
+            'rows': info['rows'],
+            'valid_rows': info['valid_rows'],
+            'batch_rows': batch_rows,
+            'max_bin': max_bin,
+            'build_s': info['build_s'],
+            'train_s': info['train_s'],
+            'cache_bytes': info['cache_bytes'],
+            'peak_rss_mb': info['peak_rss_mb']
+        }
+    }
+    metrics['feature_importance'] = plot_feature_importance(model, feature_cols)
+    save_model(model, scaler, feature_cols, metrics)
+    incremental.save_state(info['trained_until'], info['rows'], info['load_level_bins'])
+    return metrics
+
 def main():
     """Main training pipeline"""
+    parser = argparse.ArgumentParser(description='Train the XGBoost router')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Continue boosting on windows newer than the last training')
+    parser.add_argument('--new-rounds', type=int, default=20, help='Boosting rounds added per incremental run')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Share of the new windows held out')
+    parser.add_argument('--no-verify', action='store_true', help='Skip the comparison with a full retrain')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Accepted accuracy drop vs a full retrain')
+    parser.add_argument('--external-memory', metavar='SOURCE',
+                        help='Stream features from a parquet/csv file or directory of partitions instead of loading them')
+    parser.add_argument('--batch-rows', type=int, default=100000, help='Rows per external-memory batch')
+    parser.add_argument('--max-bin', type=int, default=256, help='Histogram bins per feature (external memory)')
+    parser.add_argument('--cache-dir', help='Directory for the external-memory page cache (default: temporary)')
+    args = parser.parse_args()
+    
     print("🚀 XGBoost Training Pipeline\n")
     
+    if args.external_memory:
+        if args.incremental:
+            parser.error('--external-memory always runs a full training; drop --incremental')
+        with profiling.stage('external_memory'):
+            metrics = train_external_memory(args.external_memory, args.batch_rows, args.max_bin, args.cache_dir)
+        print(f"\n✅ Training complete! Accuracy: {metrics['accuracy']:.2%}")
+        return
+    
     FEATURES_FILE = "../../data/features/features.parquet"
     
     if not os.path.exists(FEATURES_FILE):
@@ -134,31 +332,54 @@ def main():
         return
     
     # Load and prepare data
-    df = load_features(FEATURES_FILE)
-    X, y, feature_cols = prepare_data(df, num_servers=3)
+    with profiling.stage('load_features'):
+        df = load_features(FEATURES_FILE)
+    
+    if args.incremental:
+        with profiling.stage('incremental'):
+            metrics = train_incremental(df, args.new_rounds, args.holdout, not args.no_verify, args.tolerance)
+        if metrics is not None:
+            if metrics:
+                print(f"\n✅ Incremental update complete! Holdout accuracy: {metrics['accuracy']:.2%}")
+            return
+    
+    with profiling.stage('label_bins'):
+        bins = incremental.load_level_bins(df['request_count'], num_servers=3)
+    with profiling.stage('prepare'):
+        X, y, feature_cols = prepare_data(df, num_servers=3, bins=bins)
     
     # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
+    with profiling.stage('split'):
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42, stratify=y
+        )
     
     # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    with profiling.stage('scale'):
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
     
     # Train
-    model = train_model(X_train_scaled, y_train, X_test_scaled, y_test)
+    params = tune.load_tuned_params()
+    if params:
+        print(f"\n🎛️ Using tuned parameters from {tune.TUNED_PARAMS_FILE}: {params}")
+    with profiling.stage('fit'):
+        model = train_model(X_train_scaled, y_train, X_test_scaled, y_test, **params)
     
     # Evaluate
-    metrics = evaluate_model(model, X_test_scaled, y_test)
+    with profiling.stage('evaluate'):
+        metrics = evaluate_model(model, X_test_scaled, y_test)
     
     # Feature importance
-    feature_importance = plot_feature_importance(model, feature_cols)
+    with profiling.stage('feature_importance'):
+        feature_importance = plot_feature_importance(model, feature_cols)
     metrics['feature_importance'] = feature_importance
     
     # Save
-    save_model(model, scaler, feature_cols, metrics)
+    with profiling.stage('save'):
+        save_model(model, scaler, feature_cols, metrics)
+        incremental.save_state(df['timestamp'].max(), len(df), bins)
     
     print(f"\n✅ Training complete! Accuracy: {metrics['accuracy']:.2%}")
 
@@ -0,0 +1,303 @@
+"""
+NumPy LSTM Runtime
+Exports trained Keras LSTM weights and runs the forward pass without TensorFlow
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+WEIGHTS_FILE = 'lstm_weights.npz'
+RUNTIME_FILE = 'lstm_runtime.json'
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x))
+}
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+class MinMaxParams:
+    """Exported MinMaxScaler (transform = X * scale + min), so loading needs no scikit-learn"""
+
+    def __init__(self, scale, min_):
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.min_ = np.asarray(min_, dtype=np.float64)
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+    def inverse_transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.min_) / self.scale_
+
+    def to_dict(self):
+        return {'scale': self.scale_.tolist(), 'min': self.min_.tolist()}
+
+def inverse_target(scaler, values):
+    """
+    Undo the MinMax scaling of forecasts
+
+    The model predicts the first input column (request_count) only, so just that
+    column's parameters apply, whatever the number of input features. Works for
+    MinMaxParams and a fitted MinMaxScaler.
+    """
+    return (np.asarray(values, dtype=np.float64) - scaler.min_[0]) / scaler.scale_[0]
+
+class NumpyLSTM:
+    """
+    Stacked LSTM + Dense forward pass in NumPy (float32)
+
+    Gate layout follows Keras: kernel columns are [input, forget, cell, output].
+    The input projection for every timestep is one matrix multiply per layer;
+    only the recurrent term runs step by step, for the whole batch at once.
+    """
+
+    def __init__(self, layers, weights, scaler=None):
+        """
+        Initialize runtime
+
+        Args:
+            layers: List of layer specs (type, units, activation, ...) in model order
+            weights: Dict of arrays named '<index>_<kernel|recurrent_kernel|bias>'
+            scaler: Optional MinMaxParams for the model's input/output scaling
+        """
+        self.layers = layers
+        self.scaler = scaler
+        self.weights = {name: np.asarray(array, dtype=np.float32) for name, array in weights.items()}
+        self._steps = []
+        for index, layer in enumerate(layers):
+            params = [self.weights.get(f"{index}_{name}") for name in ('kernel', 'recurrent_kernel', 'bias')]
+            if layer['type'] == 'lstm':
+                self._steps.append((self._lstm, layer, params,
+                                    _activation(layer['activation']), _activation(layer['recurrent_activation'])))
+            elif layer['type'] == 'dense':
+                self._steps.append((self._dense, layer, params, _activation(layer['activation']), None))
+            else:
+                raise ValueError(f"Unsupported layer type: {layer['type']}")
+
+        # Streaming (step/output) needs LSTM layers first, each feeding the next every timestep
+        lstm_count = sum(layer['type'] == 'lstm' for layer in layers)
+        self._lstm_steps, self._head_steps = self._steps[:lstm_count], self._steps[lstm_count:]
+        self.streamable = all(layer['type'] == 'lstm' for layer in layers[:lstm_count]) and \
+            all(layer['return_sequences'] for layer in layers[:lstm_count - 1])
+        self.horizon = layers[-1]['units']
+        self.n_features = self.weights['0_kernel'].shape[0]
+
+    @staticmethod
+    def _lstm(X, layer, params, activation, recurrent_activation):
+        """One LSTM layer over (batch, timesteps, features)"""
+        kernel, recurrent_kernel, bias = params
+        batch, timesteps, n_in = X.shape
+        units = layer['units']
+
+        projected = (X.reshape(-1, n_in) @ kernel).reshape(batch, timesteps, 4 * units)
+        if bias is not None:
+            projected += bias
+
+        h = np.zeros((batch, units), dtype=np.float32)
+        c = np.zeros((batch, units), dtype=np.float32)
+        outputs = np.empty((batch, timesteps, units), dtype=np.float32) if layer['return_sequences'] else None
+
+        for t in range(timesteps):
+            h, c = NumpyLSTM._cell(projected[:, t] + h @ recurrent_kernel, c, units,
+                                   activation, recurrent_activation)
+            if outputs is not None:
+                outputs[:, t] = h
+
+        return outputs if outputs is not None else h
+
+    @staticmethod
+    def _cell(z, c, units, activation, recurrent_activation):
+        """LSTM cell update from pre-activations z = x @ W + h @ U + b"""
+        # One recurrent_activation call over all four blocks; the cell block uses activation instead
+        gates = recurrent_activation(z)
+        c = gates[:, units:2 * units] * c + gates[:, :units] * activation(z[:, 2 * units:3 * units])
+        h = gates[:, 3 * units:] * activation(c)
+        return h, c
+
+    @staticmethod
+    def _dense(X, layer, params, activation, _):
+        kernel, _, bias = params
+        out = X @ kernel
+        if bias is not None:
+            out += bias
+        return activation(out)
+
+    def predict(self, X, batch_size=None, verbose=0):
+        """
+        Forward pass (same call signature as keras Model.predict)
+
+        Args:
+            X: Array of shape (batch, timesteps, features)
+
+        Returns:
+            float32 array of shape (batch, output_units)
+        """
+        out = np.asarray(X, dtype=np.float32)
+        for step, layer, params, activation, recurrent_activation in self._steps:
+            out = step(out, layer, params, activation, recurrent_activation)
+        return out
+
+    def zero_state(self, batch=1):
+        """Initial (h, c) for every LSTM layer"""
+        return [
+            (np.zeros((batch, layer['units']), dtype=np.float32), np.zeros((batch, layer['units']), dtype=np.float32))
+            for layer in self.layers if layer['type'] == 'lstm'
+        ]
+
+    def step(self, x, state):
+        """
+        Advance every LSTM layer by one timestep
+
+        Args:
+            x: Inputs for this timestep, shape (batch, features)
+            state: List of (h, c) per LSTM layer (from zero_state or a previous step)
+
+        Returns:
+            New state (the input state is not modified)
+        """
+        out = np.asarray(x, dtype=np.float32)
+        new_state = []
+        for (step, layer, params, activation, recurrent_activation), (h, c) in zip(self._lstm_steps, state):
+            kernel, recurrent_kernel, bias = params
+            z = out @ kernel + h @ recurrent_kernel
+            if bias is not None:
+                z += bias
+            out, c = self._cell(z, c, layer['units'], activation, recurrent_activation)
+            new_state.append((out, c))
+        return new_state
+
+    def output(self, state):
+        """Apply the layers after the last LSTM to its hidden state"""
+        out = state[-1][0]
+        for step, layer, params, activation, recurrent_activation in self._head_steps:
+            out = step(out, layer, params, activation, recurrent_activation)
+        return out
+
+    def save(self, output_dir):
+        """Write lstm_weights.npz and lstm_runtime.json (layer specs + scaler)"""
+        os.makedirs(output_dir, exist_ok=True)
+        np.savez(os.path.join(output_dir, WEIGHTS_FILE), **self.weights)
+        with open(os.path.join(output_dir, RUNTIME_FILE), 'w') as f:
+            json.dump({
+                'layers': self.layers,
+                'scaler': self.scaler.to_dict() if self.scaler is not None else None
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, model_dir):
+        """Load exported weights (no TensorFlow or scikit-learn import)"""
+        with open(os.path.join(model_dir, RUNTIME_FILE), 'r') as f:
+            runtime = json.load(f)
+        with np.load(os.path.join(model_dir, WEIGHTS_FILE)) as data:
+            weights = {name: data[name] for name in data.files}
+        scaler = runtime.get('scaler')
+        return cls(runtime['layers'], weights, MinMaxParams(scaler['scale'], scaler['min']) if scaler else None)
+
+def extract_weights(model, scaler=None):
+    """
+    Pull layer specs and weights from a Keras Sequential model
+
+    Dropout layers are identity at inference and are skipped.
+
+    Args:
+        model: Trained Keras model (LSTM / Dropout / Dense layers)
+        scaler: Fitted MinMaxScaler to export alongside the weights (optional)
+
+    Returns:
+        NumpyLSTM runtime
+    """
+    layers, weights = [], {}
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+        if kind == 'Dropout':
+            continue
+        if kind == 'LSTM':
+            if config.get('go_backwards'):
+                raise ValueError(f"{layer.name}: go_backwards LSTM layers are not supported")
+            spec = {
+                'type': 'lstm',
+                'units': config['units'],
+                'activation': config['activation'],
+                'recurrent_activation': config['recurrent_activation'],
+                'return_sequences': config['return_sequences']
+            }
+            names = ('kernel', 'recurrent_kernel', 'bias') if config.get('use_bias', True) else ('kernel', 'recurrent_kernel')
+        elif kind == 'Dense':
+            spec = {'type': 'dense', 'units': config['units'], 'activation': config['activation']}
+            names = ('kernel', 'bias') if config.get('use_bias', True) else ('kernel',)
+        else:
+            raise ValueError(f"{layer.name}: unsupported layer type {kind}")
+
+        index = len(layers)
+        for name, array in zip(names, layer.get_weights()):
+            weights[f"{index}_{name}"] = array
+        layers.append(spec)
+
+    params = MinMaxParams(scaler.scale_, scaler.min_) if scaler is not None else None
+    return NumpyLSTM(layers, weights, params)
+
+def export_model(model_dir, output_dir=None, verify_samples=256):
+    """
+    Export lstm_model.h5 to NumPy weights and check outputs against Keras
+
+    Args:
+        model_dir: Directory containing lstm_model.h5, scaler.pkl and config.json
+        output_dir: Where to write the weights (default: model_dir)
+        verify_samples: Random input sequences used for the comparison
+
+    Returns:
+        NumpyLSTM runtime
+    """
+    import joblib
+    from tensorflow import keras
+
+    output_dir = output_dir or model_dir
+    print(f"📖 Loading Keras model from: {model_dir}")
+    model = keras.models.load_model(os.path.join(model_dir, 'lstm_model.h5'), compile=False)
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+
+    runtime = extract_weights(model, scaler)
+    runtime.save(output_dir)
+    print(f"💾 Saved {WEIGHTS_FILE} and {RUNTIME_FILE} to: {output_dir}")
+
+    if verify_samples:
+        _, timesteps, n_features = model.input_shape
+        X = np.random.default_rng(0).random((verify_samples, timesteps, n_features), dtype=np.float32)
+        max_diff = float(np.abs(runtime.predict(X) - model.predict(X, verbose=0)).max())
+        print(f"   Max |NumPy - Keras| over {verify_samples} sequences: {max_diff:.2e}")
+
+    return runtime
+
+def main():
+    """Export a trained LSTM and time the NumPy forward pass"""
+    parser = argparse.ArgumentParser(description='Export LSTM weights for TensorFlow-free inference')
+    parser.add_argument('model_dir', nargs='?', default='.', help='Directory containing lstm_model.h5')
+    parser.add_argument('--output', help='Output directory (default: model_dir)')
+    parser.add_argument('--verify-samples', type=int, default=256, help='Sequences compared against Keras (0 = skip)')
+    args = parser.parse_args()
+
+    runtime = export_model(args.model_dir, args.output, args.verify_samples)
+
+    with open(os.path.join(args.model_dir, 'config.json'), 'r') as f:
+        seq_length = json.load(f)['seq_length']
+    X = np.zeros((1, seq_length, runtime.n_features), dtype=np.float32)
+    runtime.predict(X)
+    start = time.perf_counter()
+    for _ in range(200):
+        runtime.predict(X)
+    print(f"⚡ NumPy single-sequence forward pass: {(time.perf_counter() - start) / 200 * 1e6:.0f} µs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+LSTM Prediction Script
+Forecast next-minute request count with the NumPy runtime (no TensorFlow import)
+"""
+
+import json
+import os
+import sys
+import numpy as np
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.module_loader import load_module
+
+numpy_lstm = load_module('models/5_lstm/numpy_lstm.py')
+
+def load_model(model_dir='.'):
+    """
+    Load exported LSTM weights
+
+    Args:
+        model_dir: Directory containing lstm_weights.npz, lstm_runtime.json and config.json
+
+    Returns:
+        model: NumpyLSTM runtime
+        scaler: Input scaler (exported parameters; scaler.pkl for older exports)
+        seq_length: Input sequence length
+    """
+    print("📖 Loading LSTM model...")
+
+    if not os.path.exists(os.path.join(model_dir, numpy_lstm.WEIGHTS_FILE)):
+        raise FileNotFoundError(
+            f"{numpy_lstm.WEIGHTS_FILE} not found in {model_dir}; export it with: python numpy_lstm.py {model_dir}"
+        )
+
+    model = numpy_lstm.NumpyLSTM.load(model_dir)
+    scaler = model.scaler
+    if scaler is None:
+        import joblib
+        scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+        # The scaler was fitted on a DataFrame; predictions pass plain arrays
+        if hasattr(scaler, 'feature_names_in_'):
+            del scaler.feature_names_in_
+
+    with open(os.path.join(model_dir, 'config.json'), 'r') as f:
+        seq_length = json.load(f)['seq_length']
+
+    print("✅ Model loaded successfully!")
+    return model, scaler, seq_length
+
+def load_sequence_features(model_dir='.'):
+    """Input columns per timestep from config.json (request_count only for older models)"""
+    with open(os.path.join(model_dir, 'config.json'), 'r') as f:
+        return json.load(f).get('features', ['request_count'])
+
+def sequence_array(sequences, seq_length, n_features):
+    """
+    Stack the last seq_length steps of each series into (n_series, seq_length, n_features)
+
+    A step is a row of n_features values in the training column order
+    (config.json 'features'); single-feature models also take plain value lists.
+    """
+    windows = np.empty((len(sequences), seq_length, n_features), dtype=np.float64)
+    for i, sequence in enumerate(sequences):
+        steps = np.asarray(sequence, dtype=np.float64)
+        if steps.ndim == 1 and n_features == 1:
+            steps = steps[:, None]
+        if steps.ndim != 2 or steps.shape[1] != n_features:
+            raise ValueError(f"Each sequence step needs {n_features} values (one per model input feature)")
+        if len(steps) < seq_length:
+            raise ValueError(f"Each sequence needs at least {seq_length} steps")
+        windows[i] = steps[-seq_length:]
+    return windows
+
+def predict_batch(model, scaler, sequences, seq_length):
+    """
+    Forecast every horizon for many series at once (one forward pass)
+
+    Args:
+        model: NumpyLSTM runtime (or a Keras model)
+        scaler: Fitted scaler
+        sequences: Histories, oldest first (last seq_length steps are used): lists of
+            request_counts, or lists of per-step feature rows for multi-feature models
+        seq_length: Input sequence length
+
+    Returns:
+        float array of forecast request counts, shape (n_series, horizon);
+        column h is the forecast h+1 minutes ahead
+    """
+    n_features = len(scaler.scale_)
+    windows = sequence_array(sequences, seq_length, n_features)
+
+    scaled = scaler.transform(windows.reshape(-1, n_features)).reshape(windows.shape)
+    predicted = np.asarray(model.predict(scaled, verbose=0), dtype=np.float64)
+
+    return numpy_lstm.inverse_target(scaler, predicted)
+
+def predict_next(model, scaler, sequence, seq_length):
+    """
+    Forecast the coming minutes for one series
+
+    Args:
+        model: NumpyLSTM runtime
+        scaler: Fitted scaler
+        sequence: Recent request counts or feature rows (oldest first)
+        seq_length: Input sequence length
+
+    Returns:
+        float array of forecast request counts, one per horizon (index 0 = next minute)
+    """
+    return predict_batch(model, scaler, [sequence], seq_length)[0]
+
+class StreamingForecaster:
+    """
+    Stateful per-minute forecaster: one LSTM cell update per new value
+
+    The model was trained on fixed windows that start from a zero state, so simply
+    carrying one state forward forever would drift from its training distribution.
+    Instead the forecaster keeps seq_length staggered windows, one starting at each
+    of the last seq_length minutes, as rows of one state batch. Each new value
+    advances all of them with a single batched cell update per layer. The window
+    that has just seen seq_length values gives the forecast, and its row is reset to
+    start the next window. Output equals predict_batch on the last seq_length values,
+    without recomputing the sequence.
+    """
+
+    def __init__(self, model, scaler, seq_length):
+        """
+        Initialize forecaster
+
+        Args:
+            model: NumpyLSTM runtime (must be streamable)
+            scaler: Fitted scaler
+            seq_length: Window length the model was trained on
+        """
+        if not getattr(model, 'streamable', False):
+            raise ValueError("Streaming needs the NumPy runtime with stacked LSTM layers")
+
+        self.model = model
+        self.scaler = scaler
+        self.seq_length = seq_length
+        self.reset()
+
+    def reset(self):
+        """Forget all history"""
+        self.state = self.model.zero_state(self.seq_length)
+        self.count = 0
+        self.last_forecast = None
+
+    def update(self, value):
+        """
+        Add the latest request count and forecast the coming minutes
+
+        Args:
+            value: Request count (or feature row, for multi-feature models) for the minute that just ended
+
+        Returns:
+            float array of forecasts (one per horizon), or None until seq_length values were seen
+        """
+        step = np.asarray(value, dtype=np.float64).reshape(1, -1)
+        if step.shape[1] != len(self.scaler.scale_):
+            raise ValueError(f"Each update needs {len(self.scaler.scale_)} values (one per model input feature)")
+
+        slot = self.count % self.seq_length
+        for h, c in self.state:
+            h[slot] = 0
+            c[slot] = 0
+
+        x = np.repeat(self.scaler.transform(step), self.seq_length, axis=0).astype(np.float32)
+        self.state = self.model.step(x, self.state)
+        self.count += 1
+
+        if self.count < self.seq_length:
+            return None
+
+        # The window that started seq_length - 1 updates ago is now complete
+        done = self.count % self.seq_length
+        final_state = [(h[done:done + 1], c[done:done + 1]) for h, c in self.state]
+        scaled = np.asarray(self.model.output(final_state), dtype=np.float64)
+        self.last_forecast = numpy_lstm.inverse_target(self.scaler, scaled[0])
+        return self.last_forecast
+
+    def extend(self, values):
+        """Feed several values in order; returns the forecast after the last one"""
+        forecast = None
+        for value in values:
+            forecast = self.update(value)
+        return forecast
+
+def main():
+    """Example usage"""
+    # Load model
+    model, scaler, seq_length = load_model()
+
+    # Example: last 10 minutes of request counts (with response time / error rate columns)
+    counts = [1180, 1205, 1190, 1220, 1250, 1235, 1260, 1248, 1275, 1290]
+    example = {'request_count': counts, 'avg_response_time': [25.0] * len(counts), 'error_rate': [0.02] * len(counts)}
+    features = load_sequence_features()
+    sequence = [list(step) for step in zip(*(example.get(col, [0.0] * len(counts)) for col in features))]
+
+    forecast = predict_next(model, scaler, sequence, seq_length)
+
+    print(f"\n🎯 Forecast:")
+    print(f"   Recent request counts: {counts[-seq_length:]}")
+    for minutes, value in enumerate(forecast, start=1):
+        print(f"   +{minutes} min: {value:.0f} requests")
+
+    # Streaming: feed one value per minute, each costs one cell update
+    stream = StreamingForecaster(model, scaler, seq_length)
+    stream.extend(sequence)
+    print(f"\n📡 Streaming forecast after {stream.count} updates: {stream.last_forecast[0]:.0f} requests next minute")
+
+if __name__ == "__main__":
+    main()
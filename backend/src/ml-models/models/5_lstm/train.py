@@ -6,25 +6,33 @@ Predicts future load for proactive scaling
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
+import argparse
 import joblib
 import json
-import matplotlib.pyplot as plt
+import math
 import os
+import sys
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import profiling
+from utils.module_loader import load_module
+from utils.dataset import read_features
+from utils.plotting import get_pyplot, plots_enabled, save_figure
+
+numpy_lstm = load_module('models/5_lstm/numpy_lstm.py')
+
+# Input columns per timestep; the first one is the forecast target
+SEQUENCE_FEATURES = ['request_count', 'avg_response_time', 'error_rate']
 
 def load_features(features_file):
     """Load preprocessed features"""
     print(f"📖 Loading features from: {features_file}")
     
-    if features_file.endswith('.parquet'):
-        df = pd.read_parquet(features_file)
-    else:
-        df = pd.read_csv(features_file)
+    df = read_features(features_file)
     
     # Sort by timestamp
     df = df.sort_values('timestamp').reset_index(drop=True)
@@ -32,36 +40,104 @@ def load_features(features_file):
     print(f"   Loaded {len(df)} samples")
     return df
 
-def create_sequences(data, seq_length=10):
+def create_sequences(data, seq_length=10, horizon=1):
     """
-    Create sequences for LSTM
+    Create sequences for LSTM as strided views of data (no copy)
+    
+    Window i shares memory with rows i..i+seq_length-1 of data, so the windows cost
+    nothing beyond the series itself. The views are read-only; slice and copy
+    (np.ascontiguousarray) only the part that must be materialized.
     
     Args:
-        data: Time-series data
+        data: Time-series data, shape (n_steps, n_features)
         seq_length: Length of input sequence
+        horizon: Number of future steps to predict
+    
+    Returns:
+        X: Input sequences, shape (n_samples, seq_length, n_features)
+        y: Target values, shape (n_samples, horizon) (first column of data)
+    """
+    n_samples = len(data) - seq_length - horizon + 1
+    if n_samples <= 0:
+        raise ValueError(f"Need more than {seq_length + horizon - 1} time steps, got {len(data)}")
+    
+    windows = np.lib.stride_tricks.sliding_window_view(data, seq_length, axis=0)
+    X = windows[:n_samples].transpose(0, 2, 1)
+    y = np.lib.stride_tricks.sliding_window_view(data[seq_length:, 0], horizon)[:n_samples]
+    
+    return X, y
+
+def split_windows(n_samples, val_size=0.15, test_size=0.15):
+    """
+    Chronological train/validation/test ranges of window indices
+    
+    Same sizes as train_test_split(test_size=0.3, shuffle=False) followed by
+    an even split of the remainder.
     
     Returns:
-        X: Input sequences
-        y: Target values
+        List of (start, end) index ranges for train, validation and test
+    """
+    n_temp = math.ceil((val_size + test_size) * n_samples)
+    n_test = math.ceil(test_size / (val_size + test_size) * n_temp)
+    train_end = n_samples - n_temp
+    val_end = n_samples - n_test
+    return [(0, train_end), (train_end, val_end), (val_end, n_samples)]
+
+def make_datasets(data, ranges, seq_length=10, horizon=1, batch_size=32):
     """
-    X, y = [], []
+    Streaming tf.data pipelines over window ranges
+    
+    Only window start indices flow through the pipeline: each batch gathers its
+    windows from the series with one vectorized tf.gather, in parallel with
+    training (prefetch), so memory holds the series plus a few batches whatever
+    the history length. The first range (training) is reshuffled every epoch,
+    as model.fit does with arrays.
     
-    for i in range(len(data) - seq_length):
-        X.append(data[i:i+seq_length])
-        y.append(data[i+seq_length])
+    Args:
+        data: Scaled series, shape (n_steps, n_features)
+        ranges: (start, end) window index ranges (split_windows)
+        seq_length: Length of input sequence
+        horizon: Number of future steps to predict
+        batch_size: Windows per batch
     
-    return np.array(X), np.array(y)
+    Returns:
+        List of tf.data.Dataset yielding (X, y) batches, one per range
+    """
+    import tensorflow as tf
+    
+    series = tf.convert_to_tensor(np.asarray(data, dtype=np.float32))
+    target = series[:, 0]
+    input_offsets = tf.range(seq_length, dtype=tf.int64)
+    target_offsets = tf.range(seq_length, seq_length + horizon, dtype=tf.int64)
+    
+    def gather(starts):
+        X = tf.gather(series, starts[:, None] + input_offsets)
+        y = tf.gather(target, starts[:, None] + target_offsets)
+        return X, y
+    
+    datasets = []
+    for i, (start, end) in enumerate(ranges):
+        dataset = tf.data.Dataset.range(start, end)
+        if i == 0:
+            dataset = dataset.shuffle(end - start, seed=42, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+        datasets.append(dataset.prefetch(tf.data.AUTOTUNE))
+    return datasets
 
-def build_model(seq_length, n_features):
-    """Build LSTM model"""
-    print(f"🏗️ Building LSTM model (seq_length={seq_length}, features={n_features})...")
+def build_model(seq_length, n_features, horizon=1):
+    """Build LSTM model (one output per forecast horizon, all predicted in one pass)"""
+    print(f"🏗️ Building LSTM model (seq_length={seq_length}, features={n_features}, horizon={horizon})...")
+    
+    # TensorFlow takes seconds to import; only the training stage needs it
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
     
     model = Sequential([
         LSTM(50, activation='relu', return_sequences=True, input_shape=(seq_length, n_features)),
         Dropout(0.2),
         LSTM(50, activation='relu'),
         Dropout(0.2),
-        Dense(1)
+        Dense(horizon)
     ])
     
     model.compile(optimizer='adam', loss='mse', metrics=['mae'])
@@ -69,9 +145,11 @@ def build_model(seq_length, n_features):
     print(model.summary())
     return model
 
-def train_model(model, X_train, y_train, X_val, y_val, epochs=50, batch_size=32):
-    """Train LSTM model"""
-    print(f"\n🚀 Training LSTM (epochs={epochs}, batch_size={batch_size})...")
+def train_model(model, train_data, val_data, epochs=50):
+    """Train LSTM model on batched (X, y) datasets (make_datasets)"""
+    print(f"\n🚀 Training LSTM (epochs={epochs})...")
+    
+    from tensorflow import keras
     
     # Callbacks
     early_stop = keras.callbacks.EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
@@ -79,10 +157,10 @@ def train_model(model, X_train, y_train, X_val, y_val, epochs=50, batch_size=32)
     
     # Train
     history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
+        train_data,
+        validation_data=val_data,
         epochs=epochs,
-        batch_size=batch_size,
+        shuffle=False,  # train_data reshuffles itself every epoch
         callbacks=[early_stop, reduce_lr],
         verbose=1
     )
@@ -90,44 +168,50 @@ def train_model(model, X_train, y_train, X_val, y_val, epochs=50, batch_size=32)
     print("✅ Training complete!")
     return model, history
 
-def evaluate_model(model, X_test, y_test, scaler):
-    """Evaluate LSTM model"""
+def evaluate_model(model, test_data, y_test, scaler):
+    """Evaluate LSTM model (test_data: unshuffled test dataset, y_test: its targets)"""
     print("\n📊 Evaluating model...")
     
     # Predict
-    y_pred = model.predict(X_test)
+    y_pred = model.predict(test_data)
     
-    # Inverse transform
-    y_test_original = scaler.inverse_transform(y_test.reshape(-1, 1))
-    y_pred_original = scaler.inverse_transform(y_pred)
+    # Inverse transform (every horizon column uses the request_count scaling)
+    y_test_original = numpy_lstm.inverse_target(scaler, y_test)
+    y_pred_original = numpy_lstm.inverse_target(scaler, y_pred)
     
-    # Metrics
+    # Metrics (all horizons pooled, plus MAE per horizon)
     mae = mean_absolute_error(y_test_original, y_pred_original)
     rmse = np.sqrt(mean_squared_error(y_test_original, y_pred_original))
-    r2 = r2_score(y_test_original, y_pred_original)
+    r2 = r2_score(y_test_original.ravel(), y_pred_original.ravel())
+    mae_by_horizon = np.abs(y_test_original - y_pred_original).mean(axis=0)
     
     print(f"\n   MAE: {mae:.2f}")
     print(f"   RMSE: {rmse:.2f}")
     print(f"   R² Score: {r2:.4f}")
-    
-    # Plot predictions
-    plt.figure(figsize=(12, 6))
-    plt.plot(y_test_original[:100], label='Actual', alpha=0.7)
-    plt.plot(y_pred_original[:100], label='Predicted', alpha=0.7)
-    plt.title('LSTM Predictions vs Actual')
-    plt.xlabel('Time Step')
-    plt.ylabel('Request Count')
-    plt.legend()
-    plt.savefig('predictions.png', dpi=300, bbox_inches='tight')
-    print(f"\n💾 Saved predictions plot to: predictions.png")
+    if len(mae_by_horizon) > 1:
+        print(f"   MAE by horizon: " + ', '.join(f"+{h}m {v:.2f}" for h, v in enumerate(mae_by_horizon, start=1)))
+    
+    # Plot next-minute predictions
+    if plots_enabled():
+        plt = get_pyplot()
+        plt.figure(figsize=(12, 6))
+        plt.plot(y_test_original[:100, 0], label='Actual', alpha=0.7)
+        plt.plot(y_pred_original[:100, 0], label='Predicted', alpha=0.7)
+        plt.title('LSTM Predictions vs Actual')
+        plt.xlabel('Time Step')
+        plt.ylabel('Request Count')
+        plt.legend()
+        save_figure(plt, 'predictions.png')
+        print(f"\n💾 Saved predictions plot to: predictions.png")
     
     return {
         'mae': float(mae),
         'rmse': float(rmse),
-        'r2_score': float(r2)
+        'r2_score': float(r2),
+        'mae_by_horizon': [float(v) for v in mae_by_horizon]
     }
 
-def save_model(model, scaler, metrics, seq_length):
+def save_model(model, scaler, metrics, seq_length, horizon=1, features=('request_count',)):
     """Save LSTM model"""
     print("\n💾 Saving model...")
     
@@ -135,6 +219,10 @@ def save_model(model, scaler, metrics, seq_length):
     model.save('lstm_model.h5')
     print("   ✅ Saved lstm_model.h5")
     
+    # Export weights for the TensorFlow-free runtime used by predict.py and the model server
+    numpy_lstm.extract_weights(model, scaler).save('.')
+    print(f"   ✅ Saved {numpy_lstm.WEIGHTS_FILE}, {numpy_lstm.RUNTIME_FILE}")
+    
     # Save scaler
     joblib.dump(scaler, 'scaler.pkl')
     print("   ✅ Saved scaler.pkl")
@@ -142,6 +230,8 @@ def save_model(model, scaler, metrics, seq_length):
     # Save config
     config = {
         'seq_length': seq_length,
+        'horizon': horizon,
+        'features': list(features),
         'metrics': metrics
     }
     
@@ -151,52 +241,74 @@ def save_model(model, scaler, metrics, seq_length):
 
 def main():
     """Main training pipeline"""
+    parser = argparse.ArgumentParser(description='Train the LSTM load forecaster')
+    parser.add_argument('--features', default=','.join(SEQUENCE_FEATURES),
+                        help='Comma-separated input columns per timestep (the first is forecast)')
+    parser.add_argument('--epochs', type=int, default=50, help='Maximum training epochs')
+    parser.add_argument('--batch-size', type=int, default=32, help='Windows per batch')
+    args = parser.parse_args()
+    
     print("🚀 LSTM Training Pipeline\n")
     
     FEATURES_FILE = "../../data/features/features.parquet"
     SEQ_LENGTH = 10
+    HORIZON = 10  # Forecast the next 1-10 minutes for proactive scaling
     
     if not os.path.exists(FEATURES_FILE):
         print(f"❌ Features file not found: {FEATURES_FILE}")
         return
     
     # Load features
-    df = load_features(FEATURES_FILE)
+    with profiling.stage('load_features'):
+        df = load_features(FEATURES_FILE)
     
-    # Use request_count as target
-    data = df[['request_count']].values
+    features = [col.strip() for col in args.features.split(',') if col.strip()]
+    missing = [col for col in features if col not in df.columns]
+    if missing:
+        parser.error(f"Unknown feature column(s): {', '.join(missing)}")
+    
+    # request_count (first column) is the target; the rest are extra inputs
+    data = df[features].to_numpy(dtype=np.float64)
     
     # Scale data
-    scaler = MinMaxScaler()
-    data_scaled = scaler.fit_transform(data)
+    with profiling.stage('scale'):
+        scaler = MinMaxScaler()
+        data_scaled = scaler.fit_transform(data).astype(np.float32)
     
-    # Create sequences
-    print(f"\n🔄 Creating sequences (seq_length={SEQ_LENGTH})...")
-    X, y = create_sequences(data_scaled, seq_length=SEQ_LENGTH)
+    # Create sequences (views of data_scaled, no per-window copies)
+    print(f"\n🔄 Creating sequences (seq_length={SEQ_LENGTH}, features={features})...")
+    with profiling.stage('sequences'):
+        X, y = create_sequences(data_scaled, seq_length=SEQ_LENGTH, horizon=HORIZON)
     
     print(f"   X shape: {X.shape}")
     print(f"   y shape: {y.shape}")
     
     # Split data
-    X_train, X_temp, y_train, y_temp = train_test_split(X, y, test_size=0.3, shuffle=False)
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=0.5, shuffle=False)
+    ranges = split_windows(len(X))
+    train_data, val_data, test_data = make_datasets(
+        data_scaled, ranges, seq_length=SEQ_LENGTH, horizon=HORIZON, batch_size=args.batch_size
+    )
     
     print(f"\n📊 Data Split:")
-    print(f"   Training: {len(X_train)} samples")
-    print(f"   Validation: {len(X_val)} samples")
-    print(f"   Testing: {len(X_test)} samples")
+    for label, (start, end) in zip(('Training', 'Validation', 'Testing'), ranges):
+        print(f"   {label}: {end - start} samples")
     
     # Build model
-    model = build_model(seq_length=SEQ_LENGTH, n_features=1)
+    with profiling.stage('build'):
+        model = build_model(seq_length=SEQ_LENGTH, n_features=len(features), horizon=HORIZON)
     
-    # Train
-    model, history = train_model(model, X_train, y_train, X_val, y_val, epochs=50, batch_size=32)
+    # Train (tf.data batches are allocated by TensorFlow, outside tracemalloc's view)
+    with profiling.stage('fit'):
+        model, history = train_model(model, train_data, val_data, epochs=args.epochs)
     
     # Evaluate
-    metrics = evaluate_model(model, X_test, y_test, scaler)
+    test_start, test_end = ranges[2]
+    with profiling.stage('evaluate'):
+        metrics = evaluate_model(model, test_data, np.ascontiguousarray(y[test_start:test_end]), scaler)
     
     # Save
-    save_model(model, scaler, metrics, SEQ_LENGTH)
+    with profiling.stage('save'):
+        save_model(model, scaler, metrics, SEQ_LENGTH, HORIZON, features)
     
     print(f"\n✅ Training complete!")
     print(f"   MAE: {metrics['mae']:.2f}")
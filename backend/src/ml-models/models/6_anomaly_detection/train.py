@@ -10,18 +10,26 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix
 import joblib
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import sys
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import profiling
+from utils.module_loader import load_module
+from utils.dataset import read_features
+from utils.plotting import get_pyplot, get_seaborn, plots_enabled, save_figure
+from utils.resources import get_n_jobs
+
+detect = load_module('models/6_anomaly_detection/detect.py')
 
 def load_features(features_file):
     """Load preprocessed features"""
     print(f"📖 Loading features from: {features_file}")
     
-    if features_file.endswith('.parquet'):
-        df = pd.read_parquet(features_file)
-    else:
-        df = pd.read_csv(features_file)
+    df = read_features(features_file)
     
     print(f"   Loaded {len(df)} samples")
     return df
@@ -90,7 +98,7 @@ def train_model(X, contamination=0.1):
         n_estimators=100,
         max_samples=256,
         random_state=42,
-        n_jobs=-1,
+        n_jobs=get_n_jobs(),
         verbose=1
     )
     
@@ -103,11 +111,11 @@ def evaluate_model(model, X, y_true):
     """Evaluate anomaly detection model"""
     print("\n📊 Evaluating model...")
     
-    # Predict (-1 for anomaly, 1 for normal)
-    y_pred = model.predict(X)
+    # Anomaly scores in one pass (negative = anomaly, same as predict() == -1)
+    scores = model.decision_function(X)
     
     # Convert to binary (1 for anomaly, 0 for normal)
-    y_pred_binary = (y_pred == -1).astype(int)
+    y_pred_binary = (scores < 0).astype(int)
     
     # Metrics
     report = classification_report(y_true, y_pred_binary, output_dict=True)
@@ -116,28 +124,28 @@ def evaluate_model(model, X, y_true):
     print(f"\n   Classification Report:")
     print(classification_report(y_true, y_pred_binary, target_names=['Normal', 'Anomaly']))
     
-    # Plot confusion matrix
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=['Normal', 'Anomaly'], yticklabels=['Normal', 'Anomaly'])
-    plt.title('Confusion Matrix - Anomaly Detection')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.savefig('confusion_matrix.png', dpi=300, bbox_inches='tight')
-    print(f"\n💾 Saved confusion matrix to: confusion_matrix.png")
-    
-    # Anomaly scores
-    scores = model.decision_function(X)
-    
-    # Plot anomaly scores
-    plt.figure(figsize=(12, 6))
-    plt.hist(scores[y_true == 0], bins=50, alpha=0.7, label='Normal', color='blue')
-    plt.hist(scores[y_true == 1], bins=50, alpha=0.7, label='Anomaly', color='red')
-    plt.xlabel('Anomaly Score')
-    plt.ylabel('Frequency')
-    plt.title('Anomaly Score Distribution')
-    plt.legend()
-    plt.savefig('anomaly_scores.png', dpi=300, bbox_inches='tight')
-    print(f"💾 Saved anomaly scores to: anomaly_scores.png")
+    if plots_enabled():
+        plt, sns = get_pyplot(), get_seaborn()
+        
+        # Plot confusion matrix
+        plt.figure(figsize=(8, 6))
+        sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', xticklabels=['Normal', 'Anomaly'], yticklabels=['Normal', 'Anomaly'])
+        plt.title('Confusion Matrix - Anomaly Detection')
+        plt.ylabel('True Label')
+        plt.xlabel('Predicted Label')
+        save_figure(plt, 'confusion_matrix.png')
+        print(f"\n💾 Saved confusion matrix to: confusion_matrix.png")
+        
+        # Plot anomaly scores
+        plt.figure(figsize=(12, 6))
+        plt.hist(scores[y_true == 0], bins=50, alpha=0.7, label='Normal', color='blue')
+        plt.hist(scores[y_true == 1], bins=50, alpha=0.7, label='Anomaly', color='red')
+        plt.xlabel('Anomaly Score')
+        plt.ylabel('Frequency')
+        plt.title('Anomaly Score Distribution')
+        plt.legend()
+        save_figure(plt, 'anomaly_scores.png')
+        print(f"💾 Saved anomaly scores to: anomaly_scores.png")
     
     return {
         'classification_report': report,
@@ -147,7 +155,7 @@ def evaluate_model(model, X, y_true):
         'f1_score': report['1']['f1-score']
     }
 
-def save_model(model, scaler, feature_cols, metrics):
+def save_model(model, scaler, feature_cols, metrics, hst=None):
     """Save anomaly detection model"""
     print("\n💾 Saving model...")
     
@@ -164,6 +172,10 @@ def save_model(model, scaler, feature_cols, metrics):
     with open('metrics.json', 'w') as f:
         json.dump(metrics, f, indent=2)
     print("   ✅ Saved metrics.json")
+    
+    if hst is not None:
+        hst.save(detect.HST_FILE)
+        print(f"   ✅ Saved {detect.HST_FILE}")
 
 def main():
     """Main training pipeline"""
@@ -176,28 +188,39 @@ def main():
         return
     
     # Load features
-    df = load_features(FEATURES_FILE)
+    with profiling.stage('load_features'):
+        df = load_features(FEATURES_FILE)
     
     # Create anomaly labels (for evaluation)
-    df = create_anomaly_labels(df)
-    
-    # Prepare features
-    X, y, feature_cols = prepare_features(df)
+    with profiling.stage('prepare'):
+        df = create_anomaly_labels(df)
+        
+        # Prepare features
+        X, y, feature_cols = prepare_features(df)
     
     # Scale features
     print("\n🔧 Scaling features...")
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    with profiling.stage('scale'):
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
     
     # Train model
     contamination = y.mean()  # Use actual anomaly rate
-    model = train_model(X_scaled, contamination=contamination)
+    with profiling.stage('fit'):
+        model = train_model(X_scaled, contamination=contamination)
     
     # Evaluate
-    metrics = evaluate_model(model, X_scaled, y)
+    with profiling.stage('evaluate'):
+        metrics = evaluate_model(model, X_scaled, y)
+    
+    # Streaming detector: prime Half-Space Trees on the most recent windows
+    print("\n🌳 Priming Half-Space Trees for online scoring...")
+    with profiling.stage('half_space_trees'):
+        hst = detect.HalfSpaceTrees(n_features=len(feature_cols), contamination=contamination).fit(X_scaled)
     
     # Save
-    save_model(model, scaler, feature_cols, metrics)
+    with profiling.stage('save'):
+        save_model(model, scaler, feature_cols, metrics, hst)
     
     print(f"\n✅ Training complete!")
     print(f"   Precision: {metrics['precision']:.2%}")
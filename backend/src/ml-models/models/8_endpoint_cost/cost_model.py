@@ -0,0 +1,164 @@
+"""
+Endpoint Cost Model
+Expected service time per route template, so balancers can weigh requests by cost instead of counting them
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils.interning import classify_unique
+from utils.module_loader import load_module
+
+route_trie = load_module('models/8_endpoint_cost/route_trie.py')
+
+COSTS_FILE = 'endpoint_costs.json'
+# Distinct raw paths remembered by estimate()
+ESTIMATE_CACHE_SIZE = 65_536
+
+class EndpointCostModel:
+    """
+    Expected service time per method and route template
+
+    Raw paths are normalized with a learned RouteTrie. Each route's mean cost is
+    shrunk toward its method's mean by prior_weight pseudo-requests, so a route
+    seen twice doesn't get an extreme estimate. Unknown routes fall back to the
+    method mean, then to the overall mean.
+    """
+
+    def __init__(self, trie, routes, method_costs, default_cost, unit='ms', prior_weight=5.0):
+        """
+        Initialize model
+
+        Args:
+            trie: RouteTrie used to normalize paths
+            routes: Dict of 'METHOD /template' -> stats (count, mean, p50, p90, cost)
+            method_costs: Mean cost per HTTP method
+            default_cost: Mean cost over all requests
+            unit: Unit of the costs
+            prior_weight: Pseudo-requests pulling route means toward the method mean
+        """
+        self.trie = trie
+        self.routes = routes
+        self.method_costs = method_costs
+        self.default_cost = default_cost
+        self.unit = unit
+        self.prior_weight = prior_weight
+        self._cache = {}
+
+    @classmethod
+    def fit(cls, methods, paths, costs, max_children=32, prior_weight=5.0, unit='ms'):
+        """
+        Learn route templates and per-route costs
+
+        Args:
+            methods: Series of HTTP methods
+            paths: Series of raw request paths
+            costs: Series of service times (or a proxy such as bytes / 1000)
+            max_children: Distinct literal segments per position before collapsing into :id
+            prior_weight: See __init__
+            unit: Unit of costs
+
+        Returns:
+            EndpointCostModel
+        """
+        paths = paths.astype('category')
+        trie = route_trie.RouteTrie.learn(paths.value_counts(sort=False).items(), max_children)
+
+        df = pd.DataFrame({
+            'method': methods.astype(str).str.upper().to_numpy(),
+            'template': classify_unique(paths, trie.match, default=None, dtype=object),
+            'cost': pd.to_numeric(costs, errors='coerce').to_numpy()
+        }).dropna(subset=['cost'])
+
+        default_cost = float(df['cost'].mean())
+        method_costs = df.groupby('method')['cost'].mean().astype(float).to_dict()
+        grouped = df.groupby(['method', 'template'])['cost']
+        stats = grouped.agg(['count', 'mean', 'median']).join(grouped.quantile(0.9).rename('p90'))
+
+        routes = {}
+        for (method, template), row in stats.iterrows():
+            prior = method_costs.get(method, default_cost)
+            routes[f"{method} {template}"] = {
+                'count': int(row['count']),
+                'mean': float(row['mean']),
+                'p50': float(row['median']),
+                'p90': float(row['p90']),
+                'cost': float((row['count'] * row['mean'] + prior_weight * prior) / (row['count'] + prior_weight))
+            }
+        return cls(trie, routes, method_costs, default_cost, unit=unit, prior_weight=prior_weight)
+
+    def template(self, path):
+        """Route template for a raw path (None if no learned route fits)"""
+        return self.trie.match(path)
+
+    def estimate(self, method, path):
+        """
+        Expected cost of one request
+
+        Args:
+            method: HTTP method
+            path: Raw request path (query strings and ids are normalized away)
+
+        Returns:
+            Cost in self.unit
+        """
+        key = (method, path)
+        cost = self._cache.get(key)
+        if cost is None:
+            method = method.upper()
+            route = self.routes.get(f"{method} {self.template(path)}")
+            cost = route['cost'] if route is not None else self.method_costs.get(method, self.default_cost)
+            if len(self._cache) >= ESTIMATE_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = cost
+        return cost
+
+    def estimate_many(self, methods, paths):
+        """Expected cost per request for Series of methods and paths (one lookup per distinct pair)"""
+        method_codes, method_values = pd.factorize(methods.astype(str))
+        path_codes, path_values = pd.factorize(paths.astype(str))
+        pairs, inverse = np.unique(method_codes.astype(np.int64) * len(path_values) + path_codes, return_inverse=True)
+        table = np.array([self.estimate(method_values[pair // len(path_values)], path_values[pair % len(path_values)])
+                          for pair in pairs], dtype=np.float64)
+        return table[inverse]
+
+    def top_routes(self, n=10):
+        """Routes with the highest estimated cost"""
+        return sorted(self.routes.items(), key=lambda item: -item[1]['cost'])[:n]
+
+    def to_dict(self):
+        return {
+            'unit': self.unit,
+            'prior_weight': self.prior_weight,
+            'default_cost': self.default_cost,
+            'method_costs': self.method_costs,
+            'routes': self.routes,
+            'trie': self.trie.to_dict()
+        }
+
+    def save(self, path=COSTS_FILE):
+        """Save as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path=COSTS_FILE):
+        """Load a model saved with save()"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(route_trie.RouteTrie.from_dict(data['trie']), data['routes'], data['method_costs'],
+                   data['default_cost'], unit=data.get('unit', 'ms'), prior_weight=data.get('prior_weight', 5.0))
+
+def load_model(model_dir=None):
+    """Load endpoint_costs.json from this folder (or model_dir)"""
+    model_dir = model_dir or os.path.dirname(os.path.abspath(__file__))
+    return EndpointCostModel.load(os.path.join(model_dir, COSTS_FILE))
@@ -0,0 +1,157 @@
+"""
+Route Template Trie
+Learns route templates (/product/:id) from raw request paths and matches paths to them segment by segment
+"""
+
+import re
+
+PARAM = ':id'
+
+# Segments that are obviously identifiers: numbers, UUIDs, long hex digests, long mixed tokens
+_ID_SEGMENT = re.compile(
+    r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,}'
+    r'|(?=[A-Za-z_-]*\d)[A-Za-z0-9_-]{20,})$'
+)
+
+def split_path(path):
+    """Path segments without query string, fragment or empty parts; identifier segments become PARAM"""
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    return [PARAM if _ID_SEGMENT.match(segment) else segment for segment in path.split('/') if segment]
+
+def join_template(segments):
+    return '/' + '/'.join(segments)
+
+class RouteNode:
+    """One path segment: literal children, an optional parameter child and request counts"""
+
+    __slots__ = ('children', 'param', 'count', 'terminal')
+
+    def __init__(self):
+        self.children = {}
+        self.param = None
+        self.count = 0
+        self.terminal = 0
+
+    def merge(self, other):
+        """Fold another subtree into this one (used when children collapse into a parameter)"""
+        self.count += other.count
+        self.terminal += other.terminal
+        if other.param is not None:
+            if self.param is None:
+                self.param = other.param
+            else:
+                self.param.merge(other.param)
+        for segment, child in other.children.items():
+            if segment in self.children:
+                self.children[segment].merge(child)
+            else:
+                self.children[segment] = child
+        return self
+
+class RouteTrie:
+    """
+    Trie of route templates
+
+    learn() counts raw paths segment by segment. A position with more than
+    max_children distinct literals (product ids that aren't numeric, user names,
+    slugs) is collapsed into one parameter, so /product/red-shoe and
+    /product/blue-hat both become /product/:id. match() walks a path in
+    O(segments), preferring literal segments over parameters and backtracking
+    when a literal branch dead-ends.
+    """
+
+    def __init__(self, max_children=32):
+        """
+        Initialize trie
+
+        Args:
+            max_children: Distinct literal segments kept at one position before they collapse into a parameter
+        """
+        self.root = RouteNode()
+        self.max_children = max_children
+
+    def insert(self, path, count=1):
+        """Count one path (or template) without collapsing"""
+        node = self.root
+        node.count += count
+        for segment in split_path(path):
+            if segment == PARAM:
+                if node.param is None:
+                    node.param = RouteNode()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, RouteNode())
+            node.count += count
+        node.terminal += count
+        return self
+
+    def _collapse(self, node):
+        if len(node.children) > self.max_children:
+            merged = node.param or RouteNode()
+            for child in node.children.values():
+                merged.merge(child)
+            node.children, node.param = {}, merged
+        for child in node.children.values():
+            self._collapse(child)
+        if node.param is not None:
+            self._collapse(node.param)
+
+    @classmethod
+    def learn(cls, path_counts, max_children=32):
+        """
+        Build a trie from observed paths
+
+        Args:
+            path_counts: Dict (or iterable of pairs) of raw path -> request count
+            max_children: See __init__
+
+        Returns:
+            RouteTrie
+        """
+        trie = cls(max_children)
+        items = path_counts.items() if hasattr(path_counts, 'items') else path_counts
+        for path, count in items:
+            trie.insert(path, count)
+        trie._collapse(trie.root)
+        return trie
+
+    def _match(self, node, segments, i, matched):
+        if i == len(segments):
+            return matched if node.terminal else None
+        child = node.children.get(segments[i])
+        if child is not None:
+            found = self._match(child, segments, i + 1, matched + [segments[i]])
+            if found is not None:
+                return found
+        if node.param is not None:
+            return self._match(node.param, segments, i + 1, matched + [PARAM])
+        return None
+
+    def match(self, path):
+        """Route template for a raw path, or None if no learned route fits"""
+        segments = self._match(self.root, split_path(path), 0, [])
+        return None if segments is None else join_template(segments)
+
+    def templates(self):
+        """Learned templates with their request counts (most requested first)"""
+        found, stack = [], [(self.root, [])]
+        while stack:
+            node, segments = stack.pop()
+            if node.terminal:
+                found.append((join_template(segments), node.terminal))
+            stack.extend((child, segments + [segment]) for segment, child in node.children.items())
+            if node.param is not None:
+                stack.append((node.param, segments + [PARAM]))
+        return sorted(found, key=lambda item: -item[1])
+
+    def to_dict(self):
+        """JSON-friendly form: templates and the collapse threshold"""
+        return {'max_children': self.max_children, 'templates': dict(self.templates())}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a trie saved with to_dict (templates are inserted as they are)"""
+        trie = cls(data.get('max_children', 32))
+        for template, count in data['templates'].items():
+            trie.insert(template, count)
+        return trie
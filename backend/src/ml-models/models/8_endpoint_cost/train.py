@@ -0,0 +1,147 @@
+"""
+Endpoint Cost Model - Training Script
+Learns route templates and expected service time per route, and replays requests to compare balancer weightings
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import profiling
+from utils.module_loader import load_module
+
+cost_model = load_module('models/8_endpoint_cost/cost_model.py')
+least_connection = load_module('models/2_least_connection/least_connection.py')
+
+PARSED_LOGS_FILE = "../../data/processed/parsed_logs.csv"
+# Same default as backend/src/config/sqlite.js (DB_PATH overrides it there too)
+DB_FILE = os.environ.get('DB_PATH', os.path.join(ML_ROOT, '..', '..', 'data', 'monitoring.db'))
+
+def load_requests(source, path):
+    """
+    Load method, endpoint and cost per request
+
+    Args:
+        source: 'logs' (parsed access logs; cost = bytes / 1000, the simulated response time
+            aggregate_metrics uses) or 'db' (api_requests.response_time in ms from the backend)
+        path: parsed_logs.csv or SQLite database path
+
+    Returns:
+        DataFrame with method, endpoint and cost columns
+    """
+    print(f"📖 Loading requests from: {path}")
+    if source == 'db':
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            df = pd.read_sql_query(
+                "SELECT method, endpoint, response_time AS cost FROM api_requests WHERE response_time IS NOT NULL",
+                conn
+            )
+    else:
+        df = pd.read_csv(path, usecols=['method', 'endpoint', 'size'], dtype={'method': 'category', 'endpoint': 'category'})
+        df['cost'] = df.pop('size') / 1000
+    print(f"   Loaded {len(df)} requests, {df['endpoint'].nunique()} distinct paths")
+    return df
+
+def simulate_assignment(actual_costs, estimated_costs, num_servers=3, utilization=0.8, seed=42):
+    """
+    Replay requests through Least Connection with each weighting
+
+    Requests arrive as a Poisson process sized for the target utilization. Each
+    server works its queue in FIFO order at unit speed. The balancer only sees
+    estimated costs; queues advance by the actual costs.
+
+    Args:
+        actual_costs: Service time per request, in arrival order
+        estimated_costs: EndpointCostModel estimate per request
+        num_servers: Backend servers
+        utilization: Offered load / capacity
+        seed: Random seed for arrival times
+
+    Returns:
+        Dict of weighting -> latency stats (mean, p95, p99) in cost units
+    """
+    actual_costs = np.asarray(actual_costs, dtype=np.float64)
+    rate = utilization * num_servers / actual_costs.mean()
+    arrivals = np.cumsum(np.random.default_rng(seed).exponential(1 / rate, len(actual_costs)))
+    servers = [f"server_{i+1}" for i in range(num_servers)]
+
+    results = {}
+    for weighting in least_connection.LeastConnectionBalancer.WEIGHTINGS:
+        balancer = least_connection.LeastConnectionBalancer(servers, weighting=weighting)
+        free_at = dict.fromkeys(servers, 0.0)
+        in_flight = []
+        latencies = np.empty(len(actual_costs))
+
+        for i, (now, actual, estimate) in enumerate(zip(arrivals, actual_costs, estimated_costs)):
+            while in_flight and in_flight[0][0] <= now:
+                _, server, cost = heapq.heappop(in_flight)
+                balancer.release_connection(server, cost)
+            server = balancer.get_next_server(estimate)
+            free_at[server] = max(free_at[server], now) + actual
+            heapq.heappush(in_flight, (free_at[server], server, estimate))
+            latencies[i] = free_at[server] - now
+
+        results[weighting] = {
+            'mean': float(latencies.mean()),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99))
+        }
+    return results
+
+def main():
+    """Main training pipeline"""
+    parser = argparse.ArgumentParser(description='Learn per-route request costs for cost-weighted balancing')
+    parser.add_argument('--source', choices=['logs', 'db'], default='logs',
+                        help="parsed_logs.csv (bytes as cost proxy) or the backend's api_requests table")
+    parser.add_argument('--input', help='Input file (default: parsed_logs.csv or backend/data/monitoring.db)')
+    parser.add_argument('--max-children', type=int, default=32,
+                        help='Distinct segments at one path position before they collapse into :id')
+    parser.add_argument('--servers', type=int, default=3, help='Servers in the replay comparison')
+    args = parser.parse_args()
+
+    print("🚀 Endpoint Cost Model Training\n")
+    path = args.input or (DB_FILE if args.source == 'db' else PARSED_LOGS_FILE)
+    if not os.path.exists(path):
+        print(f"❌ Input not found: {path}")
+        return
+
+    with profiling.stage('load_requests'):
+        df = load_requests(args.source, path)
+
+    print("\n🧭 Learning route templates and costs...")
+    with profiling.stage('fit'):
+        model = cost_model.EndpointCostModel.fit(
+            df['method'], df['endpoint'], df['cost'], max_children=args.max_children,
+            unit='ms' if args.source == 'db' else 'ms (bytes / 1000)'
+        )
+    print(f"   {len(model.trie.templates())} route templates, {len(model.routes)} method/route pairs")
+    for route, stats in model.top_routes(5):
+        print(f"   {route}: {stats['cost']:.2f} (mean {stats['mean']:.2f}, p90 {stats['p90']:.2f}, n={stats['count']})")
+
+    print(f"\n⚖️ Replaying {len(df)} requests on {args.servers} servers...")
+    with profiling.stage('evaluate'):
+        estimates = model.estimate_many(df['method'], df['endpoint'])
+        replay = simulate_assignment(df['cost'].to_numpy(), estimates, num_servers=args.servers)
+    for weighting, stats in replay.items():
+        print(f"   {weighting:<12} latency mean {stats['mean']:.2f}  p95 {stats['p95']:.2f}  p99 {stats['p99']:.2f}")
+
+    with profiling.stage('save'):
+        model.save(cost_model.COSTS_FILE)
+        with open('metrics.json', 'w') as f:
+            json.dump({'routes': len(model.routes), 'replay': replay}, f, indent=2)
+    print(f"\n💾 Saved model to: {cost_model.COSTS_FILE}")
+    print(f"💾 Saved metrics to: metrics.json")
+    print("\n✅ Training complete!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""
+ML Pipeline CLI
+Runs preprocessing/training stages as a DAG (trainers in parallel) and fast predictions, importing heavy libraries only when needed
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+ML_ROOT = os.path.dirname(os.path.abspath(__file__))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import dataset, profiling
+from utils.module_loader import load_module
+from utils.plotting import set_headless
+from utils.resources import apply_cpu_budget
+
+# Each stage runs a script's main() from its own folder (the scripts use relative paths).
+# 'deps' are upstream stages; a stage is up to date when its outputs are newer than its
+# inputs and script. 'runs' lists argv for scripts with a command line; 'incremental_args'
+# are added by `run --incremental`. 'parallel' stages
+# run in worker processes, sharing the CPUs in proportion to 'cpu_weight'.
+STAGES = {
+    'parse': {
+        'script': 'preprocessing/parse_logs.py',
+        'cwd': 'preprocessing',
+        'deps': [],
+        'inputs': ['../data set/access.log'],
+        'outputs': ['data/processed/parsed_logs.csv'],
+        'help': 'Parse access.log into parsed_logs.csv'
+    },
+    'features': {
+        'script': 'preprocessing/extract_features.py',
+        'cwd': 'preprocessing',
+        'deps': ['parse'],
+        'inputs': ['data/processed/parsed_logs.csv'],
+        'outputs': ['data/features/features.parquet'],
+        'help': 'Aggregate 1-minute windows and time-series features'
+    },
+    'random-forest': {
+        'script': 'models/3_random_forest/train.py',
+        'cwd': 'models/3_random_forest',
+        'deps': ['features'],
+        'inputs': ['data/features/features.parquet', 'models/3_random_forest/tuned_params.json'],
+        'outputs': ['models/3_random_forest/model.pkl'],
+        'incremental_args': ['--incremental'],
+        'parallel': True,
+        'cpu_weight': 2,
+        'help': 'Train the Random Forest router'
+    },
+    'xgboost': {
+        'script': 'models/4_xgboost/train.py',
+        'cwd': 'models/4_xgboost',
+        'deps': ['features'],
+        'inputs': ['data/features/features.parquet', 'models/4_xgboost/tuned_params.json'],
+        'outputs': ['models/4_xgboost/model.pkl'],
+        'incremental_args': ['--incremental'],
+        'parallel': True,
+        'cpu_weight': 2,
+        'help': 'Train the XGBoost router'
+    },
+    'lstm': {
+        'script': 'models/5_lstm/train.py',
+        'cwd': 'models/5_lstm',
+        'deps': ['features'],
+        'inputs': ['data/features/features.parquet'],
+        'outputs': ['models/5_lstm/lstm_weights.npz'],
+        'parallel': True,
+        'cpu_weight': 3,
+        'help': 'Train the LSTM forecaster (exports NumPy weights)'
+    },
+    'anomaly': {
+        'script': 'models/6_anomaly_detection/train.py',
+        'cwd': 'models/6_anomaly_detection',
+        'deps': ['features'],
+        'inputs': ['data/features/features.parquet'],
+        'outputs': ['models/6_anomaly_detection/model.pkl'],
+        'parallel': True,
+        'cpu_weight': 1,
+        'help': 'Train the Isolation Forest and prime Half-Space Trees'
+    },
+    'endpoint-cost': {
+        'script': 'models/8_endpoint_cost/train.py',
+        'cwd': 'models/8_endpoint_cost',
+        'deps': ['parse'],
+        'inputs': ['data/processed/parsed_logs.csv'],
+        'outputs': ['models/8_endpoint_cost/endpoint_costs.json'],
+        'parallel': True,
+        'cpu_weight': 1,
+        'help': 'Learn route templates and per-route request costs'
+    },
+    'compile': {
+        'script': 'deployment/compiled_trees.py',
+        'cwd': '.',
+        'deps': ['random-forest', 'xgboost', 'anomaly'],
+        'runs': [['models/3_random_forest'], ['models/4_xgboost'], ['models/6_anomaly_detection']],
+        'inputs': [],
+        'outputs': [],
+        'help': 'Export trained tree ensembles to compiled node arrays'
+    }
+}
+
+DEFAULT_STAGES = list(STAGES)
+
+# Worker output goes to <stage cwd>/<LOG_FILE> instead of interleaving on the console
+LOG_FILE = 'train.log'
+
+PREDICT_MODELS = {
+    'random-forest': 'models/3_random_forest',
+    'xgboost': 'models/4_xgboost',
+    'anomaly': 'models/6_anomaly_detection',
+    'lstm': 'models/5_lstm'
+}
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Temporarily change the working directory"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+@contextlib.contextmanager
+def script_argv(argv):
+    """Temporarily replace sys.argv for a script's argparse"""
+    previous = sys.argv
+    sys.argv = argv
+    try:
+        yield
+    finally:
+        sys.argv = previous
+
+def stage_files(name):
+    """
+    Files a stage reads and writes (paths relative to ml-models/)
+
+    Returns:
+        inputs: Upstream files plus the stage's script
+        outputs: Files the stage must (re)write
+    """
+    spec = STAGES[name]
+    inputs, outputs = spec['inputs'] + [spec['script']], list(spec['outputs'])
+    for args in spec.get('runs', []):
+        model_file = os.path.join(args[0], 'model.pkl')
+        if os.path.exists(os.path.join(ML_ROOT, model_file)):
+            inputs.append(model_file)
+            outputs.append(os.path.join(args[0], 'compiled', 'meta.json'))
+    return inputs, outputs
+
+def is_up_to_date(name):
+    """Whether every output exists and is newer than every existing input"""
+    inputs, outputs = stage_files(name)
+    if not outputs:
+        return False
+    paths = [os.path.join(ML_ROOT, path) for path in outputs]
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    newest_input = max((os.path.getmtime(os.path.join(ML_ROOT, path)) for path in inputs
+                        if os.path.exists(os.path.join(ML_ROOT, path))), default=0)
+    return min(os.path.getmtime(path) for path in paths) >= newest_input
+
+def stage_args(name, incremental=False):
+    """Extra command line arguments for a stage's script"""
+    return STAGES[name].get('incremental_args', []) if incremental else []
+
+def resolve_stages(stages):
+    """Add upstream dependencies; returns stage names in DAG order"""
+    needed, stack = set(), list(stages)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(STAGES[name]['deps'])
+    # STAGES is declared in dependency order
+    return [name for name in STAGES if name in needed]
+
+def _result(name, status, error=None, import_s=0.0, run_s=0.0, cpu_s=0.0):
+    return {'stage': name, 'status': status, 'error': error,
+            'import_s': import_s, 'run_s': run_s, 'cpu_s': cpu_s}
+
+def run_stage(name, extra_args=()):
+    """
+    Import a stage's script and run its main()
+
+    Args:
+        name: Stage name (see STAGES)
+        extra_args: Command line arguments added to each run of the script
+
+    Returns:
+        Dict with import_s, run_s, cpu_s and status ('ok' or 'failed')
+    """
+    spec = STAGES[name]
+    print(f"\n{'=' * 60}\n▶️  Stage: {name} ({spec['script']})\n{'=' * 60}")
+
+    started_at = time.time()
+    cpu_start = time.process_time()
+    error = None
+    _, outputs = stage_files(name)
+    import_s = 0.0
+    start = time.perf_counter()
+    try:
+        with profiling.stage(name):
+            with profiling.stage('import'):
+                module = load_module(spec['script'])
+            import_s = time.perf_counter() - start
+
+            script = os.path.join(ML_ROOT, spec['script'])
+            with working_directory(os.path.join(ML_ROOT, spec['cwd'])):
+                for args in spec.get('runs', [[]]):
+                    if args and not os.path.exists(os.path.join(ML_ROOT, args[0], 'model.pkl')):
+                        print(f"⚠️ Skipping {args[0]}: no trained model")
+                        continue
+                    with script_argv([script] + [os.path.join(ML_ROOT, arg) for arg in args] + list(extra_args)):
+                        module.main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f"exited with {e.code}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    run_s = time.perf_counter() - start - import_s
+
+    # Scripts report missing inputs by printing and returning; check that outputs were written
+    if error is None:
+        stale = [path for path in outputs
+                 if not os.path.exists(os.path.join(ML_ROOT, path))
+                 or os.path.getmtime(os.path.join(ML_ROOT, path)) < started_at - 1]
+        if stale:
+            error = f"did not write {', '.join(stale)}"
+
+    if error:
+        print(f"❌ Stage {name} failed: {error}")
+
+    result = _result(name, 'failed' if error else 'ok', error, import_s, run_s, time.process_time() - cpu_start)
+    if profiling.enabled():
+        result['profile'] = profiling.pop_records()
+    return result
+
+def _run_in_worker(name, cpus, log_file, extra_args=()):
+    """Pool task: apply the CPU budget, send all output (including C-level) to log_file, run the stage"""
+    apply_cpu_budget(cpus)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(log_file, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    return run_stage(name, extra_args)
+
+def print_report(results, wall_s=None):
+    """Print per-stage start offset, CPU budget and import/run times"""
+    print(f"\n⏱️  Stage timings:")
+    print(f"   {'stage':<16}{'start':>9}{'cpus':>6}{'import':>10}{'run':>10}{'cpu':>10}  status")
+    for r in results:
+        start = f"{r['start_s']:>8.2f}s" if 'start_s' in r else f"{'-':>9}"
+        print(f"   {r['stage']:<16}{start}{r.get('cpus', '-'):>6}{r['import_s']:>9.2f}s{r['run_s']:>9.2f}s"
+              f"{r['cpu_s']:>9.2f}s  {r['status']}")
+    stage_s = sum(r['import_s'] + r['run_s'] for r in results)
+    print(f"   Sum of stage times: {stage_s:.2f}s")
+    if wall_s is not None:
+        print(f"   Wall time:          {wall_s:.2f}s")
+
+def run_pipeline(stages, jobs=None, force=False, report_file=None, incremental=False, profile_file=None,
+                 cprofile_dir=None, profile_allocations=False):
+    """
+    Run stages and their upstream dependencies as a DAG
+
+    Up-to-date stages are skipped (unless requested with force). Parallel stages
+    (the trainers) run in a process pool; the features file is loaded once in this
+    process before the pool forks, so workers share it. Each worker gets a share of
+    the CPUs by cpu_weight and caps its estimators' n_jobs / BLAS / TensorFlow
+    threads to it, so concurrent trainers do not oversubscribe the machine. When a
+    stage fails, its dependents are marked 'blocked' and independent stages go on.
+
+    Args:
+        stages: Requested stage names
+        jobs: Max concurrent worker processes (default: CPU count; 1 = run in-process, in order)
+        force: Rerun requested stages even if up to date
+        report_file: Write per-stage results to this JSON file
+        incremental: Refresh RF/XGBoost from new windows only (their 'incremental_args')
+        profile_file: Write per-stage wall/CPU/memory profiles to this JSON file (utils/profiling.py)
+        cprofile_dir: Also dump cProfile stats per stage into this directory (needs profile_file)
+        profile_allocations: Top allocations for every sub-stage, not just per stage (slow; needs profile_file)
+
+    Returns:
+        List of per-stage result dicts
+    """
+    cpus = os.cpu_count() or 1
+    jobs = jobs or cpus
+    order = resolve_stages(stages)
+    requested = set(stages)
+    pending, queue = list(order), []
+    results, running = {}, {}
+    pool = None
+    if profile_file:
+        # Workers inherit the setting; their records come back with the stage results
+        profiling.enable(profile_file, cprofile_dir, autosave=False, allocations=profile_allocations)
+    pipeline_start = time.perf_counter()
+
+    try:
+        while pending or queue or running:
+            # Resolve every stage whose dependencies have finished
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in list(pending):
+                    deps = [results.get(dep) for dep in STAGES[name]['deps'] if dep in order]
+                    if None in deps:
+                        continue
+                    pending.remove(name)
+                    progressed = True
+                    failed = [r['stage'] for r in deps if r['status'] in ('failed', 'blocked')]
+                    if failed:
+                        results[name] = _result(name, 'blocked', f"upstream failed: {', '.join(failed)}")
+                        print(f"⛔ {name}: blocked ({', '.join(failed)} failed)")
+                    elif not (force and name in requested) and is_up_to_date(name):
+                        results[name] = _result(name, 'skipped')
+                        print(f"⏭️  {name}: up to date")
+                    elif jobs > 1 and STAGES[name].get('parallel'):
+                        queue.append(name)
+                    else:
+                        start_s = time.perf_counter() - pipeline_start
+                        result = run_stage(name, stage_args(name, incremental))
+                        results[name] = dict(result, start_s=start_s, cpus=cpus)
+                        progressed = True
+
+            # Start queued trainers in free worker slots
+            batch = queue[:max(0, jobs - len(running))]
+            if batch:
+                if pool is None:
+                    from concurrent.futures import ProcessPoolExecutor
+                    import multiprocessing
+
+                    features_file = os.path.join(ML_ROOT, 'data', 'features', 'features.parquet')
+                    if os.path.exists(features_file):
+                        dataset.preload(features_file)
+                        print(f"📦 Loaded {os.path.relpath(features_file, ML_ROOT)} once for all workers")
+                    # fork lets workers inherit the loaded dataset (spawn platforms re-read it)
+                    context = multiprocessing.get_context(
+                        'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+                    )
+                    pool = ProcessPoolExecutor(max_workers=jobs, mp_context=context)
+
+                free = max(len(batch), cpus - sum(budget for _, budget, _, _ in running.values()))
+                weights = sum(STAGES[name].get('cpu_weight', 1) for name in batch)
+                for name in batch:
+                    queue.remove(name)
+                    budget = max(1, free * STAGES[name].get('cpu_weight', 1) // weights)
+                    log_file = os.path.join(ML_ROOT, STAGES[name]['cwd'], LOG_FILE)
+                    future = pool.submit(_run_in_worker, name, budget, log_file, stage_args(name, incremental))
+                    running[future] = (name, budget, log_file, time.perf_counter() - pipeline_start)
+                    print(f"🚀 {name}: started with {budget} CPU(s), log: {os.path.relpath(log_file, ML_ROOT)}")
+
+            if running:
+                from concurrent.futures import FIRST_COMPLETED, wait
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, budget, log_file, start_s = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = _result(name, 'failed', f"worker crashed: {type(e).__name__}: {e}")
+                    results[name] = dict(result, start_s=start_s, cpus=budget, log=log_file)
+                    status = '✅' if result['status'] == 'ok' else '❌'
+                    print(f"{status} {name}: {result['status']} in {result['import_s'] + result['run_s']:.2f}s"
+                          + (f" ({result['error']})" if result['error'] else ''))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    wall_s = time.perf_counter() - pipeline_start
+    ordered = [results[name] for name in order]
+    profiles = [record for r in ordered for record in r.pop('profile', [])]
+    print_report(ordered, wall_s)
+    if report_file:
+        with open(report_file, 'w') as f:
+            json.dump({'cpus': cpus, 'jobs': jobs, 'wall_s': wall_s, 'stages': ordered}, f, indent=2)
+        print(f"💾 Saved timing report to: {report_file}")
+    if profile_file:
+        profiling.write_report(profile_file, profiles)
+    return ordered
+
+def load_compiled(model_dir):
+    """
+    Load compiled node arrays if they are newer than model.pkl
+
+    Returns:
+        (CompiledEnsemble, feature_cols), or None when there is no up-to-date export
+    """
+    compiled_dir = os.path.join(model_dir, 'compiled')
+    compiled_meta = os.path.join(compiled_dir, 'meta.json')
+    if not os.path.exists(compiled_meta) or \
+            os.path.getmtime(compiled_meta) < os.path.getmtime(os.path.join(model_dir, 'model.pkl')):
+        return None
+
+    compiled_trees = load_module('deployment/compiled_trees.py')
+    compiled = compiled_trees.CompiledEnsemble.load(compiled_dir)
+    feature_cols = compiled.meta.get('feature_cols')
+    if feature_cols is None:
+        with open(os.path.join(model_dir, 'feature_cols.json'), 'r') as f:
+            feature_cols = json.load(f)
+    return compiled, feature_cols
+
+def load_predictor(name, model_dir):
+    """
+    Load the lightest predictor available for a model
+
+    Compiled node arrays and the NumPy LSTM need only NumPy; the sklearn/xgboost
+    pickles are a fallback when no export exists.
+
+    Returns:
+        Function mapping a list of feature dicts (or {'sequence': [...]} for lstm) to result dicts
+    """
+    if name == 'lstm':
+        lstm_predict = load_module('models/5_lstm/predict.py')
+        model, scaler, seq_length = lstm_predict.load_model(model_dir)
+        return lambda rows: [
+            {'forecast': row.tolist()}
+            for row in lstm_predict.predict_batch(model, scaler, [r['sequence'] for r in rows], seq_length)
+        ]
+
+    predict = load_module('models/3_random_forest/predict.py')
+    compiled = load_compiled(model_dir)
+    if compiled is not None:
+        compiled, feature_cols = compiled
+        if compiled.kind == 'isolation':
+            def score(rows):
+                scores = compiled.decision_function(predict.build_feature_matrix(rows, feature_cols))
+                return [{'anomaly_score': float(s), 'is_anomaly': bool(s < 0)} for s in scores]
+            return score
+
+        def route(rows):
+            probabilities = compiled.predict_proba(predict.build_feature_matrix(rows, feature_cols))
+            return [{'server_id': int(compiled.classes_[p.argmax()]), 'probabilities': p.tolist()}
+                    for p in probabilities]
+        return route
+
+    if name == 'anomaly':
+        detect = load_module('models/6_anomaly_detection/detect.py')
+        model, scaler, feature_cols, _ = detect.load_model(model_dir)
+
+        def score(rows):
+            scores, flags = detect.score_windows(model, scaler, rows, feature_cols)
+            return [{'anomaly_score': float(s), 'is_anomaly': bool(f)} for s, f in zip(scores, flags)]
+        return score
+
+    model, scaler, feature_cols = predict.load_model(model_dir)
+
+    def route(rows):
+        server_ids, probabilities = predict.predict_batch(model, scaler, rows, feature_cols)
+        return [{'server_id': int(s), 'probabilities': p.tolist()} for s, p in zip(server_ids, probabilities)]
+    return route
+
+def main():
+    """Pipeline command line"""
+    parser = argparse.ArgumentParser(description='Run ML pipeline stages and predictions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run pipeline stages')
+    run_parser.add_argument('stages', nargs='*', metavar='stage',
+                            help=f"Stages to run (default: {' '.join(DEFAULT_STAGES)})")
+    run_parser.add_argument('--headless', action='store_true',
+                            help='Skip all charts and progress bars (cron / batch jobs)')
+    run_parser.add_argument('--plot-dpi', type=int, help='Resolution of saved charts (default 300)')
+    run_parser.add_argument('--report', help='Write per-stage timings to a JSON file')
+    run_parser.add_argument('--profile', metavar='FILE',
+                            help='Write wall/CPU time, RSS and top allocations per (sub)stage to a JSON file')
+    run_parser.add_argument('--cprofile', metavar='DIR', help='With --profile, also dump cProfile stats per stage')
+    run_parser.add_argument('--profile-allocations', action='store_true',
+                            help='With --profile, list top allocations for every sub-stage (two heap snapshots each)')
+    run_parser.add_argument('--jobs', type=int, help='Max trainers running at once (default: CPU count; 1 = in-process)')
+    run_parser.add_argument('--force', action='store_true', help='Rerun the requested stages even if up to date')
+    run_parser.add_argument('--incremental', action='store_true',
+                            help='Refresh RF/XGBoost with new windows only (warm start / continued boosting)')
+
+    subparsers.add_parser('list', help='List stages')
+
+    predict_parser = subparsers.add_parser('predict', help='Predict from JSON rows without loading training libraries')
+    predict_parser.add_argument('model', choices=sorted(PREDICT_MODELS))
+    predict_parser.add_argument('input', help="JSON object/list, or @file.json ('-' = stdin)")
+    predict_parser.add_argument('--models-dir', default=ML_ROOT, help='Directory containing models/')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, spec in STAGES.items():
+            state = 'up to date' if is_up_to_date(name) else 'stale'
+            after = f" (after {', '.join(spec['deps'])})" if spec['deps'] else ''
+            print(f"   {name:<16}{state:<12}{spec['help']}{after}")
+        return 0
+
+    if args.command == 'predict':
+        start = time.perf_counter()
+        raw = sys.stdin.read() if args.input == '-' else \
+            open(args.input[1:]).read() if args.input.startswith('@') else args.input
+        rows = json.loads(raw)
+        rows = rows if isinstance(rows, list) else [rows]
+
+        # Keep stdout for the JSON result; loaders print progress
+        with contextlib.redirect_stdout(sys.stderr):
+            predictor = load_predictor(args.model, os.path.join(args.models_dir, PREDICT_MODELS[args.model]))
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        results = predictor(rows)
+        print(json.dumps(results if len(results) > 1 else results[0]))
+        print(f"⏱️  startup + load {load_s * 1000:.0f} ms, predict {(time.perf_counter() - start) * 1000:.1f} ms",
+              file=sys.stderr)
+        return 0
+
+    unknown = [name for name in args.stages if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+
+    if args.headless:
+        set_headless(True)
+        os.environ['TQDM_DISABLE'] = '1'
+    if args.plot_dpi:
+        set_headless(args.headless, dpi=args.plot_dpi)
+
+    if args.cprofile and not args.profile:
+        parser.error('--cprofile needs --profile')
+    if args.profile_allocations and not args.profile:
+        parser.error('--profile-allocations needs --profile')
+
+    results = run_pipeline(args.stages or DEFAULT_STAGES, args.jobs, args.force, args.report, args.incremental,
+                           args.profile, args.cprofile, args.profile_allocations)
+    return 0 if all(r['status'] in ('ok', 'skipped') for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,15 +7,26 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import os
+import sys
 from tqdm import tqdm
 
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import profiling
+from utils.interning import CATEGORICAL_FIELDS, classify_unique, is_bot_agent
+
 def load_parsed_logs(file_path):
     """Load parsed logs"""
     print(f"📖 Loading parsed logs from: {file_path}")
-    df = pd.read_csv(file_path)
+    # Repeated strings load as categoricals: integer codes plus one copy of each distinct value
+    with profiling.stage('read_csv'):
+        df = pd.read_csv(file_path, dtype={field: 'category' for field in CATEGORICAL_FIELDS})
     
     # Convert timestamp
-    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
+    with profiling.stage('to_datetime'):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%d/%b/%Y:%H:%M:%S %z', errors='coerce')
     
     return df
 
@@ -40,8 +51,8 @@ def extract_request_features(df):
     """Extract request-related features"""
     print("📊 Extracting request features...")
     
-    # Detect bots
-    df['is_bot'] = df['user_agent'].str.contains('bot|crawler|spider', case=False, na=False)
+    # Detect bots (regex runs once per distinct user agent, not per row)
+    df['is_bot'] = classify_unique(df['user_agent'], is_bot_agent)
     
     # HTTP method one-hot encoding
     df['is_get'] = (df['method'] == 'GET').astype(int)
@@ -167,20 +178,26 @@ def main():
     df = load_parsed_logs(parsed_logs_file)
     
     # Extract features
-    df = extract_temporal_features(df)
-    df = extract_request_features(df)
+    with profiling.stage('temporal_features'):
+        df = extract_temporal_features(df)
+    with profiling.stage('request_features'):
+        df = extract_request_features(df)
     
     # Aggregate metrics (1-minute intervals)
-    df_metrics = aggregate_metrics(df, interval='1min')
+    with profiling.stage('aggregate'):
+        df_metrics = aggregate_metrics(df, interval='1min')
     
     # Create time-series features
-    df_features = create_time_series_features(df_metrics, lookback=10)
+    with profiling.stage('time_series_features'):
+        df_features = create_time_series_features(df_metrics, lookback=10)
     
     # Create labels
-    df_features = create_load_labels(df_features, threshold_percentile=75)
+    with profiling.stage('labels'):
+        df_features = create_load_labels(df_features, threshold_percentile=75)
     
     # Save features
-    save_features(df_features, FEATURES_DIR)
+    with profiling.stage('save'):
+        save_features(df_features, FEATURES_DIR)
     
     # Display summary
     print("\n📊 Feature Summary:")
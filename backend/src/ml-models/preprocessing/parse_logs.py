@@ -8,13 +8,21 @@ import pandas as pd
 from datetime import datetime
 from tqdm import tqdm
 import os
+import sys
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
+
+from utils import profiling
 
 # Apache/NGINX log pattern
 LOG_PATTERN = r'(\S+) - - \[(.*?)\] "(.*?)" (\d+) (\d+) "(.*?)" "(.*?)"'
+_LOG_RE = re.compile(LOG_PATTERN)
 
 def parse_log_line(line):
     """Parse a single log line"""
-    match = re.match(LOG_PATTERN, line)
+    match = _LOG_RE.match(line)
     if match:
         try:
             request_parts = match.group(3).split(' ')
@@ -41,6 +49,10 @@ def parse_access_log(log_file, output_file, sample_size=None, chunk_size=10000):
     """
     Parse access log file and save to CSV
     
+    The CSV is written to a temporary file next to output_file and moved into
+    place once parsing finishes, so a rerun replaces the previous output
+    instead of appending to it (and a failed run leaves it untouched).
+    
     Args:
         log_file: Path to access.log
         output_file: Path to save parsed CSV
@@ -51,37 +63,40 @@ def parse_access_log(log_file, output_file, sample_size=None, chunk_size=10000):
     
     logs = []
     line_count = 0
+    tmp_file = f"{output_file}.tmp"
+    header = True
     
-    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in tqdm(f, desc="Parsing logs"):
-            if sample_size and line_count >= sample_size:
-                break
-                
-            parsed = parse_log_line(line.strip())
-            if parsed:
-                logs.append(parsed)
-                line_count += 1
-                
-                # Save in chunks to avoid memory issues
-                if len(logs) >= chunk_size:
-                    df_chunk = pd.DataFrame(logs)
+    def write_chunk(rows):
+        nonlocal header
+        with profiling.stage('write_csv', allocations=False):
+            pd.DataFrame(rows).to_csv(tmp_file, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    
+    # Profiled as parse_lines (regex matching) with write_csv (DataFrame + CSV append) nested inside
+    try:
+        with profiling.stage('parse_lines'), open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in tqdm(f, desc="Parsing logs"):
+                if sample_size and line_count >= sample_size:
+                    break
                     
-                    # Append to CSV
-                    if not os.path.exists(output_file):
-                        df_chunk.to_csv(output_file, index=False)
-                    else:
-                        df_chunk.to_csv(output_file, mode='a', header=False, index=False)
+                parsed = parse_log_line(line.strip())
+                if parsed:
+                    logs.append(parsed)
+                    line_count += 1
                     
-                    logs = []
-                    print(f"✅ Processed {line_count} lines...")
-    
-    # Save remaining logs
-    if logs:
-        df_chunk = pd.DataFrame(logs)
-        if not os.path.exists(output_file):
-            df_chunk.to_csv(output_file, index=False)
-        else:
-            df_chunk.to_csv(output_file, mode='a', header=False, index=False)
+                    # Save in chunks to avoid memory issues
+                    if len(logs) >= chunk_size:
+                        write_chunk(logs)
+                        logs = []
+                        print(f"✅ Processed {line_count} lines...")
+        
+            # Save remaining logs (and the header, if nothing was written yet)
+            if logs or header:
+                write_chunk(logs)
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
     
     print(f"✅ Parsing complete! Total lines: {line_count}")
     print(f"💾 Saved to: {output_file}")
@@ -112,7 +127,8 @@ def main():
     
     # Load and display summary
     print("\n📊 Data Summary:")
-    df = pd.read_csv(output_file)
+    with profiling.stage('read_summary'):
+        df = pd.read_csv(output_file)
     print(df.info())
     print("\n📈 Sample Data:")
     print(df.head())
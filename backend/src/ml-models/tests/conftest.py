@@ -0,0 +1,11 @@
+"""
+Test configuration
+Puts ml-models/ on sys.path so tests can use utils.module_loader like the scripts do
+"""
+
+import os
+import sys
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ML_ROOT not in sys.path:
+    sys.path.insert(0, ML_ROOT)
@@ -0,0 +1,22 @@
+"""
+Tests for evaluation/benchmark.py
+"""
+
+from utils.module_loader import load_module
+
+benchmark = load_module('evaluation/benchmark.py')
+
+
+def report(**medians):
+    return {'results': {name: {'median_s': median} for name, median in medians.items()}}
+
+
+def test_compare_results_with_zero_baseline(capsys):
+    rows = benchmark.compare_results(report(fast=0.0, slow=1.0, new=1.0), report(fast=0.001, slow=1.5))
+
+    fast, slow = rows
+    assert fast['ratio'] is None and not fast['regression'] and not fast['improvement']
+    assert slow['ratio'] == 1.5 and slow['regression']
+
+    benchmark.print_comparison(rows, 0.10)
+    assert 'n/a' in capsys.readouterr().out
@@ -0,0 +1,23 @@
+"""
+Tests for deployment/capacity_planner.py
+"""
+
+from utils.module_loader import load_module
+
+capacity_planner = load_module('deployment/capacity_planner.py')
+
+
+def test_replicas_follow_scale_factor():
+    planner = capacity_planner.CapacityPlanner(10, max_replicas=40)
+    consumer = planner.replicas
+
+    decisions = []
+    for now, demand in enumerate([300, 300, 300, 10, 10, 10, 10]):
+        decision = planner.plan(demand, now=now * 600.0)
+        consumer = round(consumer * decision['scale_factor'])
+        decisions.append(decision['replicas'])
+        assert consumer == decision['replicas']
+        assert capacity_planner.MIN_SCALE_FACTOR <= decision['scale_factor'] <= capacity_planner.MAX_SCALE_FACTOR
+
+    # 1 -> 43 needed (capped at 40) is reached in steps of at most 4x, and the way down halves at most
+    assert decisions == [4, 16, 40, 20, 10, 5, 3]
@@ -0,0 +1,24 @@
+"""
+Tests for deployment/distill.py
+"""
+
+import numpy as np
+
+from utils.module_loader import load_module
+
+distill = load_module('deployment/distill.py')
+
+
+def test_linear_student_predict_one_matches_predict_proba_on_non_finite_rows():
+    rng = np.random.default_rng(0)
+    student = distill.LinearStudent(
+        {'weights': rng.normal(size=(3, 2)), 'bias': np.zeros(2), 'classes': np.array(['low', 'high'])},
+        {'kind': 'linear', 'n_features': 3}
+    )
+    row = np.array([np.nan, 1.5, 0.25])
+
+    label, probabilities = student.predict_one(row)
+
+    assert np.all(np.isfinite(probabilities))
+    np.testing.assert_allclose(probabilities, student.predict_proba(row[None, :])[0])
+    assert label == student.predict(row[None, :])[0]
@@ -0,0 +1,65 @@
+"""
+Tests for deployment/feature_state.py
+"""
+
+import numpy as np
+import pytest
+
+from utils.module_loader import load_module
+
+feature_state = load_module('deployment/feature_state.py')
+
+FEATURE_COLS = ['request_count', 'request_count_lag_1', 'request_count_lag_2',
+                'request_count_rolling_mean', 'request_count_rolling_std', 'error_rate', 'hour']
+
+
+def window(minute, request_count, **extra):
+    return {'timestamp': f'2019-01-22T03:{minute:02d}:00', 'request_count': request_count, 'error_count': 1, **extra}
+
+
+def snapshot(state):
+    rings = {metric: (ring.values.copy(), ring.pos, ring.count, ring.total, ring.total_sq)
+             for metric, ring in state.rings.items()}
+    return state.count, state.last_timestamp, state.vector.copy(), rings
+
+
+def assert_same_state(before, after):
+    assert before[:2] == after[:2]
+    np.testing.assert_array_equal(before[2], after[2])
+    for metric, ring in before[3].items():
+        np.testing.assert_array_equal(ring[0], after[3][metric][0])
+        assert ring[1:] == after[3][metric][1:]
+
+
+def test_extend_rejects_batch_without_mutating_state():
+    state = feature_state.FeatureState(FEATURE_COLS, lookback=3)
+    state.extend([window(0, 10), window(1, 12)])
+    before = snapshot(state)
+
+    # Non-numeric metric after a gap-filling window: nothing may be applied
+    with pytest.raises(ValueError):
+        state.extend([window(5, 14), window(6, 'abc')])
+    assert_same_state(before, snapshot(state))
+
+    # Out-of-order timestamp later in the batch
+    with pytest.raises(ValueError):
+        state.extend([window(3, 14), window(2, 15)])
+    assert_same_state(before, snapshot(state))
+
+    with pytest.raises(ValueError):
+        state.ingest(window(4, 16, hour='noon'))
+    assert_same_state(before, snapshot(state))
+
+
+def test_extend_matches_one_window_at_a_time():
+    windows = [window(minute, 10 + minute * 3 % 7) for minute in (0, 1, 2, 4, 5, 6)]
+    batched = feature_state.FeatureState(FEATURE_COLS, lookback=3)
+    single = feature_state.FeatureState(FEATURE_COLS, lookback=3)
+
+    vector = batched.extend(windows)
+    for w in windows:
+        expected = single.ingest(w)
+
+    np.testing.assert_array_equal(vector, expected)
+    assert batched.count == single.count == 7
+    assert batched.ready
@@ -0,0 +1,49 @@
+"""
+Tests for deployment/model_registry.py
+"""
+
+import os
+
+import pytest
+
+from utils.module_loader import load_module
+
+model_registry = load_module('deployment/model_registry.py')
+
+
+def trained_dir(tmp_path):
+    source = tmp_path / 'trained'
+    (source / 'compiled').mkdir(parents=True)
+    (source / 'students' / 'tree-5').mkdir(parents=True)
+    (source / 'model.pkl').write_bytes(b'model')
+    (source / 'compiled' / 'nodes.npz').write_bytes(b'nodes')
+    (source / 'students' / 'tree-5' / 'student.json').write_text('{}')
+    return source
+
+
+def test_register_copies_compiled_and_student_exports(tmp_path):
+    registry = model_registry.ModelRegistry(str(tmp_path / 'registry'))
+    version = registry.register('random-forest', str(trained_dir(tmp_path)), promote=True)
+
+    path = registry.version_dir('random-forest', version)
+    assert os.path.isfile(os.path.join(path, 'compiled', 'nodes.npz'))
+    assert os.path.isfile(os.path.join(path, 'students', 'tree-5', 'student.json'))
+    assert registry.current('random-forest') == version
+
+
+@pytest.mark.parametrize('version', ['..', '../v0001', 'v0001/../../x', '/etc', '.staging-x', '', 'v 1'])
+def test_version_dir_rejects_unsafe_versions(tmp_path, version):
+    registry = model_registry.ModelRegistry(str(tmp_path / 'registry'))
+    registry.register('random-forest', str(trained_dir(tmp_path)))
+
+    with pytest.raises(model_registry.RegistryError, match='Invalid version'):
+        registry.version_dir('random-forest', version)
+    with pytest.raises(model_registry.RegistryError, match='Invalid version'):
+        registry.promote('random-forest', version)
+
+
+def test_model_names_are_checked(tmp_path):
+    registry = model_registry.ModelRegistry(str(tmp_path / 'registry'))
+
+    with pytest.raises(model_registry.RegistryError, match='Invalid model name'):
+        registry.rollback('../random-forest')
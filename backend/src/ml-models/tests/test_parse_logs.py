@@ -0,0 +1,31 @@
+"""
+Tests for preprocessing/parse_logs.py
+"""
+
+import pandas as pd
+
+from utils.module_loader import load_module
+
+parse_logs = load_module('preprocessing/parse_logs.py')
+
+LOG_LINES = [
+    '54.36.149.41 - - [22/Jan/2019:03:56:14 +0330] "GET /filter/27 HTTP/1.1" 200 30577 "-" "Mozilla/5.0"',
+    '31.56.96.51 - - [22/Jan/2019:03:56:16 +0330] "GET /image/60844/productModel/200x200 HTTP/1.1" 200 5667 "-" "Mozilla/5.0"',
+    '40.77.167.129 - - [22/Jan/2019:03:56:17 +0330] "POST /m/updateVariation HTTP/1.1" 302 0 "-" "bingbot/2.0"',
+    'not a log line',
+]
+
+
+def test_parse_access_log_rerun_replaces_output(tmp_path):
+    log_file = tmp_path / 'access.log'
+    log_file.write_text('\n'.join(LOG_LINES * 5) + '\n')
+    output_file = str(tmp_path / 'parsed_logs.csv')
+
+    first = parse_logs.parse_access_log(str(log_file), output_file, chunk_size=4)
+    rows_first = len(pd.read_csv(output_file))
+    second = parse_logs.parse_access_log(str(log_file), output_file, chunk_size=4)
+    rows_second = len(pd.read_csv(output_file))
+
+    assert first == second == 15
+    assert rows_first == rows_second == 15
+    assert not (tmp_path / 'parsed_logs.csv.tmp').exists()
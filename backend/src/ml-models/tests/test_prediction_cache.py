@@ -0,0 +1,36 @@
+"""
+Tests for deployment/prediction_cache.py
+"""
+
+import math
+
+import pytest
+
+from utils.module_loader import load_module
+
+prediction_cache = load_module('deployment/prediction_cache.py')
+
+FEATURE_COLS = ['request_count', 'error_rate', 'avg_response_time']
+
+
+@pytest.mark.parametrize('value', [math.nan, math.inf, -math.inf, float('nan'), 'NaN'])
+def test_make_key_leaves_non_finite_values_unquantized(value):
+    cache = prediction_cache.PredictionCache(default_step=0.5)
+    payload = {'request_count': 10.2, 'error_rate': value, 'avg_response_time': 3.9}
+
+    key = cache.make_key('random-forest', 1, payload, FEATURE_COLS)
+    again = cache.make_key('random-forest', 1, dict(payload, error_rate=float(value)), FEATURE_COLS)
+
+    assert key[2] == 20 and key[4] == 7
+    assert key == again
+    cache.put(key, {'route': 'server-1'})
+    assert cache.get(again) == {'route': 'server-1'}
+
+
+def test_make_sequence_key_with_non_finite_values():
+    cache = prediction_cache.PredictionCache(default_step=1.0)
+
+    key = cache.make_sequence_key('lstm', 1, [1.5, math.nan, math.inf])
+
+    assert key[2] == 1 and math.isnan(key[3]) and key[4] == math.inf
+    assert key == cache.make_sequence_key('lstm', 1, [1.2, float('nan'), math.inf])
@@ -0,0 +1,41 @@
+"""
+Tests for utils/profiling.py
+"""
+
+import pytest
+
+from utils import profiling
+
+
+@pytest.fixture
+def profiled(tmp_path, monkeypatch):
+    monkeypatch.setenv(profiling.PROFILE_ENV, str(tmp_path / 'profile.json'))
+    monkeypatch.setenv(profiling.AUTOSAVE_ENV, '0')
+    monkeypatch.delenv(profiling.ALLOCATIONS_ENV, raising=False)
+    profiling.pop_records()
+    yield monkeypatch
+    profiling.pop_records()
+
+
+def run_stages():
+    with profiling.stage('outer'):
+        with profiling.stage('inner'):
+            blocks = [bytearray(1 << 20) for _ in range(4)]
+    del blocks
+    return {record['stage']: record for record in profiling.pop_records()}
+
+
+def test_only_outermost_stage_takes_snapshots(profiled):
+    records = run_stages()
+
+    assert 'top_allocations' in records['outer']
+    assert 'top_allocations' not in records['outer/inner']
+    assert records['outer/inner']['traced_delta_mb'] >= 3.5
+    assert records['outer/inner']['traced_peak_delta_mb'] >= records['outer/inner']['traced_delta_mb']
+
+
+def test_nested_snapshots_are_opt_in(profiled):
+    profiled.setenv(profiling.ALLOCATIONS_ENV, '1')
+    records = run_stages()
+
+    assert 'top_allocations' in records['outer/inner']
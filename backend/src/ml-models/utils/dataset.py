@@ -0,0 +1,49 @@
+"""
+Shared Dataset
+Loads a feature file once per process; pipeline workers forked afterwards inherit the loaded frame
+"""
+
+import os
+
+# ml-models/ root directory
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURES_FILE = os.path.join(ML_ROOT, 'data', 'features', 'features.parquet')
+
+# realpath -> (mtime, DataFrame)
+_frames = {}
+
+def preload(features_file=FEATURES_FILE):
+    """
+    Read a feature file and keep it for later read_features() calls
+
+    Args:
+        features_file: .parquet or .csv path
+
+    Returns:
+        The loaded DataFrame
+    """
+    import pandas as pd
+
+    key = os.path.realpath(features_file)
+    if features_file.endswith('.parquet'):
+        df = pd.read_parquet(features_file)
+    else:
+        df = pd.read_csv(features_file)
+    _frames[key] = (os.path.getmtime(key), df)
+    return df
+
+def read_features(features_file=FEATURES_FILE):
+    """
+    Load a feature file, reusing a preloaded copy if the file has not changed since
+
+    Args:
+        features_file: .parquet or .csv path (relative paths resolve against the cwd)
+
+    Returns:
+        DataFrame (a copy, so callers may modify it)
+    """
+    key = os.path.realpath(features_file)
+    cached = _frames.get(key)
+    if cached is None or cached[0] != os.path.getmtime(key):
+        return preload(features_file).copy()
+    return cached[1].copy()
@@ -0,0 +1,76 @@
+"""
+Incremental Training State
+Records which feature windows a model has seen, so a retrain can fit only the newer ones
+"""
+
+import json
+import os
+from datetime import datetime
+
+# Written next to model.pkl by the RF/XGBoost trainers
+STATE_FILE = 'training_state.json'
+
+def load_level_bins(request_counts, num_servers=3):
+    """
+    Quantile edges of request_count used to label load levels
+
+    Incremental runs reuse the edges from the full training, so labels on new
+    windows mean the same thing as the labels the existing trees learned.
+    """
+    import pandas as pd
+
+    _, bins = pd.qcut(request_counts, q=num_servers, retbins=True, duplicates='drop')
+    return [float(edge) for edge in bins]
+
+def load_state(model_dir='.'):
+    """Training state of a model folder (None before the first training with state)"""
+    path = os.path.join(model_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(trained_until, rows, bins, model_dir='.', **extra):
+    """
+    Record what the saved model was trained on
+
+    Args:
+        trained_until: Timestamp of the newest window used for training
+        rows: Number of windows the model has been trained on so far
+        bins: load_level_bins() edges used for the labels
+        extra: Additional fields (e.g. incremental run details)
+    """
+    state = {
+        'trained_until': str(trained_until),
+        'rows': int(rows),
+        'load_level_bins': list(bins),
+        'updated': datetime.now().isoformat(timespec='seconds'),
+        **extra
+    }
+    with open(os.path.join(model_dir, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+    return state
+
+def split_new_windows(df, state, holdout=0.2):
+    """
+    Split features into history, new windows to train on and a recent holdout
+
+    The holdout is the newest share of the new windows (time order), so it is
+    never trained on in this run; it stays "new" for the next incremental run.
+
+    Args:
+        df: Features DataFrame with a timestamp column
+        state: load_state() result
+        holdout: Share of the new windows held out
+
+    Returns:
+        history, new, holdout DataFrames
+    """
+    import pandas as pd
+
+    df = df.sort_values('timestamp').reset_index(drop=True)
+    is_new = df['timestamp'] > pd.Timestamp(state['trained_until'])
+    new = df[is_new]
+    n_holdout = int(round(len(new) * holdout))
+    split = len(new) - n_holdout
+    return df[~is_new], new.iloc[:split], new.iloc[split:]
@@ -0,0 +1,46 @@
+"""
+Value Interning and Classification Cache
+Categorical log fields, and classifiers that run once per distinct value
+"""
+
+import re
+from functools import lru_cache
+
+# Log fields with few distinct values (a few thousand user agents, a handful of methods), loaded as categoricals
+CATEGORICAL_FIELDS = ('method', 'endpoint', 'protocol', 'referrer', 'user_agent')
+CLASSIFY_CACHE_SIZE = 65_536
+
+BOT_PATTERN = re.compile(r'bot|crawler|spider', re.IGNORECASE)
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def is_bot_agent(user_agent):
+    """Whether a user agent looks like a bot, crawler or spider (non-strings are not bots)"""
+    return isinstance(user_agent, str) and BOT_PATTERN.search(user_agent) is not None
+
+def classify_unique(values, classify, default=False, dtype=bool):
+    """
+    Run a classifier once per distinct value and map the results back by code
+
+    Categorical columns (e.g. read with dtype='category') reuse their codes; other
+    columns are factorized first. Classifiers wrapped in lru_cache also skip work
+    across calls, e.g. for each chunk of an incremental run.
+
+    Args:
+        values: pandas Series
+        classify: Function of one distinct value
+        default: Result for missing values
+        dtype: Result dtype
+
+    Returns:
+        NumPy array of results aligned with values
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    # Missing values have code -1, which picks the trailing default
+    table = np.array([classify(value) for value in uniques] + [default], dtype=dtype)
+    return table[codes]
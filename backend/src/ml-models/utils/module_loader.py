@@ -0,0 +1,44 @@
+"""
+Module Loader
+Imports ML scripts by file path (folders like 3_random_forest are not valid package names)
+"""
+
+import importlib.util
+import os
+import sys
+
+# ml-models/ root directory
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_module(relative_path, name=None):
+    """
+    Load a script from the ml-models tree as a module
+    
+    Args:
+        relative_path: Path relative to ml-models/ (e.g. 'models/3_random_forest/predict.py')
+        name: Module name (default derived from the path, so train.py files don't collide)
+    
+    Returns:
+        Loaded module (cached in sys.modules)
+    """
+    if name is None:
+        stem = os.path.splitext(relative_path)[0]
+        name = 'ml_' + stem.replace('/', '_').replace('\\', '_').replace('-', '_')
+    
+    if name in sys.modules:
+        return sys.modules[name]
+    
+    path = os.path.join(ML_ROOT, relative_path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None:
+        raise ImportError(f"Cannot load module from: {path}")
+    
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[name]
+        raise
+    
+    return module
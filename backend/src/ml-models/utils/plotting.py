@@ -0,0 +1,44 @@
+"""
+Plotting Helpers
+Lazy matplotlib/seaborn imports and a headless switch for unattended runs
+"""
+
+import os
+
+# ML_NO_PLOTS=1 skips every chart; ML_PLOT_DPI overrides the resolution of saved charts
+NO_PLOTS_ENV = 'ML_NO_PLOTS'
+PLOT_DPI_ENV = 'ML_PLOT_DPI'
+DEFAULT_DPI = 300
+
+def plots_enabled():
+    """Whether charts should be rendered (False in headless runs)"""
+    return os.environ.get(NO_PLOTS_ENV, '').lower() not in ('1', 'true', 'yes')
+
+def set_headless(headless=True, dpi=None):
+    """
+    Switch chart rendering for this process and its child processes
+
+    Args:
+        headless: Skip all charts
+        dpi: Resolution for saved charts (None = keep current setting)
+    """
+    os.environ[NO_PLOTS_ENV] = '1' if headless else '0'
+    if dpi is not None:
+        os.environ[PLOT_DPI_ENV] = str(dpi)
+
+def get_pyplot():
+    """Import matplotlib.pyplot on first use (non-interactive backend: charts are only saved)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def get_seaborn():
+    """Import seaborn on first use"""
+    import seaborn as sns
+    return sns
+
+def save_figure(plt, path):
+    """Save and close the current figure"""
+    plt.savefig(path, dpi=int(os.environ.get(PLOT_DPI_ENV, DEFAULT_DPI)), bbox_inches='tight')
+    plt.close()
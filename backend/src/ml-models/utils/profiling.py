@@ -0,0 +1,307 @@
+"""
+Stage Profiler
+Opt-in wall/CPU time, RSS, tracemalloc and cProfile measurements per pipeline stage, saved as JSON
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# ML_PROFILE=<report.json> turns profiling on; ML_PROFILE_CPROFILE=<dir> also dumps cProfile stats
+PROFILE_ENV = 'ML_PROFILE'
+CPROFILE_ENV = 'ML_PROFILE_CPROFILE'
+# ML_PROFILE_ALLOCATIONS=1 takes tracemalloc snapshots in nested stages too (slow on a large heap)
+ALLOCATIONS_ENV = 'ML_PROFILE_ALLOCATIONS'
+# Set to 0 by the pipeline, which collects the records from its stages and writes one report itself
+AUTOSAVE_ENV = 'ML_PROFILE_AUTOSAVE'
+
+TOP_ALLOCATIONS = 10
+TOP_FUNCTIONS = 15
+
+ML_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_records = {}
+_stack = []
+_state = {'autosave_registered': False, 'cprofile_active': False}
+
+def enabled():
+    """Whether stage() records anything in this process"""
+    return bool(os.environ.get(PROFILE_ENV))
+
+def enable(report_file, cprofile_dir=None, autosave=True, allocations=False):
+    """
+    Turn profiling on for this process and its child processes
+
+    Args:
+        report_file: JSON report path
+        cprofile_dir: Directory for per-stage .prof dumps (None = no cProfile)
+        autosave: Write report_file when this process exits
+        allocations: Top allocations for nested stages too, not just outermost ones
+    """
+    os.environ[PROFILE_ENV] = os.path.abspath(report_file)
+    if cprofile_dir:
+        os.environ[CPROFILE_ENV] = os.path.abspath(cprofile_dir)
+    if allocations:
+        os.environ[ALLOCATIONS_ENV] = '1'
+    os.environ[AUTOSAVE_ENV] = '1' if autosave else '0'
+
+def _rss_mb():
+    """Current resident set size (MB), or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far (MB), or None without the resource module"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+def _short_path(filename):
+    """Source path relative to ml-models/ or site-packages/ (as is for other files)"""
+    if filename.startswith(ML_ROOT + os.sep):
+        return os.path.relpath(filename, ML_ROOT)
+    marker = f"site-packages{os.sep}"
+    return filename.split(marker, 1)[1] if marker in filename else filename
+
+def _top_allocations(start, end, limit=TOP_ALLOCATIONS):
+    """Source lines that grew the most between two tracemalloc snapshots"""
+    stats = end.compare_to(start, 'lineno')
+    # Leave out the snapshots' own bookkeeping (cheaper than filter_traces on both snapshots)
+    stats = [stat for stat in stats if stat.size_diff > 0 and stat.traceback[0].filename != tracemalloc.__file__]
+    return [
+        {
+            'where': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            'size_mb': stat.size_diff / 2**20,
+            'count': stat.count_diff
+        }
+        for stat in stats[:limit]
+    ]
+
+def _top_functions(profiler, path, limit=TOP_FUNCTIONS):
+    """Dump cProfile stats to path; returns the functions with the most cumulative time"""
+    import pstats
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profiler.dump_stats(path)
+    stats = pstats.Stats(path)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            'function': f"{_short_path(filename)}:{line}({name})",
+            'calls': calls,
+            'total_s': total_s,
+            'cumulative_s': cumulative_s
+        }
+        for (filename, line, name), (_, calls, total_s, cumulative_s, _) in rows
+    ]
+
+def _merge(path, record):
+    """Add a finished stage; repeated stages (e.g. per chunk) are summed under one path"""
+    existing = _records[path]
+    if existing is None:
+        _records[path] = record
+        return
+    existing['calls'] += 1
+    for key in ('wall_s', 'cpu_s', 'overhead_s', 'traced_delta_mb'):
+        existing[key] += record[key]
+    for key in ('peak_rss_mb', 'rss_end_mb', 'traced_peak_mb', 'traced_peak_delta_mb'):
+        if record.get(key) is not None:
+            existing[key] = max(existing.get(key) or 0, record[key])
+    if record.get('top_allocations') and record['traced_peak_mb'] >= existing['traced_peak_mb']:
+        existing['top_allocations'] = record['top_allocations']
+
+@contextlib.contextmanager
+def stage(name, allocations=True):
+    """
+    Measure a block of work when profiling is on (a no-op otherwise)
+
+    Stages nest: a stage inside 'random-forest' is recorded as 'random-forest/<name>'.
+    Records wall and CPU time, RSS at the end, the process's peak RSS, and the stage's
+    tracemalloc peak and growth (from get_traced_memory, cheap at any depth). The
+    source lines that allocated the most need two tracemalloc snapshots, which take
+    seconds on a large heap, so only outermost stages take them unless
+    ML_PROFILE_ALLOCATIONS is set. With ML_PROFILE_CPROFILE set, outermost stages are
+    also run under cProfile. Profiling bookkeeping is reported as overhead_s and
+    left out of the enclosing stages' wall and CPU time.
+
+    Args:
+        name: Stage name
+        allocations: Allow tracemalloc snapshots for top allocations (skip in tight loops)
+    """
+    if not enabled():
+        yield
+        return
+
+    overhead_start, overhead_cpu = time.perf_counter(), time.process_time()
+    if not _state['autosave_registered'] and os.environ.get(AUTOSAVE_ENV, '1') != '0':
+        atexit.register(lambda: write_report(os.environ[PROFILE_ENV]))
+        _state['autosave_registered'] = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    allocations = allocations and (not _stack or bool(os.environ.get(ALLOCATIONS_ENV)))
+    path = '/'.join([frame['path'] for frame in _stack[-1:]] + [name])
+    frame = {'path': path, 'child_peak': 0, 'child_overhead': 0.0, 'child_overhead_cpu': 0.0}
+    _stack.append(frame)
+    # Reserve the slot so the report lists stages in start order (parents before children)
+    _records.setdefault(path, None)
+
+    snapshot = tracemalloc.take_snapshot() if allocations else None
+    traced_start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+
+    profiler = None
+    cprofile_dir = os.environ.get(CPROFILE_ENV)
+    if cprofile_dir and not _state['cprofile_active']:
+        import cProfile
+        profiler = cProfile.Profile()
+        _state['cprofile_active'] = True
+        profiler.enable()
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    setup_s, setup_cpu = wall_start - overhead_start, cpu_start - overhead_cpu
+    try:
+        yield
+    finally:
+        wall_end, cpu_end = time.perf_counter(), time.process_time()
+        wall_s = wall_end - wall_start - frame['child_overhead']
+        cpu_s = cpu_end - cpu_start - frame['child_overhead_cpu']
+        if profiler is not None:
+            profiler.disable()
+            _state['cprofile_active'] = False
+
+        _stack.pop()
+        traced_end, traced_peak = tracemalloc.get_traced_memory()
+        # Children reset the peak; fold their peaks back in
+        traced_peak = max(traced_peak, frame['child_peak'])
+
+        record = {
+            'stage': path,
+            'calls': 1,
+            'wall_s': wall_s,
+            'cpu_s': cpu_s,
+            'rss_end_mb': _rss_mb(),
+            'peak_rss_mb': _peak_rss_mb(),
+            'traced_start_mb': traced_start / 2**20,
+            'traced_end_mb': traced_end / 2**20,
+            'traced_peak_mb': traced_peak / 2**20,
+            'traced_delta_mb': (traced_end - traced_start) / 2**20,
+            'traced_peak_delta_mb': (traced_peak - traced_start) / 2**20
+        }
+        if snapshot is not None:
+            record['top_allocations'] = _top_allocations(snapshot, tracemalloc.take_snapshot())
+        if profiler is not None:
+            dump = os.path.join(cprofile_dir, f"{path.replace('/', '.')}.prof")
+            record['cprofile'] = dump
+            record['top_functions'] = _top_functions(profiler, dump)
+
+        overhead_s = setup_s + time.perf_counter() - wall_end
+        record['overhead_s'] = overhead_s
+        if _stack:
+            parent = _stack[-1]
+            parent['child_peak'] = max(parent['child_peak'], traced_peak)
+            parent['child_overhead'] += frame['child_overhead'] + overhead_s
+            parent['child_overhead_cpu'] += frame['child_overhead_cpu'] + setup_cpu + time.process_time() - cpu_end
+        _merge(path, record)
+
+def pop_records():
+    """Stage records collected in this process so far (and forget them)"""
+    records = [record for record in _records.values() if record is not None]
+    _records.clear()
+    return records
+
+def build_report(records):
+    """Report dict for a list of stage records"""
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'argv': sys.argv,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'stages': records
+    }
+
+def write_report(report_file, records=None):
+    """
+    Save stage records as JSON
+
+    Args:
+        report_file: Output path
+        records: Records to save (default: this process's records)
+    """
+    records = pop_records() if records is None else records
+    if not records:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(report_file)), exist_ok=True)
+    with open(report_file, 'w') as f:
+        json.dump(build_report(records), f, indent=2)
+    print(f"💾 Saved profile to: {report_file}")
+    return report_file
+
+def _load(report_file):
+    with open(report_file, 'r') as f:
+        return {record['stage']: record for record in json.load(f)['stages']}
+
+def _mb(value):
+    return f"{value:.1f}" if value is not None else '-'
+
+def print_report(report_file):
+    """Per-stage table for one report"""
+    stages = _load(report_file)
+    print(f"{'stage':<44}{'calls':>6}{'wall s':>9}{'cpu s':>9}{'rss MB':>9}{'traced MB':>11}{'Δ traced':>10}")
+    for path, record in stages.items():
+        print(f"{path:<44}{record['calls']:>6}{record['wall_s']:>9.2f}{record['cpu_s']:>9.2f}"
+              f"{_mb(record.get('rss_end_mb')):>9}{record['traced_peak_mb']:>11.1f}"
+              f"{_mb(record.get('traced_delta_mb')):>10}")
+        for allocation in record.get('top_allocations', [])[:3]:
+            print(f"{'':<6}+{allocation['size_mb']:.1f} MB  {allocation['where']}")
+
+def compare_reports(baseline_file, report_file):
+    """Per-stage wall/CPU/memory change between two reports"""
+    baseline, current = _load(baseline_file), _load(report_file)
+    print(f"{'stage':<44}{'wall s':>9}{'Δ wall':>9}{'cpu s':>9}{'Δ cpu':>9}{'traced MB':>11}{'Δ MB':>8}")
+    for path in list(current) + [path for path in baseline if path not in current]:
+        new, old = current.get(path), baseline.get(path)
+        if new is None:
+            print(f"{path:<44}{'(removed)':>9}")
+            continue
+        if old is None:
+            print(f"{path:<44}{new['wall_s']:>9.2f}{'(new)':>9}{new['cpu_s']:>9.2f}{'':>9}"
+                  f"{new['traced_peak_mb']:>11.1f}")
+            continue
+        wall = (new['wall_s'] - old['wall_s']) / old['wall_s'] if old['wall_s'] else 0.0
+        cpu = (new['cpu_s'] - old['cpu_s']) / old['cpu_s'] if old['cpu_s'] else 0.0
+        print(f"{path:<44}{new['wall_s']:>9.2f}{wall:>+9.0%}{new['cpu_s']:>9.2f}{cpu:>+9.0%}"
+              f"{new['traced_peak_mb']:>11.1f}{new['traced_peak_mb'] - old['traced_peak_mb']:>+8.1f}")
+
+def main():
+    """Show or compare profile reports"""
+    parser = argparse.ArgumentParser(description='Inspect stage profiles written with ML_PROFILE / pipeline.py --profile')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    show_parser = subparsers.add_parser('show', help='Per-stage table for one report')
+    show_parser.add_argument('report')
+    compare_parser = subparsers.add_parser('compare', help='Changes from a baseline report')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('report')
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        print_report(args.report)
+    else:
+        compare_reports(args.baseline, args.report)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
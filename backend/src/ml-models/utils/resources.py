@@ -0,0 +1,39 @@
+"""
+CPU Budgets
+Caps the threads/processes a trainer uses so several trainers can share the machine
+"""
+
+import os
+
+# Worker count for n_jobs-style parameters (-1 = all cores, the default when unset)
+N_JOBS_ENV = 'ML_N_JOBS'
+
+# Read by OpenMP/BLAS and TensorFlow when they start
+THREAD_ENVS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+
+def get_n_jobs():
+    """n_jobs for scikit-learn / XGBoost estimators (ML_N_JOBS, default -1)"""
+    return int(os.environ.get(N_JOBS_ENV, -1))
+
+def apply_cpu_budget(cpus):
+    """
+    Limit this process (and its children) to a number of CPUs
+
+    Sets ML_N_JOBS for estimators created afterwards, the thread-count variables
+    read by OpenMP/BLAS/TensorFlow on import, and resizes BLAS/OpenMP pools that are
+    already running (e.g. inherited from a forked parent).
+
+    Args:
+        cpus: CPU budget (>= 1)
+    """
+    cpus = max(1, int(cpus))
+    os.environ[N_JOBS_ENV] = str(cpus)
+    for name in THREAD_ENVS:
+        os.environ[name] = str(cpus)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(cpus)